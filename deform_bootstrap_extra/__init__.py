@@ -12,40 +12,84 @@ def includeme(config):
     setup_for_pyramid(config)
 
 
+def _message_key(msg):
+    '''Equal TranslationStrings may differ in domain and mapping.'''
+    mapping = getattr(msg, 'mapping', None)
+    if mapping:
+        try:
+            mapping = tuple(sorted(mapping.items()))
+            hash(mapping)
+        except TypeError:  # unhashable values
+            mapping = id(msg)
+    return (msg, getattr(msg, 'domain', None), mapping)
+
+
+def _same_message(a, b):
+    return a == b and getattr(a, 'domain', None) == \
+        getattr(b, 'domain', None) and \
+        getattr(a, 'mapping', None) == getattr(b, 'mapping', None)
+
+
+def asdict2(self, translate=None, separator='; '):
+    """Also returns a dictionary containing a basic
+    (non-language-translated) error report for this exception.
+
+    ``asdict`` returns a dictionary containing fewer items -- the keys
+    refer only to the leaves. This method returns a dictionary with
+    more items: one key for each node that has an error,
+    regardless of whether the node is a leaf or an ancestor.
+    This way you can place error messages on more places of a form.
+
+    In my application I want to display messages on parents
+    as well as leaves... I am not using Deform in this case...
+
+    The tree is walked only once. Messages keep their order (depth first)
+    and repeated messages for the same key are dropped. If ``translate``
+    is supplied, it is called once for each distinct message.
+    """
+    groups = {}  # key -> list of messages
+    order = []  # keys in the order they were found
+    stack = [(self, '')]
+    while stack:
+        exc, prefix = stack.pop()
+        keyname = exc._keyname()
+        if keyname:
+            key = prefix + '.' + keyname if prefix else keyname
+        else:
+            key = prefix
+        if exc.msg is not None:
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = []
+                order.append(key)
+            for msg in exc.messages():
+                for other in group:  # usually zero or one message
+                    if _same_message(msg, other):
+                        break
+                else:
+                    group.append(msg)
+        if exc.children:
+            stack.extend((child, key) for child in reversed(exc.children))
+
+    translated = {}
+    adict = {}
+    for key in order:
+        msgs = groups[key]
+        if translate:
+            keys = [_message_key(msg) for msg in msgs]
+            for mkey, msg in zip(keys, msgs):
+                if mkey not in translated:
+                    translated[mkey] = translate(msg)
+            msgs = [translated[mkey] for mkey in keys]
+        if len(msgs) == 1:
+            adict[key] = msgs[0]
+        elif msgs:
+            adict[key] = separator.join(msgs)
+    return adict
+
+
 def monkeypatch_colander():
     '''Alter Colander to introduce the more useful asdict2() method.'''
     print('Adding asdict2() to Colander.')
     import colander as c
-
-    def asdict2(self):
-        """Also returns a dictionary containing a basic
-        (non-language-translated) error report for this exception.
-
-        ``asdict`` returns a dictionary containing fewer items -- the keys
-        refer only to the leaves. This method returns a dictionary with
-        more items: one key for each node that has an error,
-        regardless of whether the node is a leaf or an ancestor.
-        This way you can place error messages on more places of a form.
-
-        In my application I want to display messages on parents
-        as well as leaves... I am not using Deform in this case...
-        """
-        paths = self.paths()
-        errors = []
-        for path in paths:  # Each path is a tuple of Invalid instances.
-            keyparts = []
-            for exc in path:
-                keyname = exc._keyname()
-                if keyname:
-                    keyparts.append(keyname)
-                for msg in exc.messages():
-                    errors.append(('.'.join(keyparts), msg))
-        errors = set(errors)  # Filter out repeats
-        adict = {}
-        for key, msg in errors:
-            if key in adict:
-                adict[key] = adict[key] + '; ' + msg
-            else:
-                adict[key] = msg
-        return adict
     c.Invalid.asdict2 = asdict2
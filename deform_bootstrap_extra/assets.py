@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+'''Concatenate the static files of deform_bootstrap_extra into bundles.
+
+    Each bundle gets a name containing the hash of its content, e.g.
+    ``deform_bootstrap_extra-3f2a9c1d04b5e6f7.js``, so it can be cached by
+    browsers forever: when the content changes, so does the URL.
+
+    The files are minified if rjsmin and rcssmin are installed. To build
+    the bundles at build time instead of at startup, run::
+
+        python -m deform_bootstrap_extra.assets some/output/directory
+
+    and point the ``deform_bootstrap_extra.bundle_dir`` setting to that
+    directory (see ``setup_for_pyramid()``).
+    '''
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+from hashlib import sha1
+from importlib import import_module
+import io
+import json
+import os
+import sys
+try:
+    from rjsmin import jsmin
+except ImportError:
+    jsmin = None
+try:
+    from rcssmin import cssmin
+except ImportError:
+    cssmin = None
+
+JS_FILES = (
+    'deform_bootstrap_extra:static/jQuery-Tags-Input/jquery.tagsinput.js',
+    'deform_bootstrap_extra:static/xaja.js',
+)
+# These must not contain relative url()s, since the bundle lives elsewhere:
+CSS_FILES = (
+    'deform_bootstrap_extra:static/jQuery-Tags-Input/jquery.tagsinput.css',
+    'deform_bootstrap_extra:static/deform_bootstrap_extra.css',
+)
+MANIFEST = 'bundles.json'
+
+
+def abspath(spec):
+    '''Return the absolute path of a file given as ``package:path``
+    (or as a plain path).
+    '''
+    if ':' in spec and not os.path.isabs(spec):
+        package, path = spec.split(':', 1)
+        return os.path.join(
+            os.path.dirname(import_module(package).__file__), path)
+    return spec
+
+
+def build_bundle(files, extension, out_dir, minify=True,
+                 name='deform_bootstrap_extra'):
+    '''Concatenate *files* (asset specs or paths) into a file in *out_dir*
+    named after their hash, and return that file name. *extension* is
+    ``'js'`` or ``'css'``.
+    '''
+    texts = []
+    for spec in files:
+        with io.open(abspath(spec), encoding='utf-8') as f:
+            texts.append(f.read())
+    if extension == 'js':
+        content = '\n;\n'.join(texts)  # in case a file lacks a semicolon
+        minifier = jsmin
+    else:
+        content = '\n'.join(texts)
+        minifier = cssmin
+    if minify and minifier is not None:
+        content = minifier(content)
+    data = content.encode('utf-8')
+    filename = '{}-{}.{}'.format(name, sha1(data).hexdigest()[:16],
+                                 extension)
+    path = os.path.join(out_dir, filename)
+    if not os.path.exists(path):
+        tmp = path + '.tmp{}'.format(os.getpid())
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.rename(tmp, path)  # atomic, for concurrent processes
+    return filename
+
+
+def build_bundles(out_dir, minify=True, js_files=JS_FILES,
+                  css_files=CSS_FILES):
+    '''Build the JS and CSS bundles in *out_dir*, record their names in
+    a ``bundles.json`` manifest there and return them as a dict with
+    the keys ``js`` and ``css``.
+    '''
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    bundles = dict(js=build_bundle(js_files, 'js', out_dir, minify),
+                   css=build_bundle(css_files, 'css', out_dir, minify))
+    with open(os.path.join(out_dir, MANIFEST), 'w') as f:
+        json.dump(bundles, f)
+    return bundles
+
+
+def load_manifest(out_dir):
+    '''Return the bundles recorded in *out_dir*, or None.'''
+    try:
+        with open(os.path.join(out_dir, MANIFEST)) as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+if __name__ == '__main__':
+    print(build_bundles(sys.argv[1]))
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+'''In-memory prefix index for autocompletion, e.g. of the TagsWidget.
+
+    See :func:`deform_bootstrap_extra.pyramid.autocomplete.autocomplete_view`
+    for a Pyramid view that uses it.
+    '''
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+from bisect import bisect_left
+import threading
+from time import time
+
+
+def column_source(db, column):
+    '''Return a callable that loads the distinct non-null values of the
+    SQLAlchemy *column* (e.g. ``Tag.name``), to be the *source* of a
+    PrefixIndex. *db* is a session or a scoped session.
+    '''
+    def load():
+        return (row[0] for row in
+                db.query(column).filter(column.isnot(None)).distinct())
+    return load
+
+
+class PrefixIndex(object):
+    '''A sorted list of terms that answers prefix queries by bisection.
+
+    *source* is an iterable of terms, or a callable that returns one -- in
+    which case the index is rebuilt from it by ``refresh()``, and also
+    automatically every *max_age* seconds, if given. Call ``add()`` or
+    ``discard()`` to keep the index current between refreshes.
+
+    Unless *case_sensitive*, terms are matched case-insensitively and
+    returned as they were first given.
+
+    ``version`` changes whenever the index does, so it can be part of
+    an ETag. Searches never take the lock: every change replaces the list
+    of entries, instead of changing it in place.
+    '''
+    def __init__(self, source=(), case_sensitive=False, max_age=None):
+        self.source = source
+        self.case_sensitive = case_sensitive
+        self.max_age = max_age
+        self.version = 0
+        self._entries = []  # sorted (folded term, term) pairs
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self.refresh()
+
+    def fold(self, term):
+        if self.case_sensitive:
+            return term
+        return term.casefold() if hasattr(term, 'casefold') else term.lower()
+
+    def refresh(self):
+        '''Rebuild the index from the source.'''
+        terms = self.source() if callable(self.source) else self.source
+        unique = {}
+        for term in terms:
+            unique.setdefault(self.fold(term), term)
+        with self._lock:
+            self._entries = sorted(unique.items())  # replaced atomically
+            self.version += 1
+            self.refreshed = time()
+
+    def add(self, *terms):
+        with self._lock:
+            entries = list(self._entries)
+            for term in terms:
+                entry = (self.fold(term), term)
+                i = bisect_left(entries, (entry[0],))
+                if i == len(entries) or entries[i][0] != entry[0]:
+                    entries.insert(i, entry)
+            if len(entries) != len(self._entries):
+                self._entries = entries
+                self.version += 1
+
+    def discard(self, *terms):
+        with self._lock:
+            entries = list(self._entries)
+            for term in terms:
+                folded = self.fold(term)
+                i = bisect_left(entries, (folded,))
+                if i < len(entries) and entries[i][0] == folded:
+                    del entries[i]
+            if len(entries) != len(self._entries):
+                self._entries = entries
+                self.version += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _check_age(self):
+        '''Refresh the index if it is too old. Only one thread refreshes;
+        the others go on searching the old entries meanwhile.
+        '''
+        if self.max_age is None or not callable(self.source) or \
+                time() - self.refreshed <= self.max_age:
+            return
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        try:
+            self.refresh()
+        finally:
+            self._refreshing = False
+
+    def search(self, prefix, limit=10):
+        '''Return up to *limit* terms that start with *prefix*, in order.'''
+        self._check_age()
+        folded = self.fold(prefix)
+        entries = self._entries
+        results = []
+        i = bisect_left(entries, (folded,))
+        while i < len(entries) and len(results) < limit:
+            key, term = entries[i]
+            if not key.startswith(folded):
+                break
+            results.append(term)
+            i += 1
+        return results
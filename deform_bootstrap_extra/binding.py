@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+'''Copy-on-write binding of colander schemas.
+
+    ``schema.bind(**kw)`` clones the whole node tree -- and instantiating a
+    declarative schema class clones all of its nodes too -- although in a
+    typical form only a couple of nodes (e.g. the CSRF token) have deferred
+    attributes. A :class:`BindPlan` finds those nodes once; then each
+    ``plan.bind(**kw)`` copies only them and their ancestors, resolving
+    their deferreds as colander would, and shares every other node with
+    the template schema::
+
+        from deform_bootstrap_extra.binding import get_plan
+
+        schema = get_plan(MySchema).bind(request=request)
+
+    The shared nodes must be treated as immutable: change a node of a
+    bound schema only if that node was copied (``plan.is_copied(node)``),
+    otherwise the change leaks into every other bound schema.
+    Shared nodes also lack the ``bindings`` attribute (it is None), so
+    validators that read ``node.bindings`` should be deferred instead.
+    '''
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+import colander as c
+
+_plans = {}
+
+
+class BindPlan(object):
+    '''Knows which nodes of the *template* schema need to be copied when
+    binding it: those with deferred attributes or an ``after_bind``
+    callback, and their ancestors. The root is always copied.
+    '''
+    def __init__(self, template):
+        self.template = template
+        self._deferred = {}  # id of node -> names of deferred attributes
+        self._copied = set()  # ids of the nodes to be copied
+        self._shared = set()  # ids of the nodes shared by all bound schemas
+        self._scan(template)
+        self._copied.add(id(template))
+        self._shared.discard(id(template))
+
+    def _scan(self, node):
+        names = [k for k in dir(node)
+                 if isinstance(getattr(node, k, None), c.deferred)]
+        copy = bool(names) or bool(getattr(node, 'after_bind', None))
+        for child in node.children:
+            copy = self._scan(child) or copy
+        if names:
+            self._deferred[id(node)] = names
+        (self._copied if copy else self._shared).add(id(node))
+        return copy
+
+    def __len__(self):
+        '''The number of nodes copied by each bind.'''
+        return len(self._copied)
+
+    def is_copied(self, node):
+        '''Whether *node* (of a bound schema) is private to that schema.'''
+        return id(node) not in self._shared
+
+    def bind(self, **kw):
+        '''Return a bound copy of the template, like ``template.bind(**kw)``.
+        '''
+        return self._bind(self.template, kw)
+
+    def _bind(self, node, kw):
+        if id(node) not in self._copied:
+            return node
+        # Like SchemaNode.clone(), without cloning the class' nodes again
+        clone = object.__new__(node.__class__)
+        clone.__dict__.update(node.__dict__)
+        clone.children = [self._bind(child, kw) for child in node.children]
+        clone.bindings = kw
+        # The same resolution as in SchemaNode._bind()
+        for name in self._deferred.get(id(node), ()):
+            value = getattr(clone, name)
+            if not isinstance(value, c.deferred):
+                continue  # already replaced, e.g. by a child of that name
+            value = value(clone, kw)
+            if isinstance(value, c.SchemaNode):
+                if not value.name:
+                    value.name = name
+                if value.raw_title is c._marker:
+                    value.title = name.replace('_', ' ').title()
+                c._add_node_child(clone, value)
+            else:
+                setattr(clone, name, value)
+        if getattr(clone, 'after_bind', None):
+            clone.after_bind(clone, kw)
+        return clone
+
+
+def get_plan(schema_class, **kw):
+    '''Return the BindPlan of ``schema_class(**kw)``, creating it the first
+    time. The values in *kw* (e.g. a validator) must be hashable.
+    '''
+    key = (schema_class, tuple(sorted(kw.items())))
+    plan = _plans.get(key)
+    if plan is None:
+        plan = _plans[key] = BindPlan(schema_class(**kw))
+    return plan
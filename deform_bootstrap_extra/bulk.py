@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+'''Validate large amounts of rows (e.g. from CSV imports) against a
+    colander schema, using all the processor cores::
+
+        from deform_bootstrap_extra.bulk import validate_many
+
+        for index, appstruct, errors in validate_many(
+                make_schema, csv.DictReader(f), workers=4):
+            if errors:
+                print('Row', index, errors)
+            else:
+                save(appstruct)
+
+    Rows are read lazily and sent to the worker processes in chunks; only
+    a few chunks per worker are in flight at any time, so memory use does
+    not depend on the size of the input. Results come out in input order.
+    '''
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+from collections import deque
+from itertools import islice
+import multiprocessing
+import colander as c
+from . import asdict2
+from .compiler import compile_schema
+
+
+def _validate_rows(deserialize, start, rows, translate=None):
+    results = []
+    for index, row in enumerate(rows, start):
+        try:
+            results.append((index, deserialize(row), None))
+        except c.Invalid as e:
+            results.append((index, None, asdict2(e, translate)))
+    return results
+
+
+def _make_deserializer(schema, compiled):
+    if not isinstance(schema, c.SchemaNode):
+        schema = schema()  # a factory
+    return compile_schema(schema) if compiled else schema.deserialize
+
+
+_worker = {}  # the state of a worker process
+
+
+def _init_worker(schema, compiled, translate):
+    _worker['deserialize'] = _make_deserializer(schema, compiled)
+    _worker['translate'] = translate
+
+
+def _work(start, rows):
+    return _validate_rows(_worker['deserialize'], start, rows,
+                          _worker['translate'])
+
+
+def _chunks(rows, chunk_size):
+    rows = iter(rows)
+    start = 0
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield start, chunk
+        start += len(chunk)
+
+
+def validate_many(schema, rows, workers=None, chunk_size=1000,
+                  translate=None, compiled=False, pending=2):
+    '''Deserialize each of the *rows* with *schema* and generate
+    ``(index, appstruct, None)`` for valid rows and
+    ``(index, None, errors)`` for invalid ones, in order. *errors* is
+    the output of :func:`deform_bootstrap_extra.asdict2`.
+
+    *schema* is either a schema instance or a callable that returns one,
+    which is called once in each worker process. It must be picklable --
+    as must *translate*, rows and appstructs -- so a module-level factory is
+    best when the schema contains lambdas or database sessions.
+
+    *workers* is the number of processes (by default, the number of CPUs);
+    with 0, everything happens in the current process. *pending* is how
+    many chunks, per worker, may be waiting for results at any time.
+    If *compiled* is true, the schema is compiled for speed (see the
+    :mod:`deform_bootstrap_extra.compiler` module).
+    '''
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    if not workers:
+        deserialize = _make_deserializer(schema, compiled)
+        for start, chunk in _chunks(rows, chunk_size):
+            for result in _validate_rows(deserialize, start, chunk,
+                                         translate):
+                yield result
+        return
+
+    pool = multiprocessing.Pool(workers, _init_worker,
+                                (schema, compiled, translate))
+    try:
+        in_flight = deque()
+        for start, chunk in _chunks(rows, chunk_size):
+            if len(in_flight) >= workers * pending:
+                for result in in_flight.popleft().get():
+                    yield result
+            in_flight.append(pool.apply_async(_work, (start, chunk)))
+        while in_flight:
+            for result in in_flight.popleft().get():
+                yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
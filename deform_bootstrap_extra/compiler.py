@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+
+'''Compile colander schemas into flat Python functions for fast
+    deserialization.
+
+    ``schema.deserialize(cstruct)`` walks the node tree, going through
+    ``SchemaNode.deserialize``, the type and the validators of every node,
+    recursively. ``compile_schema(schema)`` generates, instead, a single
+    function in which the mapping nodes are unrolled, then returns a
+    callable that gives the same results -- and raises the same
+    :class:`colander.Invalid` tree -- as the interpreted path::
+
+        from deform_bootstrap_extra.compiler import compile_schema
+
+        appstruct = compile_schema(schema)(cstruct)
+
+    The generated code only depends on the *structure* of the schema
+    (names, node types, presence of preparers and validators), so it is
+    cached and shared by all schemas with that structure. A compiled schema
+    can also deserialize with another instance of the same structure --
+    for instance the schema bound anew on each request::
+
+        appstruct = compiled.deserialize(cstruct, schema=bound_schema)
+
+    ``get_compiled()`` caches compiled schemas per signature for this
+    purpose.
+
+    Nodes that are not plain SchemaNodes, and types other than
+    ``colander.Mapping`` that contain children (sequences, tuples...),
+    are simply called as usual.
+    '''
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+import colander as c
+
+# Deeply nested mappings are called as usual, otherwise the generated code
+# would exceed the interpreter's limit of statically nested blocks.
+MAX_DEPTH = 4
+
+_code_cache = {}
+
+_namespace = dict(
+    Invalid=c.Invalid, UnboundDeferredError=c.UnboundDeferredError,
+    deferred=c.deferred, drop=c.drop, is_nonstr_iter=c.is_nonstr_iter,
+    null=c.null, required=c.required, _=c._)
+
+LEAF, MAPPING, OPAQUE = 'leaf', 'mapping', 'opaque'
+
+
+def _kind(node, depth):
+    if type(node).deserialize is not c.SchemaNode.deserialize:
+        return OPAQUE
+    typ = node.typ
+    if isinstance(typ, c.Mapping):
+        if depth < MAX_DEPTH and typ.unknown == 'ignore' and \
+                type(typ).deserialize is c.Mapping.deserialize and \
+                type(typ)._impl is c.Mapping._impl and \
+                type(typ)._validate is c.Mapping._validate:
+            return MAPPING
+        return OPAQUE
+    if node.children:  # sequences, tuples and other containers
+        return OPAQUE
+    return LEAF
+
+
+def _signature(schema):
+    '''Return the structural signature (one tuple per node, pre-order).'''
+    signature = []
+    stack = [(schema, 0)]
+    while stack:
+        node, depth = stack.pop()
+        kind = _kind(node, depth)
+        size = len(node.children) if kind == MAPPING else 0
+        signature.append((kind, node.name, size, type(node.typ),
+                          node.preparer is not None,
+                          node.validator is not None))
+        if kind == MAPPING:
+            stack.extend((child, depth + 1)
+                         for child in reversed(node.children))
+    return tuple(signature)
+
+
+class _Generator(object):
+    def __init__(self, signature):
+        self.signature = signature
+        self.lines = []
+        self.index = 0
+
+    def emit(self, indent, line):
+        self.lines.append('    ' * indent + line)
+
+    def generate(self):
+        self.emit(0, 'def deserialize(c0, n0):')
+        self.node(1)
+        self.emit(1, 'return a0')
+        return '\n'.join(self.lines) + '\n'
+
+    def node(self, indent):
+        '''Emit code that reads c{i} and assigns a{i}.'''
+        i = self.index
+        self.index += 1
+        kind, name, size, _typ, has_preparer, has_validator = \
+            self.signature[i]
+        if kind == OPAQUE:
+            self.emit(indent, 'a{0} = n{0}.deserialize(c{0})'.format(i))
+            return
+        if kind == LEAF:
+            self.emit(indent, 'a{0} = n{0}.typ.deserialize(n{0}, c{0})'
+                      .format(i))
+        else:
+            self.mapping(indent, i, size)
+        if has_preparer:
+            self.emit(indent, 'p = n{}.preparer'.format(i))
+            self.emit(indent, 'if callable(p):')
+            self.emit(indent + 1, 'a{0} = p(a{0})'.format(i))
+            self.emit(indent, 'elif is_nonstr_iter(p):')
+            self.emit(indent + 1, 'for q in p:')
+            self.emit(indent + 2, 'a{0} = q(a{0})'.format(i))
+        self.emit(indent, 'if a{} is null:'.format(i))
+        self.emit(indent + 1, 'a{0} = n{0}.missing'.format(i))
+        self.emit(indent + 1, 'if a{} is required:'.format(i))
+        self.emit(indent + 2, 'raise Invalid(n{0}, _(n{0}.missing_msg, '
+                  "mapping={{'title': n{0}.title, 'name': n{0}.name}}))"
+                  .format(i))
+        self.emit(indent + 1, 'if isinstance(a{}, deferred):'.format(i))
+        self.emit(indent + 2, 'raise Invalid(n{0}, n{0}.missing_msg)'
+                  .format(i))
+        if has_validator:
+            self.emit(indent, 'else:')
+            self.emit(indent + 1, 'v = n{}.validator'.format(i))
+            self.emit(indent + 1, 'if isinstance(v, deferred):')
+            self.emit(indent + 2, 'raise UnboundDeferredError("Schema node '
+                      '{{}} has an unbound deferred validator".format(n{}))'
+                      .format(i))
+            # A deferred validator may have been bound to None
+            self.emit(indent + 1, 'if v is not None:')
+            self.emit(indent + 2, 'v(n{0}, a{0})'.format(i))
+
+    def mapping(self, indent, i, size):
+        '''Unroll colander.Mapping.deserialize for node *i*.'''
+        self.emit(indent, 'if c{} is null:'.format(i))
+        self.emit(indent + 1, 'a{} = null'.format(i))
+        self.emit(indent, 'else:')
+        indent += 1
+        self.emit(indent, 'd{0} = n{0}.typ._validate(n{0}, c{0})'.format(i))
+        self.emit(indent, 'a{} = {{}}'.format(i))
+        self.emit(indent, 'e{} = None'.format(i))
+        for pos in range(size):
+            j = self.index
+            name = self.signature[j][1]
+            self.emit(indent, 'n{} = n{}.children[{}]'.format(j, i, pos))
+            self.emit(indent, 'c{} = d{}.pop({!r}, null)'.format(j, i, name))
+            self.emit(indent, 'if c{0} is not drop and not (c{0} is null and '
+                      "getattr(n{0}, 'missing', None) is drop):".format(j))
+            self.emit(indent + 1, 'try:')
+            self.node(indent + 2)
+            self.emit(indent + 1, 'except Invalid as x:')
+            self.emit(indent + 2, 'if e{} is None:'.format(i))
+            self.emit(indent + 3, 'e{0} = Invalid(n{0})'.format(i))
+            self.emit(indent + 2, 'e{}.add(x, {})'.format(i, pos))
+            self.emit(indent + 1, 'else:')
+            self.emit(indent + 2, 'if a{} is not drop:'.format(j))
+            self.emit(indent + 3, 'a{}[{!r}] = a{}'.format(i, name, j))
+        self.emit(indent, 'if e{} is not None:'.format(i))
+        self.emit(indent + 1, 'raise e{}'.format(i))
+
+
+def _build(signature):
+    source = _Generator(signature).generate()
+    namespace = dict(_namespace)
+    exec(compile(source, '<compiled colander schema>', 'exec'), namespace)
+    function = namespace['deserialize']
+    function.source = source
+    return function
+
+
+class CompiledSchema(object):
+    '''Callable that deserializes a cstruct exactly like the schema it
+    was created from. Get instances through ``compile_schema()``.
+    '''
+    __slots__ = ('function', 'schema')
+
+    def __init__(self, function, schema):
+        self.function = function
+        self.schema = schema
+
+    def deserialize(self, cstruct=c.null, schema=None):
+        '''*schema* defaults to the one that was compiled; if you pass
+        another, it must have the same structure.
+        '''
+        return self.function(cstruct, schema or self.schema)
+
+    __call__ = deserialize
+
+    @property
+    def source(self):
+        '''The generated Python code, for debugging.'''
+        return self.function.source
+
+
+def compile_schema(schema):
+    '''Return a :class:`CompiledSchema` for the (usually bound) *schema*.
+    Later changes to the structure of *schema* are not seen by the result.
+    '''
+    signature = _signature(schema)
+    function = _code_cache.get(signature)
+    if function is None:
+        function = _code_cache[signature] = _build(signature)
+    return CompiledSchema(function, schema)
+
+
+_compiled_by_signature = {}
+
+
+def get_compiled(schema):
+    '''Return a :class:`CompiledSchema` suitable for *schema*, compiling it
+    only the first time a schema with its signature (the names, types and
+    kinds of all nodes, and whether they have preparers and validators)
+    is seen. Pass *schema* along when deserializing::
+
+        get_compiled(schema).deserialize(cstruct, schema)
+    '''
+    key = (type(schema), _signature(schema))
+    compiled = _compiled_by_signature.get(key)
+    if compiled is None:
+        compiled = _compiled_by_signature[key] = compile_schema(schema)
+    return compiled
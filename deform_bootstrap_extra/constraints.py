@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+
+'''Export the constraints of colander schemas to the browser.
+
+    The constraints that a browser can check by itself -- required fields,
+    lengths, ranges, regular expressions, choices -- are read from the
+    validators of each node (e.g. those created by ``lengthen()``, by
+    Schemaker or by ``from_now_on``, once bound). The templates of this
+    package use ``html_attributes()`` to render them as HTML5 attributes
+    (``required``, ``maxlength``, ``pattern``, ``min``...).
+
+    ``manifest()`` also gathers them for a whole form, keyed by field oid;
+    the form templates include this JSON manifest when the form has a true
+    ``client_constraints`` attribute (see BaseDeformView), and
+    ``xaja.enforceConstraints()`` uses it to validate the form before
+    submitting it. The manifest also carries the error messages, phrased
+    as colander would and translated, so the browser shows the same
+    messages as the server.
+    '''
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+import json
+import re
+import colander as c
+
+
+def _validators(validator):
+    stack = [validator]
+    while stack:
+        validator = stack.pop()
+        if isinstance(validator, c.All):
+            stack.extend(reversed(validator.validators))
+        elif validator is not None and \
+                not isinstance(validator, c.deferred):
+            yield validator
+
+
+def _value(value):
+    '''Convert a Range limit to the format of HTML inputs.'''
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%dT%H:%M')
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def _pattern(regex):
+    '''Return an HTML pattern equivalent to the compiled *regex*, or None.
+
+    ``colander.Regex`` only anchors the expression at the start, whereas
+    an HTML pattern must match the whole value. Flags and Python-only
+    syntax cannot be translated.
+    '''
+    if regex.flags & ~re.UNICODE or '(?P' in regex.pattern:
+        return None
+    return '(?:{})[\\s\\S]*'.format(regex.pattern)
+
+
+def node_constraints(node):
+    '''Return an OrderedDict of the constraints of the colander *node*
+    that can be checked in the browser. Possible keys are ``required``,
+    ``minlength``, ``maxlength``, ``min``, ``max``, ``pattern``, ``email``
+    and ``choices``.
+    '''
+    adict = OrderedDict()
+    boolean = isinstance(node.typ, c.Boolean)
+    if node.required and not boolean:  # unchecked boxes are still valid
+        adict['required'] = True
+    for validator in _validators(node.validator):
+        if isinstance(validator, c.Length):
+            if validator.min:
+                adict['minlength'] = validator.min
+            if validator.max is not None:
+                adict['maxlength'] = validator.max
+        elif isinstance(validator, c.Range):
+            if validator.min is not None:
+                adict['min'] = _value(validator.min)
+            if validator.max is not None:
+                adict['max'] = _value(validator.max)
+        elif isinstance(validator, c.Email):
+            adict['email'] = True
+        elif isinstance(validator, c.Regex):
+            pattern = _pattern(validator.match_object)
+            if pattern:
+                adict['pattern'] = pattern
+        elif isinstance(validator, c.OneOf):
+            choices = list(validator.choices)
+            if boolean:
+                if choices == [True]:  # the box must be checked
+                    adict['required'] = True
+            else:
+                adict['choices'] = choices
+    return adict
+
+
+def node_messages(node):
+    '''Return an OrderedDict of the colander error messages (translation
+    strings) for the constraints of *node*, with the same keys as
+    ``node_constraints()``. ``[0]`` stands for the value typed by the user.
+    '''
+    adict = OrderedDict()
+    boolean = isinstance(node.typ, c.Boolean)
+    if node.required and not boolean:
+        adict['required'] = c._('Required')
+    for validator in _validators(node.validator):
+        if isinstance(validator, c.Length):
+            if validator.min:
+                adict['minlength'] = c._(validator.min_err,
+                                         mapping=dict(min=validator.min))
+            if validator.max is not None:
+                adict['maxlength'] = c._(validator.max_err,
+                                         mapping=dict(max=validator.max))
+        elif isinstance(validator, c.Range):
+            if validator.min is not None:
+                adict['min'] = c._(validator.min_err, mapping=dict(
+                    val='[0]', min=_value(validator.min)))
+            if validator.max is not None:
+                adict['max'] = c._(validator.max_err, mapping=dict(
+                    val='[0]', max=_value(validator.max)))
+        elif isinstance(validator, c.Email):
+            adict['email'] = validator.msg
+        elif isinstance(validator, c.Regex):
+            adict['pattern'] = validator.msg
+        elif isinstance(validator, c.OneOf):
+            if boolean:
+                adict['required'] = c._('Required')
+            else:
+                adict['choices'] = c._(validator.msg_err, mapping=dict(
+                    val='[0]', choices=', '.join(
+                        '%s' % x for x in validator.choices)))
+    return adict
+
+
+def _translate(translate, msg):
+    msg = translate(msg)
+    return msg.interpolate() if hasattr(msg, 'interpolate') else msg
+
+
+_ATTRIBUTES = ('required', 'minlength', 'maxlength', 'min', 'max', 'pattern')
+
+
+def html_attributes(field):
+    '''Return a dict of HTML5 attributes for the deform *field*, for the
+    ``tal:attributes`` of a template. Attributes set on the widget (such
+    as ``maxlength`` or ``min``) take precedence over those derived from
+    the validators.
+    '''
+    constraints = node_constraints(field.schema)
+    attrs = {}
+    for name in _ATTRIBUTES:
+        value = getattr(field.widget, name, None)
+        if value is None:
+            value = constraints.get(name)
+        if value is True:
+            value = 'true'
+        if value is not None:
+            attrs[name] = value
+    return attrs
+
+
+def manifest(form, translate=None):
+    '''Return a dict mapping the oid of each field of *form* (a deform
+    Form or Field) that has constraints to its name and constraints.
+    If *translate* is given, each entry also has the ``messages`` for its
+    constraints (see ``node_messages()``), translated by it.
+    '''
+    adict = OrderedDict()
+    stack = [form]
+    while stack:
+        field = stack.pop()
+        if field.children:
+            stack.extend(reversed(field.children))
+        elif field is not form:
+            constraints = node_constraints(field.schema)
+            if not constraints:
+                continue
+            entry = adict[field.oid] = dict(name=field.name, **constraints)
+            if translate is not None:
+                messages = node_messages(field.schema)
+                entry['messages'] = dict(
+                    (key, _translate(translate, msg))
+                    for key, msg in messages.items()
+                    if key in constraints and msg is not None)
+    return adict
+
+
+def manifest_json(form, translate=None):
+    '''Return the manifest of *form* as JSON that can be embedded in a
+    ``<script>`` element. The messages are translated by *translate*,
+    by default the translator of the renderer of *form*.
+    '''
+    translate = translate or form.translate
+    return json.dumps(manifest(form, translate), sort_keys=True,
+                      default=str) \
+        .replace('</', '<\\/')
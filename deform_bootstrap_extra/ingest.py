@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+
+'''Write validated rows to the database in batches, set-at-a-time.
+
+    :class:`Ingestor` takes the output of
+    :func:`deform_bootstrap_extra.bulk.validate_many` (or any iterable of
+    appstructs) and inserts -- or upserts -- the rows with
+    ``bulk_insert_mappings()``, one batch at a time::
+
+        sm = Schemaker()
+        ingestor = Ingestor(db, Book, unique=[Book.isbn])
+        for index, errors in ingestor.ingest(
+                validate_many(sm.schema_for(Book), rows)):
+            log.warning('Row %d was not imported: %s', index, errors)
+        db.commit()
+
+    The uniqueness checks for a batch are resolved with a single query per
+    unique column, also catching duplicates within the input itself. So
+    validate the rows with a schema *without* DBUniqueCheck validators
+    (those would query the database once per row) and give the checks to
+    the Ingestor instead.
+
+    If the database still refuses a batch, each of its rows is retried in
+    its own savepoint, so only the offending rows fail.
+    '''
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+from itertools import islice
+from sqlalchemy import func, inspect, tuple_
+from sqlalchemy.exc import DBAPIError
+import colander
+from .schemaker import DBUniqueCheck
+
+
+def unique_checks_in(schema):
+    '''Generate (node, check) for each DBUniqueCheck among the validators
+    of the children of *schema* (a bound schema).
+    '''
+    for node in schema.children:
+        validators = [node.validator]
+        while validators:
+            validator = validators.pop()
+            if isinstance(validator, DBUniqueCheck):
+                yield node, validator
+            elif isinstance(validator, colander.All):
+                validators.extend(validator.validators)
+
+
+class Ingestor(object):
+    '''Inserts appstructs into the table of *model_class* in batches of
+    *batch_size*. If *upsert* is true, rows whose primary key already
+    exists are updated instead (with ``bulk_update_mappings()``).
+
+    *unique* is a sequence of column attributes (e.g. ``Book.isbn``) and/or
+    DBUniqueCheck instances; *schema* is a schema in which to look for
+    more DBUniqueCheck validators.
+
+    After ingesting, ``inserted`` and ``updated`` hold the row counts.
+    '''
+    def __init__(self, db, model_class, unique=(), schema=None,
+                 batch_size=500, upsert=False):
+        self.db = db
+        self.model_class = model_class
+        self.batch_size = batch_size
+        self.upsert = upsert
+        self.primary_key = [
+            inspect(model_class).get_property_by_column(column).key
+            for column in inspect(model_class).primary_key]
+        self.checks = []  # (key, node, check)
+        for item in unique:
+            if isinstance(item, DBUniqueCheck):
+                check = item
+            else:
+                check = DBUniqueCheck(db, model_class, item)
+            key = check.field.key
+            self.checks.append(
+                (key, colander.SchemaNode(colander.String(), name=key), check))
+        if schema is not None:
+            for node, check in unique_checks_in(schema):
+                self.checks.append((node.name, node, check))
+        self.inserted = self.updated = 0
+
+    def ingest(self, results):
+        '''Consume *results*, which are ``(index, appstruct, errors)``
+        triples as generated by ``validate_many()``, and write the valid
+        rows. Generate ``(index, errors)`` for each row that was not
+        written, including those that were already invalid.
+        '''
+        results = iter(results)
+        while True:
+            batch = []
+            for index, appstruct, errors in islice(results, self.batch_size):
+                if errors:
+                    yield index, errors
+                else:
+                    batch.append((index, dict(
+                        (k, v) for k, v in appstruct.items()
+                        if v is not colander.null)))
+            if not batch:
+                return
+            for failure in self._ingest_batch(batch):
+                yield failure
+
+    def ingest_appstructs(self, appstructs):
+        '''Like ``ingest()``, for an iterable of appstructs.'''
+        return self.ingest((index, appstruct, None)
+                           for index, appstruct in enumerate(appstructs))
+
+    def _pk(self, row):
+        pk = tuple(row.get(key) for key in self.primary_key)
+        return None if None in pk else pk
+
+    def _existing_pks(self, batch):
+        pks = set(pk for pk in (self._pk(row) for index, row in batch)
+                  if pk is not None)
+        if not pks:
+            return set()
+        columns = [getattr(self.model_class, k) for k in self.primary_key]
+        if len(columns) == 1:
+            condition = columns[0].in_([pk[0] for pk in pks])
+        else:
+            condition = tuple_(*columns).in_(list(pks))
+        return set(tuple(r) for r in self.db.query(*columns).filter(condition))
+
+    def _unique_failures(self, batch):
+        '''Return {index: errors} for the rows of *batch* that would
+        violate a unique check, with one query per check.
+        '''
+        failures = {}
+        pk_columns = [getattr(self.model_class, k) for k in self.primary_key]
+        for key, node, check in self.checks:
+            owners = {}  # normalized value -> primary key of the first row
+            for index, row in batch:
+                value = row.get(key)
+                if value is None:
+                    continue
+                if not check.case_sensitive:
+                    value = value.lower()
+                if value in owners and (owners[value] is None or
+                                        owners[value] != self._pk(row)):
+                    failures.setdefault(index, {})[key] = check.message(node)
+                else:
+                    owners[value] = self._pk(row)
+            if not owners:
+                continue
+            field = check.field if check.case_sensitive \
+                else func.lower(check.field)
+            query = self.db.query(field, *pk_columns).filter(
+                field.in_(list(owners)))
+            taken = dict((r[0], tuple(r[1:])) for r in query)
+            for index, row in batch:
+                value = row.get(key)
+                if value is None:
+                    continue
+                if not check.case_sensitive:
+                    value = value.lower()
+                # Updating a row does not conflict with its own value
+                if value in taken and taken[value] != self._pk(row):
+                    failures.setdefault(index, {})[key] = check.message(node)
+        return failures
+
+    def _ingest_batch(self, batch):
+        failures = self._unique_failures(batch) if self.checks else {}
+        for index in sorted(failures):
+            yield index, failures[index]
+        batch = [item for item in batch if item[0] not in failures]
+        if not batch:
+            return
+        try:
+            with self.db.begin_nested():
+                self._write(batch)
+        except DBAPIError as e:
+            if len(batch) == 1:
+                yield batch[0][0], {'': str(e.orig)}
+                return
+            for item in batch:  # find the culprits
+                try:
+                    with self.db.begin_nested():
+                        self._write([item])
+                except DBAPIError as e:
+                    yield item[0], {'': str(e.orig)}
+
+    def _write(self, batch):
+        existing = self._existing_pks(batch) if self.upsert else ()
+        inserts, updates = [], []
+        for index, row in batch:
+            (updates if self._pk(row) in existing else inserts).append(row)
+        if inserts:
+            self.db.bulk_insert_mappings(self.model_class, inserts)
+        if updates:
+            self.db.bulk_update_mappings(self.model_class, updates)
+        self.db.flush()
+        self.inserted += len(inserts)
+        self.updated += len(updates)
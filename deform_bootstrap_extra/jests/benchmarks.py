@@ -0,0 +1,348 @@
+# -*- coding: utf-8 -*-
+
+'''Micro-benchmarks for the hot paths of deform_bootstrap_extra.
+
+    Everything runs offline, against an in-memory SQLite database and a
+    WebTest application. Run the whole suite and store the results::
+
+        python -m deform_bootstrap_extra.jests.benchmarks -o baseline.json
+
+    Later (e.g. after upgrading colander or deform), compare against them;
+    the exit status is 1 if any benchmark got slower than the tolerance::
+
+        python -m deform_bootstrap_extra.jests.benchmarks -b baseline.json
+
+    Use ``-k`` to run only the benchmarks whose name contains a string.
+    '''
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+from collections import OrderedDict
+from timeit import Timer
+import argparse
+import json
+import platform
+import re
+import sys
+import colander as c
+import sqlalchemy as sa
+from sqlalchemy.orm import Session, declarative_base
+
+BENCHMARKS = OrderedDict()
+
+
+def benchmark(name):
+    '''Register a benchmark. The decorated function does the setup and
+    returns the callable to be timed.
+    '''
+    def decorator(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return decorator
+
+
+# ============================= Model set =============================
+Base = declarative_base()
+
+
+class Everything(Base):
+    '''One column for each type in the default Schemaker.type_map.'''
+    __tablename__ = 'everything'
+    id = sa.Column(sa.Integer, primary_key=True)
+    Boolean = sa.Column(sa.Boolean, nullable=False, default=False)
+    Date = sa.Column(sa.Date)
+    DateTime = sa.Column(sa.DateTime)
+    Time = sa.Column(sa.Time)
+    DECIMAL = sa.Column(sa.DECIMAL(10, 2))
+    Numeric = sa.Column(sa.Numeric(10, 2))
+    Float = sa.Column(sa.Float)
+    Integer = sa.Column(sa.Integer, default=7)
+    String = sa.Column(sa.String(40), nullable=False)
+    Unicode = sa.Column(sa.Unicode(200), unique=True)
+    Enum = sa.Column(sa.Enum('red', 'green', 'blue', name='color'))
+
+
+TYPE_COLUMNS = ('Boolean', 'Date', 'DateTime', 'Time', 'DECIMAL', 'Numeric',
+                'Float', 'Integer', 'String', 'Unicode', 'Enum')
+
+
+def make_session(rows=1000):
+    engine = sa.create_engine('sqlite://')
+    Base.metadata.create_all(engine)
+    db = Session(bind=engine)
+    db.add_all(Everything(String='s%d' % i, Unicode='user%d@example.com' % i)
+               for i in range(rows))
+    db.flush()
+    return db
+
+
+# ============================= Schemaker =============================
+def _schemaker_call(column):
+    from deform_bootstrap_extra.schemaker import Schemaker
+    sm = Schemaker()
+    prop = getattr(Everything, column)
+    return lambda: sm(prop)
+
+
+for _column in TYPE_COLUMNS:
+    benchmark('schemaker.call.' + _column)(
+        lambda column=_column: _schemaker_call(column))
+del _column
+
+
+@benchmark('schemaker.schema_for')
+def schemaker_schema_for():
+    from deform_bootstrap_extra.schemaker import Schemaker
+    sm = Schemaker()
+    return lambda: sm.schema_for(Everything)
+
+
+# ============================== helpers ==============================
+@benchmark('helpers.lengthen.int')
+def helpers_lengthen_int():
+    from deform_bootstrap_extra.helpers import lengthen
+    return lambda: lengthen(80, placeholder='Name')
+
+
+@benchmark('helpers.lengthen.property')
+def helpers_lengthen_property():
+    from deform_bootstrap_extra.helpers import lengthen
+    return lambda: lengthen(Everything.Unicode)
+
+
+# ========================== colander types ==========================
+@benchmark('colander.trilean.roundtrip')
+def colander_trilean():
+    from deform_bootstrap_extra.schema import Trilean
+    node = c.SchemaNode(Trilean(), missing=None)
+
+    def roundtrip():
+        for value in (True, False, c.null):
+            node.deserialize(node.serialize(value))
+    return roundtrip
+
+
+@benchmark('colander.mapping.roundtrip')
+def colander_mapping():
+    from deform_bootstrap_extra.schemaker import Schemaker
+    schema = Schemaker().schema_for(Everything, excludes=['id'])
+    cstruct = dict(Boolean='true', Date='2014-01-02',
+                   DateTime='2014-01-02T03:04:05', Time='03:04:05',
+                   DECIMAL='1.5', Numeric='2.5', Float='3.5', Integer='4',
+                   String='text', Unicode='someone@example.com',
+                   Enum='green')
+    return lambda: schema.serialize(schema.deserialize(cstruct))
+
+
+@benchmark('colander.mapping.compiled')
+def colander_mapping_compiled():
+    from deform_bootstrap_extra.compiler import compile_schema
+    from deform_bootstrap_extra.schemaker import Schemaker
+    schema = Schemaker().schema_for(Everything, excludes=['id'])
+    compiled = compile_schema(schema)
+    cstruct = dict(Boolean='true', Integer='4', String='text', Enum='green')
+    return lambda: compiled(cstruct)
+
+
+# ============================== asdict2 ==============================
+def _deep_error(depth=6, width=3):
+    def make(level):
+        if level == depth:
+            return c.SchemaNode(c.Int(), name='leaf', validator=c.Range(min=1))
+        node = c.SchemaNode(c.Mapping(), name='level%d' % level)
+        for i in range(width):
+            child = make(level + 1)
+            child.name = '%s%d' % (child.name, i)
+            node.add(child)
+        return node
+
+    def cstruct(node):
+        if node.children:
+            return dict((child.name, cstruct(child))
+                        for child in node.children)
+        return '0'
+    schema = make(0)
+    try:
+        schema.deserialize(cstruct(schema))
+    except c.Invalid as e:
+        return e
+
+
+@benchmark('asdict2.deep_tree')
+def asdict2_deep_tree():
+    from deform_bootstrap_extra import asdict2
+    error = _deep_error()
+    return lambda: asdict2(error)
+
+
+# =========================== DBUniqueCheck ===========================
+@benchmark('dbuniquecheck.single')
+def dbuniquecheck_single():
+    from deform_bootstrap_extra.schemaker import DBUniqueCheck
+    db = make_session()
+    check = DBUniqueCheck(db, Everything, Everything.Unicode,
+                          case_sensitive=False)
+    node = c.SchemaNode(c.Str(), name='email')
+    return lambda: check(node, 'new@example.com')
+
+
+@benchmark('dbuniquecheck.batch4')
+def dbuniquecheck_batch():
+    from deform_bootstrap_extra.schemaker import (
+        DBUniqueCheck, UniqueCheckBatch)
+    db = make_session()
+    schema = c.SchemaNode(c.Mapping())
+    for i in range(4):
+        schema.add(c.SchemaNode(c.Str(), name='f%d' % i,
+                                validator=DBUniqueCheck(
+                                    db, Everything, Everything.Unicode)))
+    cstruct = dict(('f%d' % i, 'new%d@example.com' % i) for i in range(4))
+    return lambda: UniqueCheckBatch(db).validate(schema, cstruct)
+
+
+# ===================== BaseDeformView via WebTest =====================
+def make_app():
+    from pyramid.config import Configurator
+    from pyramid.response import Response
+    from pyramid.session import SignedCookieSessionFactory
+    from pyramid_deform import CSRFSchema
+    from webtest import TestApp
+    from deform_bootstrap_extra.helpers import lengthen
+    from deform_bootstrap_extra.pyramid.views import BaseDeformView
+
+    class ContactSchema(CSRFSchema):
+        name = c.SchemaNode(c.Str(), **lengthen(60))
+        email = c.SchemaNode(c.Str(), **lengthen(
+            120, typ='email', validators=[c.Email()]))
+        message = c.SchemaNode(c.Str(), **lengthen(2000))
+
+    class ContactView(BaseDeformView):
+        schema = ContactSchema
+
+        def __call__(self):
+            result = self._deform_workflow()
+            if isinstance(result, Response):
+                return result
+            return Response(result['form'])
+
+        def _valid(self, form, controls):
+            return Response('ok')
+
+    config = Configurator(session_factory=SignedCookieSessionFactory('b'))
+    config.include('deform_bootstrap_extra')
+    config.add_route('contact', '/contact')
+    config.add_view(ContactView, route_name='contact')
+    return TestApp(config.make_wsgi_app())
+
+
+def _app_and_token():
+    app = make_app()
+    html = app.get('/contact').text
+    token = re.search(r'name="csrf_token" value="([^"]+)"', html).group(1)
+    return app, token
+
+
+@benchmark('view.get')
+def view_get():
+    app = make_app()
+    return lambda: app.get('/contact')
+
+
+@benchmark('view.post.valid')
+def view_post_valid():
+    app, token = _app_and_token()
+    params = dict(csrf_token=token, name='Someone',
+                  email='someone@example.com', message='Hello')
+    return lambda: app.post('/contact', params)
+
+
+@benchmark('view.post.invalid')
+def view_post_invalid():
+    app, token = _app_and_token()
+    params = dict(csrf_token=token, name='', email='nope', message='')
+    return lambda: app.post('/contact', params)
+
+
+# ============================== Runner ==============================
+def measure(fn, repeat=5, min_time=0.05):
+    '''Return the best and median time per call, in seconds.'''
+    timer = Timer(fn)
+    number = 1
+    while True:  # calibrate
+        if timer.timeit(number) >= min_time or number >= 1000000:
+            break
+        number *= 10
+    times = sorted(t / number for t in timer.repeat(repeat, number))
+    return OrderedDict([('best', times[0]),
+                        ('median', times[len(times) // 2]),
+                        ('number', number), ('repeat', repeat)])
+
+
+def versions():
+    import pkg_resources
+    adict = OrderedDict(python=platform.python_version())
+    for name in ('colander', 'deform', 'deform_bootstrap', 'SQLAlchemy',
+                 'pyramid', 'Chameleon', 'WebOb'):
+        try:
+            adict[name] = pkg_resources.get_distribution(name).version
+        except Exception:
+            adict[name] = None
+    return adict
+
+
+def run(select=None, repeat=5, min_time=0.05, out=None):
+    '''Run the benchmarks whose names contain *select* (or all of them).'''
+    results = OrderedDict()
+    for name, setup in BENCHMARKS.items():
+        if select and select not in name:
+            continue
+        results[name] = result = measure(setup(), repeat, min_time)
+        if out:
+            print('{:<32} {:>12.2f} us'.format(name, result['best'] * 1e6),
+                  file=out)
+    return OrderedDict([('versions', versions()), ('results', results)])
+
+
+def compare(report, baseline, tolerance=0.25):
+    '''Return a list of (name, baseline time, new time) for benchmarks that
+    got slower than the baseline by more than *tolerance* (a fraction).
+    '''
+    regressions = []
+    old = baseline.get('results', {})
+    for name, result in report['results'].items():
+        if name in old:
+            before, after = old[name]['best'], result['best']
+            if after > before * (1 + tolerance):
+                regressions.append((name, before, after))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('-o', '--output', help='write JSON results here')
+    parser.add_argument('-b', '--baseline', help='JSON results to compare')
+    parser.add_argument('-t', '--tolerance', type=float, default=0.25,
+                        help='allowed slowdown as a fraction (default 0.25)')
+    parser.add_argument('-k', '--select', help='substring of names to run')
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    report = run(args.select, args.repeat, out=sys.stderr)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for name, before, after in regressions:
+            print('REGRESSION {}: {:.2f} us -> {:.2f} us'.format(
+                name, before * 1e6, after * 1e6), file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
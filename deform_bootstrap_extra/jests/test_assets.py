@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+
+'''Tests for the static bundles.'''
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+import os
+import shutil
+import tempfile
+import unittest
+from deform_bootstrap_extra.assets import build_bundles, load_manifest
+
+
+class TestBundles(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_build(self):
+        bundles = build_bundles(self.dir, minify=False)
+        self.assertEqual(load_manifest(self.dir), bundles)
+        self.assertTrue(bundles['js'].endswith('.js'))
+        with open(os.path.join(self.dir, bundles['js'])) as f:
+            js = f.read()
+        self.assertIn('var xaja', js)
+        self.assertIn('tagsInput', js)
+        self.assertEqual(build_bundles(self.dir, minify=False), bundles)
+
+    def test_served_forever(self):
+        from pyramid.config import Configurator
+        from pyramid.response import Response
+        from webtest import TestApp
+        from deform_bootstrap_extra.pyramid.assets import add_bundles
+        config = Configurator()
+        bundles = add_bundles(config, self.dir)
+        config.add_route('page', '/')
+        config.add_view(lambda request: Response(
+            request.deform_bundles['css']), route_name='page')
+        app = TestApp(config.make_wsgi_app())
+        url = app.get('/').text
+        self.assertTrue(url.endswith(bundles['css']))
+        response = app.get(url)
+        self.assertEqual(response.content_type, 'text/css')
+        self.assertIn('immutable', response.headers['Cache-Control'])
+        app.get('/deform_bootstrap_extra_bundles/nope.js', status=404)
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+'''Tests for the autocompletion index and view.'''
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+import unittest
+from deform_bootstrap_extra.autocomplete import PrefixIndex
+
+TAGS = ['python', 'Pyramid', 'pyramid', 'colander', 'deform', 'PyPI',
+        'postgres']
+
+
+class TestPrefixIndex(unittest.TestCase):
+    def test_search(self):
+        index = PrefixIndex(TAGS)
+        self.assertEqual(len(index), 6)  # pyramid is there only once
+        self.assertEqual(index.search('PY'), ['PyPI', 'Pyramid', 'python'])
+        self.assertEqual(index.search('py', limit=2), ['PyPI', 'Pyramid'])
+        self.assertEqual(index.search('x'), [])
+        self.assertEqual(index.search('', limit=2), ['colander', 'deform'])
+        sensitive = PrefixIndex(TAGS, case_sensitive=True)
+        self.assertEqual(sensitive.search('py'), ['pyramid', 'python'])
+
+    def test_incremental_changes_and_refresh(self):
+        source = list(TAGS)
+        index = PrefixIndex(lambda: source)
+        version = index.version
+        index.add('pytest', 'Python')
+        self.assertEqual(index.search('pyt'), ['pytest', 'python'])
+        index.discard('PYTEST')
+        self.assertEqual(index.search('pyt'), ['python'])
+        self.assertEqual(index.version, version + 2)
+        source.append('pythonic')
+        index.refresh()
+        self.assertEqual(index.search('pyt'), ['python', 'pythonic'])
+
+    def test_changes_replace_the_entries(self):
+        source = list(TAGS)
+        index = PrefixIndex(lambda: source, max_age=0)
+        entries = index._entries
+        index.add('pytest')
+        self.assertIsNot(index._entries, entries)
+        self.assertNotIn(('pytest', 'pytest'), entries)
+        source.append('pythonic')
+        index.refreshed -= 1  # older than max_age
+        self.assertEqual(index.search('pyth'), ['python', 'pythonic'])
+        self.assertFalse(index._refreshing)
+
+    def test_view(self):
+        from pyramid.config import Configurator
+        from webtest import TestApp
+        from deform_bootstrap_extra.pyramid.autocomplete import (
+            autocomplete_view)
+        index = PrefixIndex(TAGS)
+        config = Configurator()
+        config.add_route('tags', '/tags')
+        config.add_view(autocomplete_view(index, limit=2, max_limit=3),
+                        route_name='tags')
+        app = TestApp(config.make_wsgi_app())
+        response = app.get('/tags', dict(term='p'))
+        self.assertEqual(response.json, ['postgres', 'PyPI'])
+        self.assertEqual(response.cache_control.max_age, 60)
+        self.assertEqual(app.get('/tags', dict(term='p', limit=9)).json,
+                         ['postgres', 'PyPI', 'Pyramid'])
+        app.get('/tags', dict(term='p'), status=304,
+                headers={'If-None-Match': response.headers['ETag']})
+        index.add('pandas')  # changes the response
+        app.get('/tags', dict(term='p'), status=200,
+                headers={'If-None-Match': response.headers['ETag']})
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+
+'''Makes sure the benchmark suite keeps working.'''
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+import unittest
+from .benchmarks import BENCHMARKS, compare
+
+
+class TestBenchmarks(unittest.TestCase):
+    def test_every_benchmark_runs(self):
+        for name, setup in BENCHMARKS.items():
+            setup()()
+
+    def test_compare(self):
+        def report(**times):
+            return dict(results=dict(
+                (name, dict(best=t)) for name, t in times.items()))
+        self.assertEqual(compare(report(a=1.2, b=1.3, c=9),
+                                 report(a=1.0, b=1.0), tolerance=0.25),
+                         [('b', 1.0, 1.3)])
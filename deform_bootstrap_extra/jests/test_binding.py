@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+'''Tests for the copy-on-write binding of schemas.'''
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+import unittest
+import colander as c
+from deform_bootstrap_extra.binding import BindPlan, get_plan
+
+
+@c.deferred
+def default_country(node, kw):
+    return kw['country']
+
+
+@c.deferred
+def deferred_child(node, kw):
+    return c.SchemaNode(c.Int(), missing=kw['count'])
+
+
+class AddressSchema(c.MappingSchema):
+    street = c.SchemaNode(c.Str())
+    country = c.SchemaNode(c.Str(), default=default_country)
+
+
+class PersonSchema(c.MappingSchema):
+    name = c.SchemaNode(c.Str(), validator=c.Length(max=10))
+    email = c.SchemaNode(c.Str(), validator=c.Email())
+    address = AddressSchema()
+    phones = c.SequenceSchema(c.SchemaNode(c.Str(), name='phone'))
+    count = deferred_child
+
+
+class TestBindPlan(unittest.TestCase):
+    def test_only_deferred_paths_are_copied(self):
+        plan = BindPlan(PersonSchema())
+        template = plan.template
+        schema = plan.bind(country='BR', count=3)
+        self.assertIsNot(schema, template)
+        self.assertEqual(len(plan), 3)  # root, address, address.country
+        for name in ('name', 'email', 'phones'):
+            self.assertIs(schema[name], template[name])
+            self.assertFalse(plan.is_copied(schema[name]))
+        self.assertIs(schema['address']['street'],
+                      template['address']['street'])
+        self.assertTrue(plan.is_copied(schema['address']['country']))
+        self.assertEqual(schema['address']['country'].default, 'BR')
+        self.assertIs(template['address']['country'].default,
+                      default_country)
+        self.assertEqual(schema['count'].missing, 3)
+        self.assertNotIn('count', template)
+
+        other = plan.bind(country='PT', count=4)
+        self.assertEqual(other['address']['country'].default, 'PT')
+        self.assertEqual(schema['address']['country'].default, 'BR')
+        self.assertEqual(other.bindings, dict(country='PT', count=4))
+
+    def test_same_results_as_bind(self):
+        kw = dict(country='BR', count=3)
+        cow = get_plan(PersonSchema).bind(**kw)
+        plain = PersonSchema().bind(**kw)
+        self.assertIs(get_plan(PersonSchema), get_plan(PersonSchema))
+        self.assertEqual([n.name for n in cow], [n.name for n in plain])
+        self.assertEqual(cow.serialize(), plain.serialize())
+        cstruct = dict(name='Ann', email='ann@example.com', phones=['1'],
+                       address=dict(street='Main St.', country='BR'))
+        self.assertEqual(cow.deserialize(cstruct), plain.deserialize(cstruct))
+        with self.assertRaises(c.Invalid) as cm:
+            cow.deserialize(dict(cstruct, email='nope'))
+        self.assertEqual(list(cm.exception.asdict()), ['email'])
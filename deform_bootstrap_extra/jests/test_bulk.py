@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+
+'''Tests for bulk validation.'''
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+import unittest
+import colander as c
+from deform_bootstrap_extra.bulk import validate_many
+
+
+class RowSchema(c.MappingSchema):
+    name = c.SchemaNode(c.Str())
+    age = c.SchemaNode(c.Int(), validator=c.Range(min=0))
+    email = c.SchemaNode(c.Str(), validator=c.Email(), missing=c.null)
+
+
+def rows(n):
+    for i in range(n):
+        if i % 5 == 0:
+            yield dict(name='', age='-%d' % i, email='nope')
+        else:
+            yield dict(name='row%d' % i, age=str(i))
+
+
+class TestValidateMany(unittest.TestCase):
+    def test_in_process(self):
+        results = list(validate_many(RowSchema(), rows(12), workers=0,
+                                     chunk_size=5))
+        self.assertEqual([r[0] for r in results], list(range(12)))
+        self.assertEqual(results[1], (1, dict(name='row1', age=1,
+                                              email=c.null), None))
+        index, appstruct, errors = results[10]
+        self.assertIsNone(appstruct)
+        self.assertEqual(sorted(errors), ['age', 'email', 'name'])
+
+    def test_workers_give_the_same_results_in_order(self):
+        expected = list(validate_many(RowSchema, rows(60), workers=0))
+        for compiled in (False, True):
+            self.assertEqual(list(validate_many(
+                RowSchema, rows(60), workers=2, chunk_size=7, pending=1,
+                compiled=compiled)), expected)
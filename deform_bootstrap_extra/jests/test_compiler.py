@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+'''Differential tests: compiled schemas must behave exactly like the
+    interpreted ones.
+    '''
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+from itertools import product
+import random
+import unittest
+import colander as c
+from nine import str
+from deform_bootstrap_extra.compiler import compile_schema, get_compiled
+from deform_bootstrap_extra.schema import Trilean
+from .test_schemaker import Person
+
+
+def error_tree(e):
+    '''Comparable representation of an Invalid exception tree.'''
+    return (type(e), id(e.node), e.pos, e.positional,
+            [str(m) for m in c.interpolate(e.messages())],
+            [error_tree(child) for child in e.children])
+
+
+def outcome(deserialize, cstruct):
+    try:
+        return 'ok', deserialize(cstruct)
+    except c.Invalid as e:
+        return 'invalid', error_tree(e)
+    except Exception as e:
+        return 'exception', type(e)
+
+
+class DifferentialHarness(object):
+    '''Runs each payload through both paths and compares the outcomes.'''
+    def assertSameBehaviour(self, schema, payloads):
+        compiled = compile_schema(schema)
+        for cstruct in payloads:
+            expected = outcome(schema.deserialize, cstruct)
+            self.assertEqual(outcome(compiled, cstruct), expected,
+                             'Different result for {!r}'.format(cstruct))
+
+
+def strip(value):
+    return value.strip() if isinstance(value, str) else value
+
+
+def positive(node, value):
+    if value['a'] < 0:
+        e = c.Invalid(node, 'Negative sum')
+        e['a'] = 'Must be positive'
+        raise e
+
+
+class Inner(c.MappingSchema):
+    a = c.SchemaNode(c.Int())
+    b = c.SchemaNode(c.Str(), missing=c.drop, preparer=strip,
+                     validator=c.Length(max=3))
+
+
+class Tags(c.SequenceSchema):
+    tag = c.SchemaNode(c.Str(), validator=c.Length(min=2))
+
+
+class Outer(c.MappingSchema):
+    name = c.SchemaNode(c.Str(), validator=c.Length(min=2, max=5))
+    age = c.SchemaNode(c.Int(), missing=None, validator=c.Range(min=0))
+    flag = c.SchemaNode(Trilean(), missing=None)
+    inner = Inner(validator=positive)
+    optional = Inner(missing=c.drop)
+    tags = Tags(missing=())
+
+
+class TestCompiledSchema(DifferentialHarness, unittest.TestCase):
+    values = dict(
+        name=[c.null, '', 'Jo', 'Joanna', 3],
+        age=[c.null, '', '42', '-1', 'x'],
+        flag=[c.null, 'true', 'false', '0'],
+        inner=[c.null, 'nomapping', {}, dict(a='1', b=' xy '),
+               dict(a='-3', b='long one'), dict(a='z')],
+        optional=[c.null, dict(a='7')],
+        tags=[c.null, ['ab', 'c'], 'notalist'],
+    )
+
+    def payloads(self, values, count=400):
+        rand = random.Random(42)
+        keys = sorted(values)
+        for _ in range(count):
+            yield dict((k, rand.choice(values[k])) for k in keys
+                       if rand.random() > 0.1)
+        yield c.null
+        yield 'not a mapping'
+
+    valid_values = dict(
+        name=['Jo', 'Joan'], age=[c.null, '42'], flag=[c.null, 'false'],
+        inner=[dict(a='1', b=' xy '), dict(a='2')],
+        optional=[c.null, dict(a='7')], tags=[c.null, ['ab', 'cd']],
+    )
+
+    def test_against_interpreted_schema(self):
+        self.assertSameBehaviour(Outer(), self.payloads(self.values))
+        self.assertSameBehaviour(Outer(), self.payloads(self.valid_values))
+
+    def test_get_compiled_with_another_instance(self):
+        compiled = get_compiled(Outer())
+        other = Outer()
+        self.assertIs(get_compiled(other), compiled)
+        for cstruct in self.payloads(self.values, count=50):
+            self.assertEqual(
+                outcome(lambda cs: compiled.deserialize(cs, other), cstruct),
+                outcome(other.deserialize, cstruct))
+
+    def test_get_compiled_sees_validators_below_the_top_level(self):
+        plain = c.SchemaNode(c.Mapping())
+        plain.add(c.SchemaNode(c.Int(), name='a'))
+        limited = c.SchemaNode(c.Mapping())
+        limited.add(c.SchemaNode(c.Int(), name='a',
+                                 validator=c.Range(max=5)))
+        self.assertEqual(get_compiled(plain).deserialize(
+            dict(a='10'), plain), dict(a=10))
+        self.assertIsNot(get_compiled(limited), get_compiled(plain))
+        with self.assertRaises(c.Invalid):
+            get_compiled(limited).deserialize(dict(a='10'), limited)
+
+    def test_bound_schema_with_deferreds(self):
+        @c.deferred
+        def max_age(node, kw):
+            return c.Range(max=kw['max_age'])
+
+        class Deferring(c.MappingSchema):
+            age = c.SchemaNode(c.Int(), validator=max_age)
+        unbound = Deferring()
+        bound = unbound.bind(max_age=10)
+        payloads = [dict(age=a) for a in ('5', '11', 'x')] + [{}]
+        self.assertSameBehaviour(bound, payloads)
+        self.assertSameBehaviour(unbound, payloads)
+        # Both instances share the generated code
+        self.assertIs(compile_schema(bound).function,
+                      compile_schema(unbound).function)
+
+    def test_schemaker_schema(self):
+        from deform_bootstrap_extra.schemaker import Schemaker
+        schema = Schemaker().schema_for(Person)
+        values = [c.null, '', '1', 'Ann', 'x' * 90, 'female', 'other']
+        payloads = [dict(zip(('id', 'name', 'email', 'gender'), combo))
+                    for combo in product(values, repeat=4)]
+        self.assertSameBehaviour(schema, payloads)
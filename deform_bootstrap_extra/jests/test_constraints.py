@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+'''Tests for the export of constraints to the browser.'''
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+from datetime import datetime
+import json
+import re
+import colander as c
+import deform as d
+from deform_bootstrap_extra.constraints import manifest, node_constraints
+from deform_bootstrap_extra.schema import from_now_on
+from .test_views import ContactView, ViewTestCase
+
+
+class EventSchema(c.MappingSchema):
+    title = c.SchemaNode(c.Str(), validator=c.Length(min=2, max=40),
+                         widget=d.widget.TextInputWidget(size=40))
+    code = c.SchemaNode(c.Str(), validator=c.Regex('[A-Z]{3}'),
+                        missing=c.null, widget=d.widget.TextInputWidget(
+                            size=3))
+    kind = c.SchemaNode(c.Str(), validator=c.OneOf(['talk', 'panel']),
+                        widget=d.widget.TextInputWidget(size=10))
+    notes = c.SchemaNode(c.Str(), missing='', validator=c.Length(max=500),
+                         widget=d.widget.TextAreaWidget())
+    starts = c.SchemaNode(c.DateTime(default_tzinfo=None),
+                          validator=from_now_on)
+    agree = c.SchemaNode(c.Bool(), validator=c.OneOf([True]),
+                         widget=d.widget.CheckboxWidget())
+
+
+class TestConstraints(ViewTestCase):
+    def test_node_constraints(self):
+        schema = EventSchema().bind(now=datetime(2014, 1, 2, 3, 4))
+        self.assertEqual(dict(node_constraints(schema['title'])), dict(
+            required=True, minlength=2, maxlength=40))
+        code = node_constraints(schema['code'])
+        self.assertEqual(list(code), ['pattern'])
+        self.assertTrue(re.match('^(?:' + code['pattern'] + ')$', 'ABCd'))
+        self.assertEqual(node_constraints(schema['kind'])['choices'],
+                         ['talk', 'panel'])
+        self.assertEqual(node_constraints(schema['starts'])['min'],
+                         '2014-01-02T03:04')
+        self.assertEqual(dict(node_constraints(schema['agree'])),
+                         dict(required=True))
+        self.assertEqual(dict(node_constraints(EventSchema()['starts'])),
+                         dict(required=True))  # unbound deferred
+
+    def test_rendered_attributes_and_manifest(self):
+        self.request()
+        schema = EventSchema().bind(now=datetime(2014, 1, 2, 3, 4))
+        form = d.Form(schema, client_constraints=True)
+        html = form.render()
+        self.assertIn('minlength="2"', html)
+        self.assertIn('maxlength="500"', html)  # in the textarea
+        self.assertTrue(re.search(
+            r'type="checkbox"[^>]*required="true"', html))
+        data = re.search(r'<script type="application/json" '
+                         r'class="deform-constraints">(.*?)</script>',
+                         html, re.S).group(1)
+        self.assertEqual(json.loads(data), json.loads(json.dumps(
+            manifest(form, form.translate), default=str)))
+        self.assertEqual(json.loads(data)[form['kind'].oid]['name'], 'kind')
+        self.assertEqual(json.loads(data)[form['title'].oid]['messages'], {
+            'required': 'Required',
+            'minlength': 'Shorter than minimum length 2',
+            'maxlength': 'Longer than maximum length 40'})
+        self.assertEqual(
+            json.loads(data)[form['kind'].oid]['messages']['choices'],
+            '"[0]" is not one of talk, panel')
+
+    def test_messages_are_translated(self):
+        class ConstrainedView(ContactView):
+            client_constraints = True
+        # setup_for_pyramid() only runs once per process
+        self.config.add_translation_dirs('colander:locale')
+        request = self.request()
+        request._LOCALE_ = 'pt_BR'
+        html = ConstrainedView(None, request)._deform_workflow()['form']
+        data = json.loads(re.search(
+            r'class="deform-constraints">(.*?)</script>', html,
+            re.S).group(1))
+        messages = [entry['messages'] for entry in data.values()
+                    if entry['name'] == 'name'][0]
+        self.assertEqual(messages, {'required': 'Obrigatório'})
+
+    def test_view_option(self):
+        class ConstrainedView(ContactView):
+            client_constraints = True
+        html = ConstrainedView(None, self.request())._deform_workflow()['form']
+        self.assertIn('deform-constraints', html)
+        html = ContactView(None, self.request())._deform_workflow()['form']
+        self.assertNotIn('deform-constraints', html)
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+'''Tests for the grid view.'''
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+from deform.widget import TextInputWidget
+import sqlalchemy as sa
+from sqlalchemy.orm import Session, declarative_base
+from deform_bootstrap_extra.pyramid.grid import GridDeformView
+from .test_views import ViewTestCase
+
+Base = declarative_base()
+
+
+class Product(Base):
+    __tablename__ = 'product'
+    id = sa.Column(sa.Integer, primary_key=True)
+    name = sa.Column(sa.Unicode(40), nullable=False)
+    price = sa.Column(sa.Integer)
+    active = sa.Column(sa.Boolean, nullable=False, default=True)
+
+
+class TestGridDeformView(ViewTestCase):
+    def setUp(self):
+        super(TestGridDeformView, self).setUp()
+        engine = sa.create_engine('sqlite://')
+        Base.metadata.create_all(engine)
+        db = self.db = Session(bind=engine)
+        db.add_all([Product(id=1, name='Pen', price=2),
+                    Product(id=2, name='Ink', price=None),
+                    Product(id=3, name='Old', price=9, active=False)])
+        db.flush()
+        self.queries = []
+        sa.event.listen(engine, 'before_cursor_execute',
+                        lambda *a: self.queries.append(a[2]))
+
+        class ProductGrid(GridDeformView):
+            model_class = Product
+            row_columns = ('name', 'price')
+            row_overrides = dict(price=dict(widget=TextInputWidget(size=5)))
+
+            def _query(self):
+                return self.db.query(Product).filter_by(active=True) \
+                    .order_by(Product.id)
+        ProductGrid.db = db
+        self.view_class = ProductGrid
+
+    def row(self, id, name, price):
+        return [('__start__', 'row:mapping'), ('id', id), ('name', name),
+                ('price', price), ('__end__', 'row:mapping')]
+
+    def post(self, *rows):
+        controls = [('csrf_token', 'a' * 40),
+                    ('__start__', 'rows:sequence')]
+        for row in rows:
+            controls.extend(self.row(*row))
+        controls.append(('__end__', 'rows:sequence'))
+        view = self.view_class(None, self.request(method='POST'))
+        return view, view._deform_workflow(controls=controls)
+
+    def test_get_renders_all_rows_from_one_query(self):
+        view = self.view_class(None, self.request())
+        form = view._deform_workflow()['form']
+        self.assertEqual(len(self.queries), 1)
+        self.assertIn('value="Pen"', form)
+        self.assertIn('value="Ink"', form)
+        self.assertNotIn('value="Old"', form)
+        self.assertEqual(form.count('name="id"'), 2)
+
+    def test_post_updates_only_changed_rows(self):
+        view, result = self.post(('1', 'Pen', '3'), ('2', 'Ink', ''),
+                                 ('3', 'Hacked', '1'))
+        self.assertEqual(view.status, 'valid')
+        self.assertEqual(result['changed'], 1)
+        updates = [q for q in self.queries if q.startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(self.db.get(Product, 1).price, 3)
+        self.assertEqual(self.db.get(Product, 3).name, 'Old')  # inactive
+
+        view, result = self.post(('1', '', '3'))
+        self.assertEqual(view.status, 'invalid')
+        self.assertIn('Required', result['form'])
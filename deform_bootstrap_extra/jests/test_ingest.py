@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+'''Tests for the batched ingestion of validated rows.'''
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+import unittest
+import colander as c
+import sqlalchemy as sa
+from sqlalchemy.orm import Session, declarative_base
+from deform_bootstrap_extra.ingest import Ingestor
+from deform_bootstrap_extra.schemaker import DBUniqueCheck
+
+Base = declarative_base()
+
+
+class Book(Base):
+    __tablename__ = 'book'
+    id = sa.Column(sa.Integer, primary_key=True)
+    isbn = sa.Column(sa.Unicode(20), unique=True)
+    title = sa.Column(sa.Unicode(80), nullable=False)
+
+
+class TestIngestor(unittest.TestCase):
+    def setUp(self):
+        self.engine = sa.create_engine('sqlite://')
+        Base.metadata.create_all(self.engine)
+        self.db = Session(bind=self.engine)
+        self.db.add(Book(id=1, isbn='X-1', title='Old'))
+        self.db.flush()
+        self.queries = []
+        sa.event.listen(self.engine, 'before_cursor_execute',
+                        self._count)
+
+    def _count(self, conn, cursor, statement, *a):
+        if statement.startswith('SELECT'):
+            self.queries.append(statement)
+
+    def test_batches_with_set_based_unique_checks(self):
+        ingestor = Ingestor(self.db, Book, batch_size=3, unique=[
+            DBUniqueCheck(self.db, Book, Book.isbn, case_sensitive=False)])
+        rows = [dict(isbn='x-1', title='Taken'),
+                dict(isbn='a', title='A'),
+                dict(isbn='A', title='Same as the previous row'),
+                dict(isbn='b', title='B'),
+                dict(isbn=c.null, title='No ISBN')]
+        failures = list(ingestor.ingest_appstructs(rows))
+        self.assertEqual([index for index, errors in failures], [0, 2])
+        self.assertEqual(failures[0][1],
+                         {'isbn': 'A book already exists with that isbn'})
+        self.assertEqual(len(self.queries), 2)  # one per batch
+        self.assertEqual(ingestor.inserted, 3)
+        self.assertEqual(self.db.query(Book).count(), 4)
+
+    def test_upsert_and_database_errors(self):
+        ingestor = Ingestor(self.db, Book, unique=[Book.isbn], upsert=True)
+        results = [(0, dict(id=1, isbn='X-1', title='New'), None),
+                   (1, None, {'title': 'Required'}),
+                   (2, dict(id=2, isbn='Y'), None),  # no title
+                   (3, dict(id=3, isbn='Z', title='Z'), None)]
+        failures = list(ingestor.ingest(results))
+        self.assertEqual([index for index, errors in failures], [1, 2])
+        self.assertIn('NOT NULL', failures[1][1][''])
+        self.assertEqual((ingestor.inserted, ingestor.updated), (1, 1))
+        self.db.expire_all()
+        self.assertEqual(self.db.query(Book.title).order_by(Book.id).all(),
+                         [('New',), ('Z',)])
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+'''Tests for preloading in the master process of a preforking server.'''
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+import gc
+import unittest
+import colander as c
+from pyramid import testing
+from pyramid.interfaces import ILocalizer
+from deform_bootstrap_extra.binding import _plans
+from deform_bootstrap_extra.pyramid.preload import preload
+from .test_views import ContactSchema, ContactView
+
+
+class TestPreload(unittest.TestCase):
+    def setUp(self):
+        self.config = testing.setUp()
+        # setup_for_pyramid() only runs once per process
+        self.config.add_translation_dirs('colander:locale')
+
+    def tearDown(self):
+        if hasattr(gc, 'unfreeze'):
+            gc.unfreeze()
+        testing.tearDown()
+
+    def test_preload(self):
+        _plans.pop((ContactSchema, (('validator', None),)), None)
+        stats = preload(self.config, schemas=[ContactView, ContactSchema()],
+                        locales=['pt_BR'])
+        self.assertGreater(stats['templates'], 0)
+        self.assertEqual((stats['schemas'], stats['locales']), (2, 1))
+        # ContactView does not bind copy-on-write, so it needs no plan
+        self.assertNotIn((ContactSchema, (('validator', None),)), _plans)
+        localizer = self.config.registry.queryUtility(
+            ILocalizer, name='pt_BR')
+        self.assertNotEqual(localizer.translate(c._('Required')), 'Required')
+        if hasattr(gc, 'freeze'):
+            self.assertGreater(stats['frozen'], 0)
+
+    def test_plan_of_copy_on_write_views(self):
+        from itertools import count
+        from deform_bootstrap_extra import binding
+        from deform_bootstrap_extra.pyramid.preload import preload_schema
+
+        class CowSchema(ContactSchema):
+            pass
+
+        class CowView(ContactView):
+            schema = CowSchema
+            copy_on_write_bind = True
+        preload_schema(CowView)
+        plan = _plans[(CowSchema, (('validator', None),))]
+        built = []
+        original = binding.BindPlan
+
+        class CountingPlan(original):
+            def __init__(self, template):
+                built.append(template)
+                original.__init__(self, template)
+        binding.BindPlan = CountingPlan
+        try:
+            request = testing.DummyRequest()
+            request.session['_csrft_'] = 'a' * 40
+            request.deform_field_counter = count()
+            schema = CowView(None, request).schema_instance
+        finally:
+            binding.BindPlan = original
+        self.assertEqual(built, [])  # the first request builds no plan
+        self.assertTrue(plan.is_copied(schema['csrf_token']))
+
+    def test_models_need_a_schemaker(self):
+        with self.assertRaises(ValueError):
+            preload(self.config, models=[object], freeze=False)
+
+    def test_deferred_validator_bound_to_none(self):
+        from deform_bootstrap_extra.compiler import get_compiled
+        from deform_bootstrap_extra.pyramid.preload import preload_schema
+
+        @c.deferred
+        def maybe(node, kw):
+            return kw.get('validator')
+
+        class MaybeSchema(c.MappingSchema):
+            age = c.SchemaNode(c.Int(), validator=maybe)
+        template = preload_schema(MaybeSchema)
+        bound = template.bind()
+        self.assertEqual(get_compiled(template).deserialize(
+            dict(age='3'), bound), dict(age=3))
+
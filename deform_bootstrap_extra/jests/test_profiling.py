@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+'''Tests for the render and validation profiler.'''
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+import unittest
+import colander as c
+import deform as d
+from deform.template import ZPTRendererFactory
+from pyramid import testing
+from deform_bootstrap_extra.profiling import Profiler
+
+
+class AddressSchema(c.MappingSchema):
+    street = c.SchemaNode(c.Str(), widget=d.widget.TextInputWidget(size=20))
+
+
+class PersonSchema(c.MappingSchema):
+    email = c.SchemaNode(c.Str(), validator=c.Email(),
+                         widget=d.widget.TextInputWidget(size=20))
+    address = AddressSchema()
+
+
+class TestProfiler(unittest.TestCase):
+    def setUp(self):
+        self.config = testing.setUp()
+        self.config.include('deform_bootstrap_extra')
+
+    def tearDown(self):
+        testing.tearDown()
+
+    def test_render_and_deserialize(self):
+        render = ZPTRendererFactory.__call__
+        deserialize = c.SchemaNode.deserialize
+        form = d.Form(PersonSchema())
+        with Profiler() as profiler:
+            self.assertIsNot(ZPTRendererFactory.__call__, render)
+            html = form.render()
+            with self.assertRaises(d.ValidationFailure):
+                form.validate([
+                    ('email', 'nope'), ('__start__', 'address:mapping'),
+                    ('street', 'Main St.'), ('__end__', 'address:mapping')])
+        self.assertIs(ZPTRendererFactory.__call__, render)
+        self.assertIs(c.SchemaNode.deserialize, deserialize)
+        # No longer profiled
+        self.assertEqual(d.Form(PersonSchema()).render(), html)
+
+        keys = set((kind, name) for kind, name, calls, cumulative, own
+                   in profiler.rows())
+        for key in [('render', '(form)'), ('render', 'email'),
+                    ('render', 'address.street'),
+                    ('deserialize', '(schema)'),
+                    ('deserialize', 'address.street')]:
+            self.assertIn(key, keys)
+        templates = [row[1] for row in profiler.rows(kind='template')]
+        self.assertIn('deform_bootstrap_extra/templates/textinput.pt',
+                      templates)
+
+        rows = profiler.rows(sort='cumulative')
+        self.assertEqual(rows[0][3], max(row[3] for row in rows))
+        form_render = [r for r in rows if r[:2] == ('render', '(form)')][0]
+        self.assertGreaterEqual(form_render[3], form_render[4])
+        self.assertIn('calls', profiler.report(sort='self', limit=3))
+
+        stacks = list(profiler.folded_stacks())
+        self.assertTrue(any(line.startswith('form.pt;') for line in stacks))
+        self.assertTrue(all(line.rsplit(' ', 1)[1].isdigit()
+                            for line in stacks))
+        total = sum(own for own in profiler.folded.values())
+        self.assertAlmostEqual(total, sum(
+            row[4] for row in profiler.rows(kind='template')) + sum(
+            row[4] for row in profiler.rows(kind='deserialize')), places=6)
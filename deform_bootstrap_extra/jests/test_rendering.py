@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+'''Tests for the template cache of the deform renderers.'''
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+import shutil
+import tempfile
+import unittest
+from chameleon.template import BaseTemplate
+import deform as d
+from pyramid.asset import abspath_from_asset_spec
+from deform_bootstrap_extra.rendering import (
+    set_template_cache, template_names, warm_templates)
+
+
+def renderers():
+    '''Return a new default renderer and a new modal renderer.'''
+    return [d.ZPTRendererFactory([abspath_from_asset_spec(spec) for spec in (
+        first, 'deform_bootstrap:templates', 'deform:templates')])
+        for first in ('deform_bootstrap_extra:templates',
+                      'deform_bootstrap_extra:templates-modal')]
+
+
+class TestTemplateCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def warm(self):
+        '''Warm two new renderers; return the number of templates
+        and how many of them were compiled.
+        '''
+        both = renderers()
+        loader = set_template_cache(both, self.cache_dir)
+        built = []
+        build = loader.build
+
+        def counting_build(source, filename):
+            built.append(filename)
+            return build(source, filename)
+        loader.build = counting_build
+        return warm_templates(*both), len(built)
+
+    def test_renderers_share_compiled_templates(self):
+        default_loader = BaseTemplate.loader
+        templates, built = self.warm()
+        self.assertEqual(templates, sum(
+            len(list(template_names(r.loader.search_path)))
+            for r in renderers()))
+        # The templates found by both renderers are compiled only once
+        self.assertLess(built, templates)
+        self.assertIs(BaseTemplate.loader, default_loader)
+
+        # Another process finds them all in the cache directory
+        self.assertEqual(self.warm(), (templates, 0))
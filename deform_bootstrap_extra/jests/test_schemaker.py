@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+
+'''Tests for the Schemaker.'''
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+import unittest
+import colander as c
+import sqlalchemy as sa
+from sqlalchemy.orm import declarative_base
+from deform_bootstrap_extra.schemaker import Schemaker
+
+Base = declarative_base()
+
+
+class Person(Base):
+    __tablename__ = 'person'
+    id = sa.Column(sa.Integer, primary_key=True)
+    name = sa.Column(sa.Unicode(40), nullable=False)
+    email = sa.Column(sa.Unicode(80), info={'title': 'E-mail'})
+    gender = sa.Column(sa.Enum('female', 'male', name='gender'))
+
+
+class TestSchemaFor(unittest.TestCase):
+    def setUp(self):
+        self.sm = Schemaker()
+
+    def test_builds_mapping_schema(self):
+        schema = self.sm.schema_for(Person, excludes=['id'])
+        self.assertIsInstance(schema, c.MappingSchema)
+        self.assertEqual([n.name for n in schema.children],
+                         ['name', 'email', 'gender'])
+        self.assertEqual(schema['email'].title, 'E-mail')
+        self.assertEqual(schema.deserialize(dict(name='Ann', gender='female')),
+                         dict(name='Ann', email=c.null, gender='female'))
+
+    def test_includes_and_overrides(self):
+        schema = self.sm.schema_for(Person, includes=['email', 'name'],
+                                    overrides={'name': {'title': 'Full'}})
+        self.assertEqual([n.name for n in schema.children], ['email', 'name'])
+        self.assertEqual(schema['name'].title, 'Full')
+
+    def test_cache_hands_out_clones(self):
+        first = self.sm.schema_for(Person)
+        first['name'].title = 'Mutated'
+        second = self.sm.schema_for(Person)
+        self.assertIsNot(first, second)
+        self.assertEqual(second['name'].title, 'Name')
+        self.assertEqual(len(self.sm._schema_cache), 1)
+        self.sm.schema_for(Person, overrides={'name': {'title': 'Other'}})
+        self.assertEqual(len(self.sm._schema_cache), 2)
+
+    def test_cache_dropped_when_mappers_configure(self):
+        self.sm.schema_for(Person)
+
+        class Pet(Base):
+            __tablename__ = 'pet'
+            id = sa.Column(sa.Integer, primary_key=True)
+        sa.orm.configure_mappers()
+        self.assertEqual(len(self.sm._schema_cache), 0)
+
+
+class Article(Base):
+    __tablename__ = 'article'
+    id = sa.Column(sa.BigInteger, primary_key=True)
+    views = sa.Column(sa.SmallInteger, nullable=False, default=0)
+    body = sa.Column(sa.UnicodeText)
+
+
+class TestDispatch(unittest.TestCase):
+    def test_subclasses_resolve_through_the_mro(self):
+        import deform.widget as w
+        sm = Schemaker()
+        schema = sm.schema_for(Article)
+        self.assertIsInstance(schema['views'].typ, c.Integer)
+        self.assertIsInstance(schema['body'].typ, c.String)
+        self.assertIsInstance(schema['body'].widget, w.TextAreaWidget)
+
+    def test_changing_the_maps_clears_the_caches(self):
+        sm = Schemaker()
+        sm.schema_for(Article)
+        sm.type_map[sa.SmallInteger] = lambda column: (c.String(), [])
+        self.assertEqual(len(sm._schema_cache), 0)
+        self.assertIsInstance(sm.schema_for(Article)['views'].typ, c.String)
+        sm.widget_strategies = {}
+        self.assertEqual(len(sm._schema_cache), 0)
+        self.assertIsNone(sm.schema_for(Article)['body'].widget)
+
+
+class TestDeferredAll(unittest.TestCase):
+    def test_all_is_reused_without_deferred_members(self):
+        from deform_bootstrap_extra.schemaker import DeferredAll
+        static = DeferredAll(c.Length(max=5), c.Email())
+        self.assertIs(static(None, {}), static(None, {}))
+        static.validators.append(c.Length(min=1))
+        self.assertEqual(len(static(None, {}).validators), 3)
+
+        dynamic = DeferredAll(c.Email(), c.deferred(
+            lambda node, kw: c.Length(max=kw['max'])))
+        one, two = dynamic(None, dict(max=1)), dynamic(None, dict(max=2))
+        self.assertIsNot(one, two)
+        self.assertEqual(two.validators[1].max, 2)
+
+
+class TestUniqueCheckBatch(unittest.TestCase):
+    def setUp(self):
+        from sqlalchemy.orm import Session
+        engine = sa.create_engine('sqlite://')
+        Base.metadata.create_all(engine)
+        self.db = Session(bind=engine)
+        self.db.add(Person(name='Ann', email='ann@example.com'))
+        self.db.flush()
+        self.queries = []
+        sa.event.listen(engine, 'before_cursor_execute',
+                        lambda *a: self.queries.append(a[2]))
+
+    def _schema(self):
+        from deform_bootstrap_extra.schemaker import DBUniqueCheck
+
+        class PersonSchema(c.MappingSchema):
+            name = c.SchemaNode(c.Str(), validator=DBUniqueCheck(
+                self.db, Person, Person.name))
+            email = c.SchemaNode(c.Str(), validator=c.All(
+                c.Email(), DBUniqueCheck(self.db, Person, Person.email,
+                                         case_sensitive=False)))
+            nick = c.SchemaNode(c.Str(), validator=c.Length(max=3))
+        return PersonSchema()
+
+    def test_errors_on_the_right_nodes_in_one_query(self):
+        from deform_bootstrap_extra.schemaker import UniqueCheckBatch
+        schema = self._schema()
+        with self.assertRaises(c.Invalid) as cm:
+            UniqueCheckBatch(self.db).validate(schema, dict(
+                name='Ann', email='ANN@example.com', nick='toolong'))
+        self.assertEqual(set(cm.exception.asdict()),
+                         set(['name', 'email', 'nick']))
+        self.assertEqual(len(self.queries), 1)
+
+    def test_valid_and_unbatched(self):
+        from deform_bootstrap_extra.schemaker import UniqueCheckBatch
+        schema = self._schema()
+        cstruct = dict(name='Bob', email='bob@example.com', nick='bob')
+        self.assertEqual(UniqueCheckBatch(self.db).validate(schema, cstruct),
+                         cstruct)
+        with self.assertRaises(c.Invalid):  # outside of a batch
+            schema.deserialize(dict(cstruct, name='Ann'))
+
+    def test_views_batch_the_checks(self):
+        from itertools import count
+        import deform as d
+        from pyramid import testing
+        from pyramid_deform import CSRFSchema
+        from deform_bootstrap_extra.pyramid.views import BaseDeformView
+        from deform_bootstrap_extra.schemaker import (
+            DBUniqueCheck, DeferredDBCheck)
+
+        def unique(field, **kw):
+            return DeferredDBCheck(DBUniqueCheck, model_class=Person,
+                                   field=field, **kw)
+
+        class PersonSchema(CSRFSchema):
+            name = c.SchemaNode(c.Str(), validator=unique(Person.name),
+                                widget=d.widget.TextInputWidget(size=20))
+            email = c.SchemaNode(c.Str(), validator=unique(
+                Person.email, case_sensitive=False),
+                widget=d.widget.TextInputWidget(size=20))
+
+        class PersonView(BaseDeformView):
+            schema = PersonSchema
+            db = self.db
+        config = testing.setUp()
+        self.addCleanup(testing.tearDown)
+        config.include('deform_bootstrap_extra')
+        post = dict(name='Ann', email='ANN@example.com', csrf_token='a' * 40)
+        for workflow in ('_deform_workflow', '_colander_workflow'):
+            request = testing.DummyRequest(post=post)
+            request.session['_csrft_'] = 'a' * 40
+            request.deform_field_counter = count()
+            config.begin(request)
+            del self.queries[:]
+            result = getattr(PersonView(None, request), workflow)()
+            self.assertEqual(len(self.queries), 1)
+            if workflow == '_deform_workflow':
+                self.assertEqual(result['form'].count('already exists'), 2)
+            else:
+                self.assertEqual(sorted(result['errors']),
+                                 ['email', 'name'])
+
+
+class Country(Base):
+    __tablename__ = 'country'
+    code = sa.Column(sa.Unicode(2), primary_key=True)
+    name = sa.Column(sa.Unicode(40), nullable=False)
+
+
+class Language(Base):
+    __tablename__ = 'language'
+    id = sa.Column(sa.Integer, primary_key=True)
+    name = sa.Column(sa.Unicode(40), nullable=False)
+
+
+class Author(Base):
+    __tablename__ = 'author'
+    id = sa.Column(sa.Integer, primary_key=True)
+    country_code = sa.Column(sa.ForeignKey('country.code'), nullable=False)
+    language_id = sa.Column(sa.ForeignKey('language.id'),
+                            info={'label_column': 'name'})
+
+
+class TestForeignKeyChoices(unittest.TestCase):
+    def setUp(self):
+        from sqlalchemy.orm import Session
+        engine = sa.create_engine('sqlite://')
+        Base.metadata.create_all(engine)
+        self.db = Session(bind=engine)
+        self.db.add_all([Country(code='BR', name='Brazil'),
+                         Country(code='AR', name='Argentina'),
+                         Language(id=1, name='Portuguese')])
+        self.db.flush()
+        self.queries = []
+        sa.event.listen(engine, 'before_cursor_execute',
+                        lambda *a: self.queries.append(a[2]))
+        self.sm = Schemaker()
+        self.sm.foreign_key_choices = True
+
+    def test_widgets_and_validators_from_cached_choices(self):
+        schema = self.sm.schema_for(Author, excludes=['id']).bind(db=self.db)
+        self.assertEqual(schema['country_code'].widget.values, [
+            ('', '- Select -'), ('AR', 'Argentina'), ('BR', 'Brazil')])
+        self.assertEqual(schema['language_id'].widget.values,
+                         [('', '- Select -'), ('1', 'Portuguese')])
+        self.assertEqual(len(self.queries), 2)  # one per lookup table
+        self.assertEqual(schema.deserialize(dict(
+            country_code='BR', language_id='1')),
+            dict(country_code='BR', language_id=1))
+        with self.assertRaises(c.Invalid) as cm:
+            schema.deserialize(dict(country_code='XX', language_id='2'))
+        self.assertEqual(set(cm.exception.asdict()),
+                         set(['country_code', 'language_id']))
+
+        self.sm.schema_for(Author, excludes=['id']).bind(db=self.db)
+        self.assertEqual(len(self.queries), 2)  # from the cache
+
+        self.db.add(Country(code='PT', name='Portugal'))
+        self.db.flush()
+        self.sm.choice_cache.invalidate(Country)
+        schema = self.sm.schema_for(Author, excludes=['id']).bind(db=self.db)
+        self.assertEqual(len(self.queries), 4)  # the INSERT and a SELECT
+        self.assertEqual(schema.deserialize(dict(country_code='PT')),
+                         dict(country_code='PT', language_id=c.null))
+
+    def test_opt_in_and_fallback_without_db(self):
+        import deform.widget as w
+        plain = Schemaker().schema_for(Author, excludes=['id'])
+        self.assertIsInstance(plain['country_code'].widget, w.TextInputWidget)
+        self.assertIsNone(getattr(plain['country_code'], 'fk_choices', None))
+
+        schema = self.sm.schema_for(Author, excludes=['id']).bind(request=1)
+        self.assertIsInstance(schema['country_code'].widget,
+                              w.TextInputWidget)
+        self.assertEqual(schema.deserialize(dict(country_code='XX')),
+                         dict(country_code='XX', language_id=c.null))
+        self.assertEqual(self.queries, [])
+
+    def test_equal_filters_share_a_list(self):
+        cache = self.sm.choice_cache
+        for i in range(3):
+            self.sm.schema_for(Author, excludes=['id'], overrides=dict(
+                country_code=dict(choices_filter=Country.name != 'x'))
+            ).bind(db=self.db)
+        self.sm.schema_for(Author, excludes=['id'], overrides=dict(
+            country_code=dict(choices_filter=Country.name != 'y'))
+        ).bind(db=self.db)
+        self.assertEqual(len(cache._entries), 3)  # x, y and language
+        self.assertEqual(cache.misses, 3)
+
+    def test_equal_filters_share_a_schema(self):
+        cache = self.sm._schema_cache
+        size = len(cache)
+        for name in ('x', 'x', 'y'):  # a new expression each time
+            self.sm.schema_for(Author, excludes=['id'], overrides=dict(
+                country_code=dict(choices_filter=Country.name != name)))
+        self.assertEqual(len(cache), size + 2)
+
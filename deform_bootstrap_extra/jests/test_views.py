@@ -0,0 +1,432 @@
+# -*- coding: utf-8 -*-
+
+'''Tests for the abstract base views.'''
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+from itertools import count
+import unittest
+import colander as c
+import deform as d
+from pyramid import testing
+from pyramid_deform import CSRFSchema
+from deform_bootstrap_extra.pyramid.views import (
+    BaseDeformView, RenderedFormCache)
+
+
+class ContactSchema(CSRFSchema):
+    name = c.SchemaNode(c.Str(), widget=d.widget.TextInputWidget(size=20))
+    email = c.SchemaNode(c.Str(), validator=c.Email(),
+                         widget=d.widget.TextInputWidget(size=30))
+
+
+class ContactView(BaseDeformView):
+    schema = ContactSchema
+
+    def _valid(self, form, controls):
+        return dict(valid=controls)
+
+
+class ViewTestCase(unittest.TestCase):
+    def setUp(self):
+        self.config = testing.setUp()
+        self.config.include('deform_bootstrap_extra')
+
+    def tearDown(self):
+        testing.tearDown()
+
+    def request(self, token='a' * 40, start=0, **kw):
+        request = testing.DummyRequest(**kw)
+        request.session['_csrft_'] = token
+        request.deform_field_counter = count(start)
+        self.config.begin(request)
+        return request
+
+
+class TestRenderedFormCache(ViewTestCase):
+    def test_blank_form_comes_from_the_cache(self):
+        class CachedView(ContactView):
+            rendered_form_cache = RenderedFormCache(maxsize=2)
+        cache = CachedView.rendered_form_cache
+        CachedView(None, self.request())._deform_workflow()
+        self.assertEqual((cache.hits, cache.misses), (0, 1))
+
+        cached_request = self.request(token='b' * 40, start=5)
+        cached = CachedView(None, cached_request)._deform_workflow()['form']
+        plain_request = self.request(token='b' * 40, start=5)
+        plain = ContactView(None, plain_request)._deform_workflow()['form']
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertEqual(cached, plain)
+        self.assertIn('b' * 40, cached)
+        self.assertNotIn('a' * 40, cached)
+        # The counter is where it would be without the cache
+        self.assertEqual(next(cached_request.deform_field_counter),
+                         next(plain_request.deform_field_counter))
+
+        cache.invalidate(ContactSchema)
+        CachedView(None, self.request())._deform_workflow()
+        self.assertEqual(cache.misses, 2)
+
+    def test_same_oids_as_without_the_cache(self):
+        class TagsSchema(ContactSchema):
+            tags = c.SchemaNode(c.Sequence(), c.SchemaNode(
+                c.Str(), name='tag', widget=d.widget.TextInputWidget(
+                    size=10)), widget=d.widget.SequenceWidget(min_len=1))
+
+        class PlainView(ContactView):
+            schema = TagsSchema
+
+        class CachedView(PlainView):
+            rendered_form_cache = RenderedFormCache()
+        cached_request = self.request(start=3)
+        plain_request = self.request(start=3)
+        for i in range(2):  # a miss, then a hit
+            # Two forms in the same page share the counter
+            for j in range(2):
+                cached = CachedView(
+                    None, cached_request)._deform_workflow()['form']
+                plain = PlainView(
+                    None, plain_request)._deform_workflow()['form']
+                self.assertEqual(cached, plain)
+            self.assertEqual(next(cached_request.deform_field_counter),
+                             next(plain_request.deform_field_counter))
+        self.assertEqual(CachedView.rendered_form_cache.hits, 3)
+
+    def test_subclasses_have_their_own_cache(self):
+        class CachedView(ContactView):
+            rendered_form_cache = RenderedFormCache(maxsize=2)
+
+        class ConstrainedView(CachedView):
+            client_constraints = True
+        cache = CachedView.rendered_form_cache
+        CachedView(None, self.request())._deform_workflow()
+        html = ConstrainedView(None, self.request())._deform_workflow()
+        own = ConstrainedView.rendered_form_cache
+        self.assertIsNot(own, cache)
+        self.assertEqual((own.maxsize, own.misses), (2, 1))
+        self.assertEqual((cache.hits, cache.misses), (0, 1))
+
+        class SharingView(CachedView):
+            client_constraints = True
+            rendered_form_cache = cache
+        SharingView(None, self.request())._deform_workflow()
+        self.assertEqual(cache.misses, 2)  # the key differs
+        self.assertIn('deform-constraints', html['form'])
+
+
+class TestTranslationCache(ViewTestCase):
+    def test_buttons_and_terms_are_cached_per_locale(self):
+        from deform_bootstrap_extra.pyramid import (
+            TranslationCache, _, button, translation_cache, translator)
+        translation_cache.clear()
+        request = self.request()
+        before = translation_cache.stats()
+        self.assertEqual(button(_('send'), request=request).title, 'Send')
+        self.assertEqual(button(_('send'), request=request).title, 'Send')
+        self.assertEqual(translator(_('send')), 'send')
+        stats = translation_cache.stats()
+        self.assertEqual(stats['hits'] - before['hits'], 1)
+        self.assertEqual(stats['misses'] - before['misses'], 2)
+        self.assertEqual(stats['size'], 2)
+
+        small = TranslationCache(maxsize=1)
+        localizer = request.localizer
+        small.translate(localizer, _('a'))
+        small.translate(localizer, _('b'))
+        small.translate(localizer, _('${x}', mapping={'x': []}))
+        self.assertEqual(small.stats(), dict(hits=0, misses=3, size=1))
+
+
+class TestStreaming(ViewTestCase):
+    def test_streamed_form_equals_rendered_form(self):
+        from deform_bootstrap_extra.rendering import StreamingForm
+
+        class StreamingView(ContactView):
+            streaming = True
+        streamed = StreamingView(None, self.request())._deform_workflow()
+        rendered = ContactView(None, self.request())._deform_workflow()
+        self.assertIsInstance(streamed['form'], StreamingForm)
+        chunks = list(streamed['form'])
+        self.assertEqual(len(chunks), 2 * 3 + 1)  # 3 children in the form
+        self.assertEqual(''.join(chunks), rendered['form'])
+
+        post = dict(name='', email='bad', csrf_token='a' * 40)
+        streamed = StreamingView(None, self.request(
+            post=post))._deform_workflow()
+        rendered = ContactView(None, self.request(
+            post=post))._deform_workflow()
+        self.assertEqual(str(streamed['form']), rendered['form'])
+        response = StreamingView(None, self.request())._form_response(
+            streamed['form'])
+        self.assertEqual(response.text, rendered['form'])
+
+    def test_response_is_translated_after_the_request_is_gone(self):
+        from pyramid.threadlocal import get_current_request, manager
+
+        class StreamingView(ContactView):
+            streaming = True
+        post = dict(name='', email='bad', csrf_token='a' * 40)
+        view = StreamingView(None, self.request(post=post))
+        response = view._form_response(view._deform_workflow()['form'])
+        rendered = ContactView(None, self.request(
+            post=post))._deform_workflow()['form']
+        manager.clear()  # as Pyramid does before the app_iter is consumed
+        self.assertEqual(b''.join(response.app_iter).decode('utf-8'),
+                         rendered)
+        self.assertIsNone(get_current_request())
+
+    def test_sequence_items_are_separate_chunks(self):
+        from deform_bootstrap_extra.rendering import StreamingForm
+
+        class Item(c.MappingSchema):
+            text = c.SchemaNode(c.Str(),
+                                widget=d.widget.TextInputWidget(size=10))
+
+        class ListSchema(c.MappingSchema):
+            items = c.SchemaNode(c.Sequence(), Item(name='item'))
+        appstruct = dict(items=[dict(text=str(i)) for i in range(20)])
+        forms = [d.Form(ListSchema(), counter=count())
+                 for i in range(2)]
+        self.request()
+        rendered = forms[0].render(appstruct)
+        forms[1].set_appstruct(appstruct)
+        chunks = list(StreamingForm(forms[1]))
+        self.assertGreater(len(chunks), 20)
+        self.assertEqual(''.join(chunks), rendered)
+
+
+class TestTiming(ViewTestCase):
+    def test_phases_are_sent_to_the_sink(self):
+        from pyramid.response import Response
+        from deform_bootstrap_extra.pyramid.timing import (
+            MultiSink, RequestAttributeSink, ServerTimingSink, StatsdSink)
+        sent = []
+
+        class TimedView(ContactView):
+            timing_sink = MultiSink(
+                RequestAttributeSink(), ServerTimingSink(),
+                StatsdSink(lambda name, ms: sent.append(name)))
+        request = self.request(post=dict(name='', email='bad',
+                                         csrf_token='a' * 40))
+        result = TimedView(None, request)._deform_workflow()
+        timer = request.deform_timer
+        self.assertEqual(list(timer.durations), [
+            'form', 'parse', 'preprocess', 'validate', 'render', 'invalid',
+            'total'])
+        self.assertEqual(timer.counts['fields'], 3)
+        # email and csrf_token
+        self.assertEqual(timer.counts['validator_nodes'], 2)
+        self.assertEqual(timer.counts['bytes'], len(result['form']))
+        self.assertEqual(sent[-1], 'deform.total')
+        response = Response()
+        for callback in request.response_callbacks:
+            callback(request, response)
+        self.assertIn('deform-validate;dur=',
+                      response.headers['Server-Timing'])
+
+    def test_timing_is_reported_when_the_workflow_raises(self):
+        from pyramid.httpexceptions import HTTPForbidden
+        from deform_bootstrap_extra.pyramid.timing import (
+            RequestAttributeSink)
+
+        class TimedView(ContactView):
+            timing_sink = RequestAttributeSink()
+        request = self.request(post=dict(name='Ann', email='ann@example.com',
+                                         csrf_token='b' * 40))
+        self.assertRaises(HTTPForbidden,
+                          TimedView(None, request)._deform_workflow)
+        self.assertIn('total', request.deform_timer.durations)
+
+    def test_colander_total_includes_parsing(self):
+        from deform_bootstrap_extra.pyramid.timing import (
+            RequestAttributeSink)
+
+        class TimedView(ContactView):
+            timing_sink = RequestAttributeSink()
+        request = self.request(post=dict(name='Ann', email='ann@example.com',
+                                         csrf_token='a' * 40))
+        TimedView(None, request)._colander_workflow()
+        durations = request.deform_timer.durations
+        self.assertEqual(list(durations), ['parse', 'deserialize', 'total'])
+        self.assertGreaterEqual(durations['total'],
+                                durations['parse'] + durations['deserialize'])
+
+    def test_no_sink_no_timer(self):
+        from deform_bootstrap_extra.pyramid.timing import NULL_TIMER
+        view = ContactView(None, self.request())
+        view._deform_workflow()
+        self.assertIs(view._timer, NULL_TIMER)
+
+
+class TestParseControls(unittest.TestCase):
+    def test_flat_parsing_equals_peppercorn(self):
+        import peppercorn
+        from deform_bootstrap_extra.pyramid.views import (
+            is_flat, parse_controls)
+        self.assertTrue(is_flat(ContactSchema()))
+        outer = c.SchemaNode(c.Mapping())
+        outer.add(ContactSchema(name='inner'))
+        self.assertFalse(is_flat(outer))
+        self.assertIs(outer._is_flat, False)  # kept in the node
+        self.assertIs(outer.clone()._is_flat, False)
+        from deform_bootstrap_extra.pyramid.views import _flat_schemas
+        self.assertIs(_flat_schemas[ContactSchema], True)
+        self.assertNotIn('_is_flat', ContactSchema().__dict__)
+        grown = ContactSchema()
+        grown.add(c.SchemaNode(c.Sequence(), c.SchemaNode(c.Str()),
+                               name='tags'))
+        self.assertFalse(is_flat(grown))
+        self.assertIs(_flat_schemas[ContactSchema], True)
+        for controls in (
+                [('name', 'a'), ('email', 'b')],
+                [('name', 'a'), ('name', 'b')],  # the last value wins
+                [],
+                [('name', 'a'), ('__start__', 'date:mapping'),
+                 ('date', '2014-01-02'), ('__end__', 'date:mapping')]):
+            self.assertEqual(parse_controls(iter(controls), flat=True),
+                             peppercorn.parse(controls))
+
+
+class TestColanderWorkflow(ViewTestCase):
+    def json_request(self, payload, **headers):
+        import json
+        return self.request(method='POST', body=json.dumps(payload).encode(),
+                            content_type='application/json', headers=headers)
+
+    def test_json_mode(self):
+        view = ContactView(None, self.json_request(
+            dict(name='Ann', email='ann@example.com'),
+            **{'X-CSRF-Token': 'a' * 40}))
+        self.assertEqual(view._colander_workflow(), dict(
+            name='Ann', email='ann@example.com', csrf_token='a' * 40))
+
+        view = ContactView(None, self.json_request(
+            dict(email='nope', csrf_token='a' * 40)))
+        result = view._colander_workflow()
+        self.assertEqual(result, {'errors': {
+            'name': 'Required', 'email': 'Invalid email address'}})
+        response = view._json_response(result, status=400)
+        self.assertEqual(response.status_int, 400)
+        self.assertEqual(response.json, result)
+
+        view = ContactView(None, self.json_request(
+            dict(name='Ann', email='ann@example.com', csrf_token='b' * 40)))
+        self.assertEqual(list(view._colander_workflow()['errors']), [''])
+
+    def test_non_object_body_is_a_bad_request(self):
+        from pyramid.httpexceptions import HTTPBadRequest
+        for payload in ([1, 2], 'text', None):
+            view = ContactView(None, self.json_request(payload))
+            self.assertRaises(HTTPBadRequest, view._colander_workflow)
+
+    def test_form_encoded_controls(self):
+        view = ContactView(None, self.request(post=dict(
+            name='Ann', email='ann@example.com', csrf_token='a' * 40)))
+        self.assertEqual(view._colander_workflow()['name'], 'Ann')
+        view = ContactView(None, self.request())
+        errors = view._colander_workflow(
+            [('name', ''), ('csrf_token', 'a' * 40)])['errors']
+        self.assertEqual(sorted(errors), ['email', 'name'])
+
+
+class TestPartialErrors(ViewTestCase):
+    def test_errors_only_when_the_structure_matches(self):
+        import re
+
+        class PartialView(ContactView):
+            partial_errors = True
+        html = PartialView(None, self.request(
+            start=7))._deform_workflow()['form']
+        structure = re.search(r'data-deform-structure="(\w+)"', html).group(1)
+        self.assertIn('data-deform-oid="deformField7"', html)
+
+        post = dict(name='Ann', email='bad', csrf_token='a' * 40)
+        request = self.request(post=post, headers={
+            'X-Deform-Structure': structure})
+        request.is_xhr = True
+        response = PartialView(None, request)._deform_workflow()
+        self.assertEqual(response.json['structure'], structure)
+        self.assertEqual(response.json['errors'],
+                         {'3': ['Invalid email address']})  # form is 0
+        self.assertEqual(len(response.json['alert']), 2)
+
+        request = self.request(post=post, headers={
+            'X-Deform-Structure': 'other'})
+        request.is_xhr = True
+        result = PartialView(None, request)._deform_workflow()
+        self.assertIn('Invalid email address', result['form'])
+
+
+class NickSchema(ContactSchema):
+    # Deferred, like a DeferredDBCheck, so it is bound anew per request
+    nick = c.SchemaNode(c.Str(), validator=c.deferred(
+        lambda node, kw: c.Length(min=3)),
+        widget=d.widget.TextInputWidget(size=10))
+
+
+class TestValidateField(ViewTestCase):
+    def test_one_field_with_cache(self):
+        from pyramid.httpexceptions import HTTPBadRequest
+        from deform_bootstrap_extra.pyramid.views import FieldValidationCache
+
+        class LiveView(ContactView):
+            field_validation_cache = FieldValidationCache(ttl=60)
+        cache = LiveView.field_validation_cache
+        view = LiveView(None, self.request(params=dict(
+            field='email', value='nope')))
+        self.assertEqual(view._validate_field(), dict(
+            field='email', valid=False, error='Invalid email address'))
+        view = LiveView(None, self.request())
+        self.assertEqual(view._validate_field('email', ' NOPE ')['error'],
+                         'Invalid email address')
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertTrue(view._validate_field('email', 'a@example.com')[
+            'valid'])
+        self.assertRaises(HTTPBadRequest, view._validate_field, 'nope', '')
+
+        cache.ttl = -1  # everything expires at once
+        view._validate_field('email', 'nope')
+        self.assertEqual((cache.hits, cache.misses), (1, 3))
+        self.assertEqual(len(cache._entries), 1)  # expired ones evicted
+
+    def test_deferred_validator_hits_across_requests(self):
+        from deform_bootstrap_extra.pyramid.views import FieldValidationCache
+
+        class NickView(ContactView):
+            schema = NickSchema
+            field_validation_cache = FieldValidationCache(ttl=60)
+        cache = NickView.field_validation_cache
+        for i in range(5):
+            view = NickView(None, self.request())
+            self.assertFalse(view._validate_field('nick', 'ab')['valid'])
+        self.assertEqual((cache.hits, cache.misses), (4, 1))
+        # Neither nodes nor requests are kept in the cache
+        key = list(cache._entries)[0]
+        self.assertEqual(key, (NickSchema, 'nick', 'ab', ()))
+
+
+class TestCopyOnWriteBind(ViewTestCase):
+    def test_schema_instance(self):
+        class CowView(ContactView):
+            copy_on_write_bind = True
+        request = self.request()
+        first = CowView(None, request).schema_instance
+        second = CowView(None, self.request()).schema_instance
+        self.assertIs(first['name'], second['name'])
+        self.assertIsNot(first['csrf_token'], second['csrf_token'])
+        self.assertIs(first.bindings['request'], request)
+
+        view = CowView(None, self.request(post=dict(
+            name='Ann', email='ann@example.com', csrf_token='a' * 40)))
+        self.assertEqual(view._colander_workflow()['name'], 'Ann')
+        view = CowView(None, self.request(post=dict(
+            name='Ann', email='ann@example.com', csrf_token='b' * 40)))
+        self.assertIn('errors', view._colander_workflow())
+
+    def test_db_is_bound_when_set(self):
+        class DBView(ContactView):
+            db = object()
+        self.assertNotIn('db', ContactView(
+            None, self.request()).schema_instance.bindings)
+        self.assertIs(DBView(None, self.request()).schema_instance
+                      .bindings['db'], DBView.db)
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+
+'''Profile the rendering and deserialization of forms, per template and
+    per field path.
+
+    Nothing is profiled unless a :class:`Profiler` is installed, which
+    replaces ``ZPTRendererFactory.__call__`` (used by the default deform
+    renderer and by the modal renderer alike) and
+    ``colander.SchemaNode.deserialize`` with timing wrappers; uninstalling
+    it puts the originals back. So the cost is zero when profiling is off::
+
+        from deform_bootstrap_extra.profiling import Profiler
+
+        with Profiler() as profiler:
+            form.render()
+            form.validate(controls)
+        print(profiler.report(sort='self'))
+        profiler.dump_folded('/tmp/forms.folded')  # for flamegraph.pl
+
+    Each template call is measured under its template and under the path
+    of the field it renders (e.g. ``render address.street``); each
+    deserialization under the path of the node (``deserialize
+    address.street``), including the node's validator and preparer.
+    (Compiled deserializers, see the compiler module, bypass the latter.)
+    *Self* time excludes the time spent in nested calls; *cumulative* time
+    does not, but counts recursive calls of the same key only once.
+
+    ``setup_for_pyramid()`` installs the module-level ``profiler`` when the
+    ``deform_bootstrap_extra.profile`` setting is true.
+    '''
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+from collections import Counter
+import io
+import os
+import threading
+from timeit import default_timer
+import colander as c
+from deform.template import ZPTRendererFactory
+
+
+class _Frame(object):
+    __slots__ = ('keys', 'label', 'path', 'field', 'start', 'nested')
+
+    def __init__(self, keys, label, path, field):
+        self.keys = keys
+        self.label = label
+        self.path = path
+        self.field = field
+        self.nested = 0.0
+        self.start = default_timer()
+
+
+class Profiler(object):
+    '''Aggregates calls, cumulative and self time per key, where a key is
+    a (kind, name) pair: ``('template', 'deform/templates/form.pt')``,
+    ``('render', 'address.street')`` or ``('deserialize', 'email')``.
+    Also keeps the self time of each distinct stack, for flame graphs.
+    '''
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._template_paths = {}
+        self._originals = None
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self.stats = {}  # key -> [calls, cumulative, self]
+            self.folded = Counter()  # 'a;b;c' -> self time
+
+    @property
+    def installed(self):
+        return self._originals is not None
+
+    def install(self):
+        if self._originals is not None:
+            return
+        render = ZPTRendererFactory.__call__
+        deserialize = c.SchemaNode.deserialize
+        profiler = self
+
+        def profiled_render(renderer, template_name, **kw):
+            return profiler._render(render, renderer, template_name, kw)
+
+        def profiled_deserialize(node, cstruct=c.null):
+            return profiler._deserialize(deserialize, node, cstruct)
+
+        self._originals = (render, deserialize)
+        ZPTRendererFactory.__call__ = profiled_render
+        c.SchemaNode.deserialize = profiled_deserialize
+
+    def uninstall(self):
+        if self._originals is None:
+            return
+        ZPTRendererFactory.__call__, c.SchemaNode.deserialize = \
+            self._originals
+        self._originals = None
+
+    def __enter__(self):
+        self.install()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.uninstall()
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _template_path(self, renderer, template_name):
+        '''Return e.g. ``deform_bootstrap_extra/templates-modal/form.pt``:
+        the name of the template file with its two parent directories.
+        '''
+        key = (id(renderer), template_name)
+        path = self._template_paths.get(key)
+        if path is None:
+            filename = template_name if template_name.endswith('.pt') \
+                else template_name + '.pt'
+            path = filename
+            for directory in renderer.loader.search_path:
+                if os.path.exists(os.path.join(directory, filename)):
+                    path = '/'.join(os.path.normpath(directory).split(
+                        os.sep)[-2:] + [filename])
+                    break
+            self._template_paths[key] = path
+        return path
+
+    def _render(self, render, renderer, template_name, kw):
+        stack = self._stack()
+        outer = stack[-1] if stack else None
+        field = kw.get('field')
+        if outer is None or outer.field is None:
+            path = field.name if field is not None else ''
+        elif field is outer.field or field is None:
+            path = outer.path
+        else:
+            path = _join(outer.path, field.name)
+        template = self._template_path(renderer, template_name)
+        keys = (('template', template), ('render', path or '(form)'))
+        label = '{}({})'.format(template.rsplit('/', 1)[-1], path) \
+            if path else template.rsplit('/', 1)[-1]
+        return self._call(stack, _Frame(keys, label, path, field),
+                          render, renderer, template_name, **kw)
+
+    def _deserialize(self, deserialize, node, cstruct):
+        stack = self._stack()
+        outer = stack[-1] if stack else None
+        if outer is not None and outer.keys[0][0] == 'deserialize':
+            path = _join(outer.path, node.name)
+        else:
+            path = node.name
+        keys = (('deserialize', path or '(schema)'),)
+        label = 'deserialize({})'.format(path) if path else 'deserialize'
+        return self._call(stack, _Frame(keys, label, path, None),
+                          deserialize, node, cstruct)
+
+    def _call(self, stack, frame, func, *a, **kw):
+        stack.append(frame)
+        try:
+            return func(*a, **kw)
+        finally:
+            elapsed = default_timer() - frame.start
+            stack.pop()
+            if stack:
+                stack[-1].nested += elapsed
+            own = elapsed - frame.nested
+            active = set(k for f in stack for k in f.keys)
+            folded = ';'.join([f.label for f in stack] + [frame.label])
+            with self._lock:
+                for key in frame.keys:
+                    entry = self.stats.get(key)
+                    if entry is None:
+                        entry = self.stats[key] = [0, 0.0, 0.0]
+                    entry[0] += 1
+                    if key not in active:  # not a recursive call
+                        entry[1] += elapsed
+                    entry[2] += own
+                self.folded[folded] += own
+
+    def rows(self, sort='cumulative', kind=None):
+        '''Return (kind, name, calls, cumulative, self) tuples, sorted in
+        descending order of *sort*: 'calls', 'cumulative' or 'self'.
+        '''
+        index = dict(calls=2, cumulative=3, self=4)[sort]
+        with self._lock:
+            rows = [(k[0], k[1], v[0], v[1], v[2])
+                    for k, v in self.stats.items()
+                    if kind is None or k[0] == kind]
+        rows.sort(key=lambda row: row[index], reverse=True)
+        return rows
+
+    def report(self, sort='cumulative', kind=None, limit=30):
+        '''Return the top *limit* rows as a text table, in milliseconds.'''
+        lines = ['{:>8} {:>12} {:>12}  {}'.format(
+            'calls', 'cumul. ms', 'self ms', 'kind name')]
+        for kind_, name, calls, cumulative, own in \
+                self.rows(sort, kind)[:limit]:
+            lines.append('{:>8} {:>12.3f} {:>12.3f}  {} {}'.format(
+                calls, cumulative * 1000, own * 1000, kind_, name))
+        return '\n'.join(lines)
+
+    def folded_stacks(self):
+        '''Generate lines in the "folded" format of flamegraph.pl and
+        speedscope: the stack, a space and the self time in microseconds.
+        '''
+        with self._lock:
+            items = sorted(self.folded.items())
+        for stack, own in items:
+            yield '{} {}'.format(stack, int(round(own * 1e6)))
+
+    def dump_folded(self, path):
+        with io.open(path, 'w', encoding='utf-8') as f:
+            for line in self.folded_stacks():
+                f.write(line + '\n')
+
+
+def _join(path, name):
+    return '{}.{}'.format(path, name) if path and name else path or name
+
+
+profiler = Profiler()
@@ -4,11 +4,15 @@
 
 from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
+from collections import OrderedDict
+from weakref import WeakKeyDictionary
+import threading
 import deform as d
 # from pkg_resources import resource_filename  # does not work in appengine 177
 from pyramid.asset import abspath_from_asset_spec
 from pyramid.httpexceptions import HTTPUnauthorized
 from pyramid.i18n import get_localizer
+from pyramid.settings import asbool
 from pyramid.threadlocal import get_current_request
 
 from pyramid.i18n import TranslationStringFactory
@@ -16,21 +20,116 @@ _ = TranslationStringFactory('deform_bootstrap_extra')
 del TranslationStringFactory
 
 
-def translator(term):
-    return get_localizer(get_current_request()).translate(term)
+class TranslationCache(object):
+    '''Bounded cache of translated terms, kept per localizer (i.e. per
+    locale), with hit/miss statistics.
+
+    Terms whose mapping cannot be hashed are translated but not cached.
+    '''
+    def __init__(self, maxsize=5000):
+        self.maxsize = maxsize  # per locale
+        self.hits = self.misses = 0
+        self._locales = WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(term, capitalize):
+        mapping = getattr(term, 'mapping', None)
+        if mapping:
+            mapping = tuple(sorted(mapping.items()))
+        key = (term, getattr(term, 'domain', None),
+               getattr(term, 'default', None),
+               getattr(term, 'context', None), mapping, capitalize)
+        hash(key)  # raises TypeError if something in the mapping can't
+        return key
+
+    def translate(self, localizer, term, capitalize=False):
+        '''Return ``localizer.translate(term)``, capitalized if requested,
+        preferably from the cache.
+        '''
+        try:
+            key = self._key(term, capitalize)
+        except TypeError:
+            key = None
+        else:
+            with self._lock:
+                cache = self._locales.get(localizer)
+                if cache is None:
+                    cache = self._locales[localizer] = OrderedDict()
+                value = cache.pop(key, None)
+                if value is not None:
+                    cache[key] = value  # most recently used
+                    self.hits += 1
+                    return value
+        value = localizer.translate(term)
+        if capitalize:
+            value = value.capitalize()
+        with self._lock:
+            self.misses += 1
+            if key is not None:
+                while len(cache) >= self.maxsize:
+                    cache.popitem(last=False)
+                cache[key] = value
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._locales.clear()
+
+    def stats(self):
+        with self._lock:
+            return dict(hits=self.hits, misses=self.misses, size=sum(
+                len(cache) for cache in self._locales.values()))
+
+
+translation_cache = TranslationCache()
+
+
+def translator(term, request=None):
+    '''Translate *term* in the locale of *request* (by default, the current
+    request), going through ``translation_cache``.
+
+    Pyramid computes the localizer only once per request.
+    '''
+    localizer = get_localizer(request or get_current_request())
+    return translation_cache.translate(localizer, term)
 
 
 already_setup = False
+PREFIX = 'deform_bootstrap_extra.'  # for settings in the Pyramid ini file
 
 
 def setup_for_pyramid(config, translator=translator, template_dirs=(
                       'deform_bootstrap_extra:templates',
                       'deform_bootstrap:templates',
-                      'deform:templates')):
+                      'deform:templates'),
+                      warm_templates=False, template_cache_dir=None,
+                      bundle_assets=False, bundle_dir=None, profile=False):
     '''Set deform up for i18n and give its template loader the correct
     directory hierarchy.
 
     This includes deform_bootstrap, so the app developer must not.
+
+    If *warm_templates* is true, all templates of the default renderer and
+    of the modal renderer are compiled now, instead of on first use.
+    If *template_cache_dir* is given, compiled templates are persisted
+    to that directory, so later processes do not even have to compile them.
+    Either option makes both renderers share the compiled code.
+
+    If *bundle_assets* is true, the JS and CSS files of this package are
+    also served as two content-hashed, far-future-cached bundles, built in
+    *bundle_dir* (see :func:`.assets.add_bundles`).
+
+    If *profile* is true, the rendering and deserialization of all forms
+    is profiled by ``deform_bootstrap_extra.profiling.profiler``. This has
+    a cost; do not enable it in production.
+
+    These can also be set in the Pyramid settings as
+    ``deform_bootstrap_extra.warm_templates``,
+    ``deform_bootstrap_extra.template_cache_dir``,
+    ``deform_bootstrap_extra.bundle_assets``,
+    ``deform_bootstrap_extra.bundle_dir`` and
+    ``deform_bootstrap_extra.profile``.
     '''
     global already_setup
     if already_setup:
@@ -38,8 +137,8 @@ def setup_for_pyramid(config, translator=translator, template_dirs=(
     from .. import monkeypatch_colander
     monkeypatch_colander()
 
-    config.add_translation_dirs('colander:locale', 'deform:locale',)
-    #    'deform_bootstrap_extra:locale')
+    config.add_translation_dirs('colander:locale', 'deform:locale',
+                                'deform_bootstrap_extra:locale')
     config.add_static_view('deform', 'deform:static')
     config.add_static_view('deform_bootstrap_extra',
         'deform_bootstrap_extra:static')
@@ -47,17 +146,39 @@ def setup_for_pyramid(config, translator=translator, template_dirs=(
     # dirs = tuple([resource_filename(*dir.split(':'))
     #     for dir in template_dirs])
     dirs = tuple([abspath_from_asset_spec(dir) for dir in template_dirs])
+
+    settings = config.get_settings() or {}
+    warm_templates = asbool(warm_templates or
+                            settings.get(PREFIX + 'warm_templates'))
+    template_cache_dir = template_cache_dir or \
+        settings.get(PREFIX + 'template_cache_dir')
     d.Form.set_zpt_renderer(dirs, translator=translator)
+    if warm_templates or template_cache_dir:
+        from ..rendering import set_template_cache
+        from .views import modal_renderer
+        set_template_cache([d.Form.default_renderer, modal_renderer],
+                           template_cache_dir)
+    if warm_templates:
+        from ..rendering import warm_templates
+        warm_templates(d.Form.default_renderer, modal_renderer)
+    if asbool(bundle_assets or settings.get(PREFIX + 'bundle_assets')):
+        from .assets import add_bundles
+        add_bundles(config, bundle_dir or settings.get(PREFIX + 'bundle_dir'))
+    if asbool(profile or settings.get(PREFIX + 'profile')):
+        from ..profiling import profiler
+        profiler.install()
     already_setup = True
 
 
-def button(title=_('Submit'), name=None, icon=None):
+def button(title=_('Submit'), name=None, icon=None, request=None):
     '''Conveniently generate a Deform button while setting its
     ``name`` attribute, translating the label and capitalizing it.
 
     The button may also have a bootstrap icon.
     '''
-    b = d.Button(title=translator(title).capitalize(),
+    localizer = get_localizer(request or get_current_request())
+    b = d.Button(title=translation_cache.translate(localizer, title,
+                                                   capitalize=True),
                  name=name or title.lower())
     b.icon = icon
     return b
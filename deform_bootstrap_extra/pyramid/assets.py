@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+'''Serve the static bundles of deform_bootstrap_extra (see the
+    :mod:`deform_bootstrap_extra.assets` module) with far-future caching.
+    '''
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+import os
+import tempfile
+from pyramid.httpexceptions import HTTPNotFound
+from pyramid.response import FileResponse
+from ..assets import build_bundles, load_manifest
+
+ROUTE = 'deform_bootstrap_extra_bundle'
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+CONTENT_TYPES = dict(js='application/javascript', css='text/css')
+
+
+def add_bundles(config, bundle_dir=None, minify=True):
+    '''Build the bundles in *bundle_dir* (by default, a temporary directory)
+    and serve them. If the directory cannot be written to, the bundles
+    must have been built there beforehand.
+
+    Templates get the URLs of the bundles through a request attribute::
+
+        <script src="${request.deform_bundles['js']}"></script>
+        <link rel="stylesheet" href="${request.deform_bundles['css']}" />
+    '''
+    bundle_dir = bundle_dir or tempfile.mkdtemp()
+    try:
+        bundles = build_bundles(bundle_dir, minify)
+    except (IOError, OSError):
+        bundles = load_manifest(bundle_dir)
+        if bundles is None:
+            raise
+    paths = dict((filename, os.path.join(bundle_dir, filename))
+                 for filename in bundles.values())
+
+    def bundle_view(request):
+        filename = request.matchdict['name']
+        path = paths.get(filename)
+        if path is None:
+            raise HTTPNotFound()
+        response = FileResponse(path, request=request, content_type=str(
+            CONTENT_TYPES[filename.rsplit('.', 1)[-1]]))
+        response.headers['Cache-Control'] = CACHE_CONTROL
+        return response
+
+    config.add_route(ROUTE, '/deform_bootstrap_extra_bundles/{name}')
+    config.add_view(bundle_view, route_name=ROUTE)
+
+    def deform_bundles(request):
+        return dict((kind, request.route_path(ROUTE, name=filename))
+                    for kind, filename in bundles.items())
+    config.add_request_method(deform_bundles, 'deform_bundles', reify=True)
+    return bundles
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+'''Pyramid view that answers the autocompletion requests of the TagsWidget.
+
+    Example::
+
+        from deform_bootstrap_extra.autocomplete import (
+            PrefixIndex, column_source)
+        from deform_bootstrap_extra.pyramid.autocomplete import (
+            autocomplete_view)
+
+        tags = PrefixIndex(column_source(DBSession, Tag.name), max_age=300)
+        config.add_route('tags', '/tags')
+        config.add_view(autocomplete_view(tags), route_name='tags')
+
+        # ...and in the schema:
+        widget = TagsWidget(autocomplete_url='/tags')
+
+    When a tag is created, ``tags.add(name)`` makes it available at once.
+    '''
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+from hashlib import sha1
+import json
+from pyramid.response import Response
+
+
+def autocomplete_view(index, limit=10, max_limit=50, max_age=60,
+                      param='term', dumps=json.dumps):
+    '''Return a view callable that looks up the request parameter *param*
+    (as sent by jQuery UI autocomplete) in the PrefixIndex *index* and
+    returns a JSON list of up to *limit* terms -- or as many as the
+    ``limit`` parameter asks for, up to *max_limit*.
+
+    Responses may be cached for *max_age* seconds, and carry an ETag
+    computed from their content, so browsers can revalidate cheaply
+    (the same in every process).
+    '''
+    def view(request):
+        term = request.params.get(param, '')
+        try:
+            count = min(int(request.params.get('limit', limit)), max_limit)
+        except ValueError:
+            count = limit
+        body = dumps(index.search(term, count) if term else [])
+        if not isinstance(body, bytes):
+            body = body.encode('utf-8')
+        response = Response(body=body, content_type='application/json',
+                            charset='utf-8', conditional_response=True)
+        response.etag = sha1(body).hexdigest()[:16]
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+        return response  # 304 Not Modified if the ETag matches
+    return view
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+
+'''A deform view for editing many rows of a table at once.'''
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+import colander as c
+import deform as d
+from pyramid.decorator import reify
+from pyramid_deform import CSRFSchema
+from sqlalchemy import inspect, tuple_
+from ..schemaker import Schemaker
+from .views import BaseDeformView
+
+_schemaker = None
+
+
+def default_schemaker():
+    '''Return the Schemaker shared by the grid views that lack their own.'''
+    global _schemaker
+    if _schemaker is None:
+        _schemaker = Schemaker()
+    return _schemaker
+
+
+class GridSchema(CSRFSchema):
+    '''The schema of GridDeformView, to which the ``rows`` sequence is
+    added for each request.
+    '''
+
+
+class GridDeformView(BaseDeformView):
+    '''Edits all the rows returned by ``_query()`` in a single form,
+    as a sequence of mappings. Example::
+
+        class PriceGrid(GridDeformView):
+            db = DBSession
+            model_class = Product
+            row_columns = ('id', 'name', 'price')
+
+            def _query(self):
+                return self.db.query(Product).filter_by(active=True) \\
+                    .order_by(Product.name)
+
+            @view_config(route_name='prices', renderer='prices.mako')
+            def prices(self):
+                return self._deform_workflow()
+
+    On GET, the columns of all rows are loaded in one query. On a valid
+    POST, the current values of the posted rows are loaded in one query,
+    only the rows whose values changed are written back, in one
+    ``bulk_update_mappings()`` call, and then ``_updated()`` is called.
+    Rows that ``_query()`` does not return cannot be changed.
+
+    The row schema is ``row_schema`` (a schema class or instance), by
+    default made by ``schemaker`` from the *row_columns* of *model_class*
+    (with *row_overrides*). Either way, the primary key columns are added
+    as hidden, required fields. Set ``db`` to the session; the schema is
+    bound with it too, so the choice lists of foreign keys (see
+    :class:`~deform_bootstrap_extra.schemaker.Schemaker`) are loaded once
+    for the whole grid.
+    '''
+    schema = GridSchema
+    model_class = None
+    row_schema = None
+    row_columns = None  # None means all column properties
+    row_overrides = None  # for Schemaker.schema_for(), e.g. widgets
+    schemaker = None  # None means a shared default Schemaker
+
+    @reify
+    def primary_key(self):
+        '''The names of the primary key properties of *model_class*.'''
+        mapper = inspect(self.model_class)
+        return [mapper.get_property_by_column(column).key
+                for column in mapper.primary_key]
+
+    def _query(self):
+        '''Override this to choose (and order) the rows of the grid.'''
+        return self.db.query(self.model_class)
+
+    def _row_schema(self):
+        '''Return a new row schema, with the hidden primary key fields.'''
+        schemaker = self.schemaker or default_schemaker()
+        if self.row_schema is None:
+            includes = self.row_columns
+            if includes is not None:
+                includes = [k for k in self.primary_key
+                            if k not in includes] + list(includes)
+            schema = schemaker.schema_for(self.model_class, includes=includes,
+                                          overrides=self.row_overrides)
+        elif isinstance(self.row_schema, type):
+            schema = self.row_schema()
+        else:
+            schema = self.row_schema.clone()
+        schema.name = 'row'
+        for position, key in enumerate(self.primary_key):
+            if key not in schema:
+                schema.insert(position,
+                              schemaker(getattr(self.model_class, key)))
+            node = schema[key]
+            node.widget = d.widget.HiddenWidget()
+            node.missing = c.required
+        return schema
+
+    @reify
+    def schema_instance(self):
+        schema = self.schema(validator=self.schema_validator)
+        schema.add(c.SchemaNode(
+            c.Sequence(), self._row_schema(), name='rows', title='',
+            widget=d.widget.SequenceWidget(orderable=False)))
+        return schema.bind(**self._bindings())
+
+    @reify
+    def _names(self):
+        return [node.name for node in self.schema_instance['rows'].children[0]]
+
+    def _select(self, query):
+        '''Return *query* restricted to the columns of the row schema,
+        as a list of dicts.
+        '''
+        names = self._names
+        columns = [getattr(self.model_class, name) for name in names]
+        return [dict(zip(names, row))
+                for row in query.with_entities(*columns)]
+
+    def _load_controls(self):
+        '''Load the columns of all the rows in one query.'''
+        rows = self._select(self._query())
+        for row in rows:
+            for name, value in row.items():
+                if value is None:
+                    row[name] = c.null
+        return dict(rows=rows)
+
+    def _template_dict(self, form=None, controls=None, **k):
+        '''The grid has exactly one item per row: no adding or removing.'''
+        if isinstance(form, d.ValidationFailure):
+            field, rows = form.field, form.cstruct.get('rows')
+        else:
+            form = field = form or self._get_form()
+            rows = (controls or {}).get('rows')
+        widget = field['rows'].widget
+        widget.min_len = widget.max_len = len(rows or ())
+        return super(GridDeformView, self)._template_dict(
+            form=form, controls=controls, **k)
+
+    def _pk(self, row):
+        return tuple(row[key] for key in self.primary_key)
+
+    def _changes(self, rows):
+        '''Return the mappings for ``bulk_update_mappings()``: the primary
+        key and the changed values of each of *rows* (appstructs) that
+        differs from the database.
+        '''
+        if not rows:
+            return []
+        keys = [self._pk(row) for row in rows]
+        columns = [getattr(self.model_class, key) for key in self.primary_key]
+        if len(columns) == 1:
+            condition = columns[0].in_([key[0] for key in keys])
+        else:
+            condition = tuple_(*columns).in_(keys)
+        query = self._query().filter(condition)
+        current = dict((self._pk(row), row) for row in self._select(query))
+        changes = []
+        for key, row in zip(keys, rows):
+            old = current.get(key)
+            if old is None:
+                continue  # not editable here, or deleted meanwhile
+            change = dict((name, None if value is c.null else value)
+                          for name, value in row.items()
+                          if name not in self.primary_key and
+                          old[name] != (None if value is c.null else value))
+            if change:
+                change.update(zip(self.primary_key, key))
+                changes.append(change)
+        return changes
+
+    def _valid(self, form, controls):
+        '''Write the changed rows, then call ``_updated()``.'''
+        changes = self._changes(controls['rows'])
+        if changes:
+            self.db.bulk_update_mappings(self.model_class, changes)
+        return self._updated(form, controls, changes)
+
+    def _updated(self, form, controls, changes):
+        '''Override this to change the response after saving *changes*
+        (a list of dicts). By default, render the grid again.
+        '''
+        return self._template_dict(form=form, controls=controls,
+                                   changed=len(changes))
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+'''Build, in the master process of a preforking server (gunicorn with
+    ``--preload``, uwsgi without ``lazy-apps``...), the state that would
+    otherwise be built lazily in each worker, so the workers share it.
+
+    Call ``preload()`` at the end of your ``main()``::
+
+        from deform_bootstrap_extra.pyramid.preload import preload
+
+        preload(config, schemas=[InvitationView, ContactSchema],
+                locales=['en', 'pt_BR'])
+        return config.make_wsgi_app()
+    '''
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+import gc
+import deform as d
+from pyramid.i18n import make_localizer
+from pyramid.interfaces import ILocalizer, ITranslationDirectories
+from ..binding import get_plan
+from ..compiler import get_compiled
+from ..rendering import warm_templates
+from .views import BaseDeformView, is_flat, modal_renderer
+
+
+def preload_schema(schema, copy_on_write_bind=False):
+    '''Build the cached state of one schema: its compiled deserializer,
+    its flatness and -- only for views whose ``copy_on_write_bind`` is
+    true, since no other view uses it -- its BindPlan. *schema* may be a
+    schema class or instance, or a BaseDeformView subclass, whose
+    ``schema``, ``schema_validator`` and ``copy_on_write_bind`` are then
+    used; for a schema class, pass *copy_on_write_bind* to build the plan.
+    Return the schema instance.
+    '''
+    if isinstance(schema, type) and issubclass(schema, BaseDeformView):
+        view = schema
+        schema, kw = view.schema, dict(validator=view.schema_validator)
+        copy_on_write_bind = view.copy_on_write_bind
+    else:
+        kw = dict(validator=None)
+    if not isinstance(schema, type):
+        template = schema
+    elif copy_on_write_bind:
+        template = get_plan(schema, **kw).template
+    else:
+        template = schema(**kw)
+    get_compiled(template)
+    is_flat(template)
+    return template
+
+
+def preload_locale(registry, locale_name):
+    '''Load the translation catalogs of *locale_name* into a localizer,
+    registered where Pyramid will look for it on each request.
+    '''
+    localizer = registry.queryUtility(ILocalizer, name=locale_name)
+    if localizer is None:
+        tdirs = registry.queryUtility(ITranslationDirectories, default=[])
+        localizer = make_localizer(locale_name, tdirs)
+        registry.registerUtility(localizer, ILocalizer, name=locale_name)
+    return localizer
+
+
+def preload(config, schemas=(), locales=(), models=(), schemaker=None,
+            freeze=True):
+    '''Set deform_bootstrap_extra up (if that has not been done yet),
+    commit *config*, compile all templates of the default and modal
+    renderers, preload *schemas* (see ``preload_schema()``) and the
+    SQLAlchemy *models* through ``schemaker.schema_for()`` -- the
+    Schemaker that the application uses, so its cache gets filled -- and
+    load the catalogs of *locales*.
+
+    Finally, if *freeze* is true and the Python version has ``gc.freeze()``
+    (3.7+), move every object alive into the permanent generation, so the
+    garbage collector of the workers never touches -- hence never copies --
+    the memory pages they share with the master process. As CPython
+    recommends, call ``gc.disable()`` early in the master process, so
+    fewer pages are left half-empty by collections before the freeze, and
+    ``gc.enable()`` in each worker after the fork.
+
+    Return the number of templates, schemas, locales and frozen objects.
+    '''
+    schemas, models, locales = list(schemas), list(models), list(locales)
+    if models and schemaker is None:
+        raise ValueError('preload() needs the schemaker of the models.')
+    config.include('deform_bootstrap_extra')
+    config.commit()  # so the translation directories are registered
+    stats = dict(templates=warm_templates(d.Form.default_renderer,
+                                          modal_renderer))
+    for schema in schemas:
+        preload_schema(schema)
+    for model in models:
+        schemaker.schema_for(model)
+    stats['schemas'] = len(schemas) + len(models)
+    for locale_name in locales:
+        preload_locale(config.registry, locale_name)
+    stats['locales'] = len(locales)
+    stats['frozen'] = 0
+    if freeze and hasattr(gc, 'freeze'):
+        gc.freeze()
+        stats['frozen'] = gc.get_freeze_count()
+    return stats
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+'''Low-overhead timing of the phases of the BaseDeformView workflow.
+
+    Set the ``timing_sink`` of a view class to one of the sinks below
+    (or to any object with the same ``__call__(request, timer)`` signature)
+    and each workflow will record how long it spent in each phase:
+
+    - ``form``: instantiating the form (and binding the schema);
+    - ``load``: ``_load_controls()``, in GET requests;
+    - ``parse``: parsing the POSTed controls with peppercorn (or decoding
+      the JSON body in ``_colander_workflow()``);
+    - ``preprocess``: ``_preprocess_controls()``;
+    - ``validate``: validating the form, including any database validators;
+    - ``deserialize``: validation in ``_colander_workflow()``;
+    - ``valid`` and ``invalid``: ``_valid()`` and ``_invalid()``;
+    - ``render``: rendering the form in ``_template_dict()``;
+    - ``total``: the whole workflow.
+
+    Phases may contain others: ``invalid`` usually includes ``render``,
+    and ``total`` includes everything.
+
+    It also counts ``fields`` (in the form), ``validator_nodes`` (how many
+    nodes of the schema have a validator -- not how many validators ran,
+    which depends on the input) and ``bytes`` (of the rendered form,
+    unless it is streamed), in ``_deform_workflow()``. The timings are
+    reported even when the workflow raises, e.g. HTTPForbidden.
+    When ``timing_sink`` is None (the default), nothing is measured.
+    '''
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+from collections import OrderedDict
+from timeit import default_timer
+
+
+class _Phase(object):
+    __slots__ = ('timer', 'name', 'start')
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.start = default_timer()
+
+    def __exit__(self, *exc_info):
+        durations = self.timer.durations
+        durations[self.name] = durations.get(self.name, 0) + \
+            default_timer() - self.start
+
+
+class PhaseTimer(object):
+    '''Accumulates the duration (in seconds) of each phase, and counters.'''
+    def __init__(self):
+        self.durations = OrderedDict()
+        self.counts = OrderedDict()
+
+    def phase(self, name):
+        '''Return a context manager that times the phase *name*.'''
+        return _Phase(self, name)
+
+    def count(self, name, n=1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+
+class _NullPhase(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+class NullTimer(object):
+    '''Does nothing, very quickly. Used when timing is disabled.'''
+    _phase = _NullPhase()
+    durations = counts = {}
+
+    def phase(self, name):
+        return self._phase
+
+    def count(self, name, n=1):
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+
+def count_nodes(schema):
+    '''Return the number of fields below *schema* and how many nodes
+    (including itself) have a validator.
+    '''
+    fields = -1  # the schema itself is not a field
+    validators = 0
+    stack = [schema]
+    while stack:
+        node = stack.pop()
+        fields += 1
+        if node.validator is not None:
+            validators += 1
+        stack.extend(node.children)
+    return fields, validators
+
+
+class StatsdSink(object):
+    '''Sends the timings to a statsd-style client. *timing* is called as
+    ``timing(name, milliseconds)`` and *incr*, if given, as
+    ``incr(name, count)``, e.g. ``StatsdSink(client.timing, client.incr)``.
+    '''
+    def __init__(self, timing, incr=None, prefix='deform.'):
+        self.timing = timing
+        self.incr = incr
+        self.prefix = prefix
+
+    def __call__(self, request, timer):
+        for name, seconds in timer.durations.items():
+            self.timing(self.prefix + name, seconds * 1000)
+        if self.incr is not None:
+            for name, n in timer.counts.items():
+                self.incr(self.prefix + name, n)
+
+
+class ServerTimingSink(object):
+    '''Adds a ``Server-Timing`` header to the response, which browsers
+    display in their developer tools.
+    '''
+    def __init__(self, prefix='deform-'):
+        self.prefix = prefix
+
+    def __call__(self, request, timer):
+        value = ', '.join('{}{};dur={:.2f}'.format(
+            self.prefix, name, seconds * 1000)
+            for name, seconds in timer.durations.items())
+
+        def add_header(request, response):
+            existing = response.headers.get('Server-Timing')
+            response.headers['Server-Timing'] = \
+                existing + ', ' + value if existing else value
+        request.add_response_callback(add_header)
+
+
+class RequestAttributeSink(object):
+    '''Stores the timer in an attribute of the request, for your code
+    (or a tween) to do what it wants with it.
+    '''
+    def __init__(self, attribute='deform_timer'):
+        self.attribute = attribute
+
+    def __call__(self, request, timer):
+        setattr(request, self.attribute, timer)
+
+
+class MultiSink(object):
+    '''Passes the timer to several sinks.'''
+    def __init__(self, *sinks):
+        self.sinks = sinks
+
+    def __call__(self, request, timer):
+        for sink in self.sinks:
+            sink(request, timer)
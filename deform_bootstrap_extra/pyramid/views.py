@@ -4,15 +4,201 @@
 
 from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
-from itertools import count
+from collections import OrderedDict
+from itertools import count, islice
+import json
+import re
+import threading
+from time import time
 from pyramid_deform import CSRFSchema
 from pyramid.decorator import reify
-from pyramid.httpexceptions import HTTPForbidden
+from pyramid.httpexceptions import HTTPBadRequest, HTTPForbidden
+from pyramid.i18n import get_locale_name
 from pyramid.response import Response
+from pyramid.threadlocal import manager
 import colander as c
 import deform as d
 import peppercorn
+from ..binding import get_plan
+from ..compiler import get_compiled
+from ..rendering import (
+    StreamingForm, _fields, error_fragments, structure_fingerprint)
+from .. import asdict2
 from . import button, translator, _
+from .timing import NULL_TIMER, PhaseTimer, count_nodes
+
+
+class RenderedFormCache(object):
+    '''Bounded LRU cache of blank form renderings, for BaseDeformView.
+
+    Each entry keeps the rendered HTML split into pieces, so the field ids
+    (which depend on the request's field counter) and the CSRF token can
+    be filled in for each request without rendering the form again.
+
+    Use ``invalidate(schema)`` or ``clear()`` when the rendering of a form
+    changes, e.g. after changing a widget at runtime.
+
+    Each view class has its own cache: a subclass that inherits the cache
+    of its parent gets a new, empty one the first time it is used (see
+    ``BaseDeformView._rendered_form_cache()``).
+    '''
+    OID = re.compile(r'deformField(\d+)')
+    CSRF = object()  # placeholder for the CSRF token
+
+    def __init__(self, maxsize=100):
+        self.maxsize = maxsize
+        self.hits = self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                self.misses += 1
+            else:
+                self._entries[key] = entry  # most recently used
+                self.hits += 1
+            return entry
+
+    def store(self, key, html, first_order, span, csrf_token=None):
+        '''Split *html* and store it. *first_order* is the counter value of
+        the form; *span* is how many counter values the form consumed.
+        '''
+        parts = []
+        for i, piece in enumerate(self.OID.split(html)):
+            if i % 2:
+                parts.append(int(piece) - first_order)
+            elif csrf_token and csrf_token in piece:
+                for j, bit in enumerate(piece.split(csrf_token)):
+                    if j:
+                        parts.append(self.CSRF)
+                    parts.append(bit)
+            else:
+                parts.append(piece)
+        entry = (parts, span, type(html))
+        with self._lock:
+            self._entries.pop(key, None)
+            while len(self._entries) >= self.maxsize:
+                self._entries.popitem(last=False)
+            self._entries[key] = entry
+        return entry
+
+    def invalidate(self, schema=None):
+        '''Drop the entries of one schema class, or all of them.'''
+        with self._lock:
+            if schema is None:
+                self._entries.clear()
+            else:
+                for key in [k for k in self._entries if k[0] is schema]:
+                    del self._entries[key]
+
+    clear = invalidate
+
+    @classmethod
+    def fill(cls, entry, first_order, csrf_token=None):
+        '''Return the HTML for a form whose counter starts at *first_order*.
+        '''
+        parts, span, html_type = entry
+        out = []
+        for part in parts:
+            if part.__class__ is int:
+                out.append('deformField%d' % (part + first_order))
+            elif part is cls.CSRF:
+                out.append(csrf_token)
+            else:
+                out.append(part)
+        return html_type(''.join(out))
+
+
+class FieldValidationCache(object):
+    '''Bounded cache of the results of ``BaseDeformView._validate_field()``
+    whose entries expire after *ttl* seconds -- keep it short, since the
+    results of database validators change with the data. Expired entries
+    are evicted whenever an entry is stored.
+    '''
+    def __init__(self, ttl=10, maxsize=10000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        '''Return the cached value for *key*, or None.'''
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] + self.ttl < time():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        now = time()
+        with self._lock:
+            self._entries.pop(key, None)
+            entries = self._entries
+            # The entries are in the order they were stored
+            while entries and (len(entries) >= self.maxsize or
+                               next(iter(entries.values()))[0] + self.ttl <
+                               now):
+                entries.popitem(last=False)  # the oldest
+            entries[key] = (now, value)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_class_lock = threading.Lock()  # for changing view classes
+_flat_schemas = {}  # declarative schema class -> is_flat()
+
+
+def is_flat(schema):
+    '''Return whether *schema* is a mapping of leaf nodes only, whose
+    controls therefore need no peppercorn parsing (unless their widgets
+    emit ``__start__`` markers). Computed once per declarative schema
+    class, since views instantiate the class for every request. A schema
+    with nodes added (or removed) imperatively keeps its own result in
+    the node, whose clones and bound copies inherit it.
+    '''
+    cls = type(schema)
+    declared = cls.__all_schema_nodes__
+    # Only instances that still have the declared nodes share the result
+    by_class = bool(declared) and len(schema.children) == len(declared)
+    flat = _flat_schemas.get(cls) if by_class else \
+        schema.__dict__.get('_is_flat')
+    if flat is None:
+        flat = isinstance(schema.typ, c.Mapping) and \
+            not any(node.children for node in schema.children)
+        if by_class:
+            _flat_schemas[cls] = flat
+        else:
+            schema._is_flat = flat
+    return flat
+
+
+def parse_controls(controls, flat=False):
+    '''Return the pstruct for *controls* (a list of (name, value) pairs).
+    When *flat* is true, build it directly in a single pass, which gives the
+    same result as ``peppercorn.parse()`` as long as no ``__start__`` or
+    ``__end__`` markers show up; when they do, fall back to peppercorn.
+    '''
+    if not isinstance(controls, (list, tuple)):
+        controls = list(controls)
+    if flat:
+        pstruct = {}
+        for name, value in controls:
+            if name == '__start__' or name == '__end__':
+                break
+            pstruct[name] = value
+        else:
+            return pstruct
+    return peppercorn.parse(controls)
 
 
 class BaseDeformView(object):
@@ -59,6 +245,41 @@ class BaseDeformView(object):
     bootstrap_form_style = 'form-horizontal'
     schema_validator = None  # validator to be applied to the form as a whole
     use_ajax = False
+    # In _colander_workflow(), deserialize through a compiled function
+    # (see the deform_bootstrap_extra.compiler module):
+    compiled_deserializer = False
+    # A RenderedFormCache for blank forms, which only makes sense if the
+    # blank form does not vary per request, apart from the CSRF token.
+    # Subclasses get their own (see _rendered_form_cache()):
+    rendered_form_cache = None
+    # Render forms one chunk at a time, into a StreamingForm
+    # (see _form_response()):
+    streaming = False
+    # Where to send the duration of each phase of the workflow; see the
+    # deform_bootstrap_extra.pyramid.timing module. None disables timing:
+    timing_sink = None
+    # The JSON decoder and encoder of _colander_workflow() and
+    # _json_response(); e.g. staticmethod(orjson.loads):
+    json_loads = staticmethod(json.loads)
+    json_dumps = staticmethod(json.dumps)
+    # Include a manifest of the validation constraints in the rendered form,
+    # for xaja.enforceConstraints() (see deform_bootstrap_extra.constraints):
+    client_constraints = False
+    # Answer invalid AJAX submissions with just the error messages, as JSON,
+    # for xaja.js to patch into the form (see _partial_errors()):
+    partial_errors = False
+    # A FieldValidationCache for the results of _validate_field(), shared
+    # between requests (see _validation_cache_key()). Only use one if those
+    # do not depend on the request (e.g. on the current user):
+    field_validation_cache = None
+    # Bind the schema copy-on-write, copying only the nodes with deferred
+    # attributes (see the deform_bootstrap_extra.binding module). The nodes
+    # of schema_instance are then shared between requests, so do not
+    # change them unless plan.is_copied(node):
+    copy_on_write_bind = False
+    # A SQLAlchemy session (or scoped session), bound to the schema as "db"
+    # for deferreds such as the foreign key choices of Schemaker:
+    db = None
 
     def __init__(self, context, request):
         '''Sets ``status`` to the request method. Later, ``status``
@@ -68,11 +289,24 @@ class BaseDeformView(object):
         self.request = request
         self.status = request.method
 
+    @reify
+    def _timer(self):
+        '''A PhaseTimer if ``self.timing_sink`` is set, else a NullTimer.'''
+        return NULL_TIMER if self.timing_sink is None else PhaseTimer()
+
+    def _report_timing(self):
+        '''Pass the timer to ``self.timing_sink``, once per view instance.'''
+        if self.timing_sink is not None and \
+                not getattr(self, '_timing_reported', False):
+            self._timing_reported = True
+            self.timing_sink(self.request, self._timer)
+
     def _get_buttons(self):
         '''Returns the buttons tuple for instantiating the form.
         If this doesn't do what you want, override this method!
         '''
-        return [button(self.button_text, icon=self.button_icon)]
+        return [button(self.button_text, icon=self.button_icon,
+                       request=self.request)]
 
     @reify
     def schema_instance(self):
@@ -83,11 +317,21 @@ class BaseDeformView(object):
                 return self.schema().bind(now=datetime.utcnow())
 
         The default implementation binds the request for CSRF protection
-        and, if ``self.schema_validator`` is defined, uses it for the
-        form as a whole.
+        (and ``self.db``, if set; see ``_bindings()``) and, if
+        ``self.schema_validator`` is defined, uses it for the form as a whole.
         '''
+        if self.copy_on_write_bind:
+            return get_plan(self.schema, validator=self.schema_validator) \
+                .bind(**self._bindings())
         return self.schema(validator=self.schema_validator).bind(
-            request=self.request)
+            **self._bindings())
+
+    def _bindings(self):
+        '''Return the keyword arguments for binding the schema.'''
+        kw = dict(request=self.request)
+        if self.db is not None:
+            kw['db'] = self.db
+        return kw
 
     def _get_form(self, schema=None, **kw):
         '''When there is more than one Deform form per page, forms must use
@@ -111,26 +355,34 @@ class BaseDeformView(object):
             use_ajax=self.use_ajax)
         if ajax_options:
             adict['ajax_options'] = ajax_options
+        if self.client_constraints:
+            adict['client_constraints'] = True
+        if self.partial_errors:
+            adict['partial_errors'] = True
         return adict
 
     CSRF_ERROR = _("You do not pass our CSRF protection. "
         "Maybe your session expired? In any case, you must reload "
         "that page (and probably fill out the form again). Sorry...")
 
-    def _check_csrf(self, exception):
-        '''This is called when there is a validation error. If the schema
-        being validated is an instance of CSRFSchema, check the posted
-        CSRF token, and if there is a problem, raise HTTPForbidden.
+    def _check_csrf(self, exception, cstruct=None):
+        '''This is called when there is a validation error -- *exception*
+        is a deform ValidationFailure or a colander Invalid, and *cstruct*
+        what was validated. If the schema being validated is an instance of
+        CSRFSchema, check the posted CSRF token, and if there is a problem,
+        raise HTTPForbidden.
 
         If we didn't do this, the form would be redisplayed with an error
         message at the top, but the user would have no idea what is going on,
         because the CSRF token is in a hidden field.
         '''
-        # if issubclass(self.schema, CSRFSchema) and \
-        if isinstance(exception.error.node, CSRFSchema) and \
+        error = getattr(exception, 'error', exception)
+        if cstruct is None:
+            cstruct = getattr(exception, 'cstruct', None) or self.request.POST
+        if isinstance(error.node, CSRFSchema) and \
             self.request.session.get_csrf_token() != \
-                (exception.cstruct or self.request.POST).get('csrf_token'):
-            raise HTTPForbidden(translator(self.CSRF_ERROR))
+                cstruct.get('csrf_token'):
+            raise HTTPForbidden(translator(self.CSRF_ERROR, self.request))
 
     def _template_dict(self, form=None, controls=None, **k):
         '''Override this method to fill in the dictionary that is returned
@@ -139,14 +391,107 @@ class BaseDeformView(object):
         which situation you're in, check ``self.status``.
 
         By default, the returned dict will contain a rendered ``form``.
+        If ``self.streaming`` is true, ``form`` is a
+        :class:`~deform_bootstrap_extra.rendering.StreamingForm` instead,
+        which renders as it is iterated; it can still be embedded in a page
+        template, or passed to ``self._form_response()``.
         '''
         form = form or self._get_form()
-        if isinstance(form, d.Form):
-            form = form.render(controls) if controls else form.render()
-        else:  # form must be a ValidationFailure exception
-            form = form.render()
+        timer = self._timer
+        with timer.phase('render'):
+            if isinstance(form, d.Form):
+                if not controls and self.rendered_form_cache is not None:
+                    form = self._render_blank(form)
+                elif self.streaming:
+                    if controls:
+                        form.set_appstruct(controls)
+                    form = StreamingForm(form)
+                else:
+                    form = form.render(controls) if controls \
+                        else form.render()
+            elif self.streaming:  # form must be a ValidationFailure exception
+                form = StreamingForm(form.field, form.cstruct)
+            else:
+                form = form.render()
+        if timer is not NULL_TIMER and not isinstance(form, StreamingForm):
+            timer.count('bytes', len(form))
         return dict(form=form, **k)
 
+    def _form_response(self, form):
+        '''Return a Response containing the rendered *form*, which is
+        streamed (as the response app_iter) if it is a StreamingForm.
+        '''
+        if isinstance(form, StreamingForm):
+            return Response(app_iter=self._streamed(form.encoded()),
+                            content_type='text/html', charset='utf-8')
+        return Response(body=form)
+
+    def _streamed(self, chunks):
+        '''Generate *chunks*, producing each one with ``self.request`` as
+        the current request: the app_iter is consumed after Pyramid has
+        popped it, and the templates still need it to translate.
+        '''
+        chunks = iter(chunks)
+        env = dict(request=self.request, registry=self.request.registry)
+        while True:
+            manager.push(env)
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                return
+            finally:
+                manager.pop()
+            yield chunk
+
+    def _form_cache_key(self, form):
+        '''Return what identifies the blank rendering of *form*
+        in ``self.rendered_form_cache``. The first item must be the schema
+        class, for ``RenderedFormCache.invalidate()``.
+        '''
+        return (self.schema, form.formid, form.action, form.use_ajax,
+                form.renderer, get_locale_name(self.request),
+                getattr(form, 'bootstrap_form_style', None),
+                self.client_constraints, self.partial_errors,
+                tuple((b.name, b.title, b.type, b.value, b.css_class,
+                       b.disabled, getattr(b, 'icon', None))
+                      for b in form.buttons))
+
+    def _rendered_form_cache(self):
+        '''Return the ``rendered_form_cache`` of the class of this view.
+        If the class inherits it, it first gets a new, empty cache of its
+        own, with the same *maxsize*.
+        '''
+        cls = type(self)
+        if 'rendered_form_cache' not in cls.__dict__:
+            with _class_lock:
+                if 'rendered_form_cache' not in cls.__dict__:
+                    inherited = cls.rendered_form_cache
+                    cls.rendered_form_cache = type(inherited)(
+                        maxsize=inherited.maxsize)
+        return cls.rendered_form_cache
+
+    def _render_blank(self, form):
+        '''Render the blank *form* through ``self.rendered_form_cache``.'''
+        cache = self._rendered_form_cache()
+        key = self._form_cache_key(form)
+        session = getattr(self.request, 'session', None)
+        token = session.get_csrf_token() if session is not None else None
+        # The counter values consumed by the fields of the form
+        used = max(field.order for field in _fields(form)) - form.order + 1
+        entry = cache.get(key)
+        if entry is None:
+            html = form.render()
+            # Rendering may consume counter values too (e.g. sequences);
+            # the ids of those fields are all in the HTML.
+            span = max([used] + [int(oid) - form.order + 1
+                                 for oid in cache.OID.findall(html)])
+            cache.store(key, html, form.order, span, token)
+            return html
+        # Consume the counter values the rendering would have consumed
+        if entry[1] > used:
+            next(islice(form.counter, entry[1] - used - 1, None), None)
+        return cache.fill(entry, form.order, token)
+
     def _preprocess_controls(self, controls):
         '''If you'd like to do something with the POSTed data *before*
         validation, just override this method in your subclass.
@@ -160,10 +505,22 @@ class BaseDeformView(object):
         '''
         if not form_args:
             form_args = {}
-        if self.request.method == 'POST':
-            return self._post(self._get_form(**form_args), controls=controls)
-        else:
-            return self._get(self._get_form(**form_args))
+        timer = self._timer
+        try:
+            with timer.phase('total'):
+                with timer.phase('form'):
+                    form = self._get_form(**form_args)
+                if timer is not NULL_TIMER:
+                    # Not how many validators run, which depends on input
+                    fields, validator_nodes = count_nodes(form.schema)
+                    timer.count('fields', fields)
+                    timer.count('validator_nodes', validator_nodes)
+                if self.request.method == 'POST':
+                    return self._post(form, controls=controls)
+                else:
+                    return self._get(form)
+        finally:  # also when raising, e.g. HTTPFound or HTTPForbidden
+            self._report_timing()
 
     def _load_controls(self):
         '''Override this method to load existing data from your database.
@@ -176,23 +533,32 @@ class BaseDeformView(object):
         '''You may override this method in subclasses to do something special
         when the request method is GET.
         '''
-        return self._template_dict(form=form, controls=self._load_controls())
+        with self._timer.phase('load'):
+            controls = self._load_controls()
+        return self._template_dict(form=form, controls=controls)
 
     def _post(self, form, controls=None):
         '''You may override this method in subclasses to do something special
         when the request method is POST.
         '''
-        controls = peppercorn.parse(controls or self.request.POST.items())
-        controls = self._preprocess_controls(controls)
+        timer = self._timer
+        with timer.phase('parse'):
+            controls = parse_controls(controls or self.request.POST.items(),
+                                      is_flat(form.schema))
+        with timer.phase('preprocess'):
+            controls = self._preprocess_controls(controls)
         try:
-            appstruct = form.validate_pstruct(controls)
+            with timer.phase('validate'):
+                appstruct = self._validate_form(form, controls)
         except d.ValidationFailure as e:
             self.status = 'invalid'
-            return self._invalid(e, controls)
+            with timer.phase('invalid'):
+                return self._invalid(e, controls)
         else:
             self.status = 'valid'
             appstruct.pop('csrf_token', None)  # Discard the CSRF token
-            return self._valid(form=form, controls=appstruct)
+            with timer.phase('valid'):
+                return self._valid(form=form, controls=appstruct)
 
     def _invalid(self, exception, controls):
         '''Override this to change what happens upon ValidationFailure.
@@ -200,8 +566,40 @@ class BaseDeformView(object):
         know what's up. Otherwise, we simply redisplay the form.
         '''
         self._check_csrf(exception)
+        if self.partial_errors:
+            response = self._partial_errors(exception)
+            if response is not None:
+                return response
         return self._template_dict(form=exception)
 
+    ALERT = (d.i18n._('There was a problem with your submission'),
+             d.i18n._('Errors have been highlighted below'))
+
+    def _partial_errors(self, exception):
+        '''Return a JSON Response containing only the error messages of
+        the form in the ValidationFailure *exception* -- if the request is
+        an AJAX one from the same form structure (the browser sends the
+        ``X-Deform-Structure`` header), otherwise None, and the whole form
+        is rendered again.
+        '''
+        request = self.request
+        if not getattr(request, 'is_xhr', False):
+            return None
+        form = exception.field
+        structure = structure_fingerprint(form)
+        if structure is None or \
+                structure != request.headers.get('X-Deform-Structure'):
+            return None
+
+        def translate(msg):
+            return translator(msg, request)
+        alert = [translate(msg) for msg in self.ALERT]
+        if form.error is not None and form.error.msg is not None:
+            alert.extend(translate(msg) for msg in form.error.messages())
+        return self._json_response(dict(
+            structure=structure, alert=alert,
+            errors=error_fragments(form, translate)))
+
     def _valid(self, form, controls):
         '''This is called after form validation. You may override this method
         to change the response at the end of the view workflow.
@@ -213,22 +611,200 @@ class BaseDeformView(object):
         '''Especially in AJAX views, you may skip Deform and use just colander
         for validation, returning a dictionary of errors to be displayed
         next to the form fields.
-        TODO: Test
+
+        *controls* may be a dict or a list of (name, value) pairs; by default
+        they come from the request: if it contains JSON (see ``_is_json()``),
+        the decoded body is deserialized directly. In that case, the CSRF
+        token may also be sent in the ``X-CSRF-Token`` header, and the
+        errors are translated strings keyed by the dotted path of each node
+        with an error (the form itself being ``''``), like this::
+
+            {"errors": {"": "...", "address.street": "Required"}}
+
+        Return the appstruct, or a dict containing ``errors``.
+        '''
+        timer = self._timer
+        try:
+            with timer.phase('total'):
+                schema = self.schema_instance
+                try:
+                    with timer.phase('parse'):
+                        json_mode = controls is None and self._is_json()
+                        if json_mode:
+                            cstruct = self._json_cstruct()
+                        elif hasattr(controls, 'items'):
+                            cstruct = controls
+                        else:
+                            cstruct = parse_controls(
+                                controls or self.request.POST.items(),
+                                is_flat(schema))
+                    with timer.phase('deserialize'):
+                        appstruct = self._deserialize(schema, cstruct)
+                except c.Invalid as e:
+                    try:
+                        self._check_csrf(e, cstruct)
+                    except HTTPForbidden as forbidden:
+                        return dict(errors={'': forbidden.args[0]})
+                    if json_mode:
+                        return dict(errors=asdict2(
+                            e, lambda msg: translator(msg, self.request)))
+                    return dict(errors=e.asdict2() if hasattr(e, 'asdict2')
+                                else e.asdict())
+        finally:  # also when raising, e.g. HTTPBadRequest
+            self._report_timing()
+        # appstruct.pop('csrf_token', None)  # Discard the CSRF token
+        return appstruct
+
+    def _validate_field(self, name=None, value=None):
+        '''Validate a single node of the (bound) schema, for immediate
+        feedback while the user is filling out the form, e.g.::
+
+            @view_config(name='validate-field', xhr=True)
+            def validate_field(self):
+                return self._json_response(self._validate_field())
+
+        *name* is the dotted path of the node (for instance
+        ``address.street``) and *value* its cstruct; by default they are the
+        ``field`` and ``value`` request parameters. Return a dict like
+        ``{"field": "email", "valid": false, "error": "..."}``.
+
+        The node comes from ``self.schema_instance``, so deferred validators
+        (e.g. a DeferredDBCheck) are resolved with the same bindings as
+        for the whole form. Results are kept in
+        ``self.field_validation_cache``, if set, under the key returned by
+        ``self._validation_cache_key()``.
         '''
-        controls = controls or self.request.POST.items()
+        params = self.request.params
+        name = params.get('field', '') if name is None else name
+        value = params.get('value', '') if value is None else value
+        node = self.schema_instance
         try:
-            appstruct = self._get_schema().deserialize(controls)
-        except c.Invalid as e:
+            for part in name.split('.'):
+                node = node[part]
+        except KeyError:
+            raise HTTPBadRequest('No such field: {}'.format(name))
+
+        cache = self.field_validation_cache
+        key = None if cache is None else \
+            self._validation_cache_key(name, value)
+        messages = None if key is None else cache.get(key)
+        if messages is None:
             try:
-                self._check_csrf(controls)
-            except HTTPForbidden as e:
-                return dict(errors={'': e.args[0]})
+                node.deserialize(value)
+            except c.Invalid as e:
+                messages = tuple(asdict2(e).values())
             else:
-                return dict(errors=e.asdict2() if hasattr(e, 'asdict2')
-                    else e.asdict())
+                messages = ()
+            if key is not None:
+                cache.set(key, messages)
+        return dict(field=name, valid=not messages, error='; '.join(
+            translator(msg, self.request) for msg in messages) or None)
+
+    def _validation_cache_key(self, name, value):
+        '''Return the key of the result of ``_validate_field(name, value)``
+        in ``self.field_validation_cache``, or None not to cache it: the
+        schema class, the path of the field, the value stripped and
+        casefolded (override ``_normalize_value()`` if case matters) and
+        the bindings other than the request and the db session, which must
+        be hashable. Override this if the result depends on anything else.
+        '''
+        bindings = tuple(sorted(
+            (k, v) for k, v in self._bindings().items()
+            if k not in ('request', 'db')))
+        key = (self.schema, name, self._normalize_value(value), bindings)
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def _normalize_value(self, value):
+        '''Return *value* as it is compared by ``_validation_cache_key()``.
+        '''
+        if not hasattr(value, 'strip'):
+            return value
+        value = value.strip()
+        return value.casefold() if hasattr(value, 'casefold') \
+            else value.lower()
+
+    def _is_json(self):
+        '''Return whether the request body is JSON.'''
+        content_type = getattr(self.request, 'content_type', None) or ''
+        return content_type == 'application/json' or \
+            content_type.endswith('+json')
+
+    def _json_cstruct(self):
+        '''Decode the JSON request body with ``self.json_loads``.
+        It must be an object, as the schema is a mapping.
+        '''
+        try:
+            cstruct = self.json_loads(self.request.body)
+        except ValueError:
+            raise HTTPBadRequest('The request body is not valid JSON.')
+        if not isinstance(cstruct, dict):
+            raise HTTPBadRequest('The request body is not a JSON object.')
+        token = self.request.headers.get('X-CSRF-Token')
+        if token:
+            cstruct.setdefault('csrf_token', token)
+        return cstruct
+
+    def _json_response(self, payload, status=200):
+        '''Return a Response containing *payload* encoded with
+        ``self.json_dumps``. E.g. in a view::
+
+            result = self._colander_workflow()
+            if 'errors' in result:
+                return self._json_response(result, status=400)
+        '''
+        body = self.json_dumps(payload)
+        if not isinstance(body, bytes):
+            body = body.encode('utf-8')
+        return Response(body=body, status=status,
+                        content_type='application/json', charset='utf-8')
+
+    def _validate_form(self, form, controls):
+        '''Return ``form.validate_pstruct(controls)``. If ``self.db`` is
+        set, the DBUniqueCheck validations that use it are resolved in a
+        single query (see :class:`~..schemaker.UniqueCheckBatch`).
+        '''
+        if self.db is None:
+            return form.validate_pstruct(controls)
+        from ..schemaker import UniqueCheckBatch  # needs SQLAlchemy
+        batch = UniqueCheckBatch(self.db, form.schema)
+        failure = None
+        with batch:
+            try:
+                appstruct = form.validate_pstruct(controls)
+            except d.ValidationFailure as e:
+                failure = e
+        failed = batch.resolve()
+        if failed:
+            error = batch.add_failures(failure and failure.error,
+                                       form.schema, failed)
+            form.widget.handle_error(form, error)
+            raise d.ValidationFailure(form, form.cstruct, error)
+        if failure is not None:
+            raise failure
+        return appstruct
+
+    def _deserialize(self, schema, cstruct):
+        '''Deserialize *cstruct* using *schema*, through a compiled function
+        if ``self.compiled_deserializer`` is true. If ``self.db`` is set,
+        the DBUniqueCheck validations that use it are resolved in a single
+        query (see :class:`~..schemaker.UniqueCheckBatch`).
+        '''
+        if self.compiled_deserializer:
+            compiled = get_compiled(schema)
+
+            def deserialize(cstruct):
+                return compiled.deserialize(cstruct, schema)
         else:
-            # appstruct.pop('csrf_token', None)  # Discard the CSRF token
-            return appstruct
+            deserialize = schema.deserialize
+        if self.db is None:
+            return deserialize(cstruct)
+        from ..schemaker import UniqueCheckBatch  # needs SQLAlchemy
+        return UniqueCheckBatch(self.db).validate(schema, cstruct,
+                                                  deserialize)
 
 
 class ModalDeformView(BaseDeformView):
@@ -252,7 +828,7 @@ class ModalDeformView(BaseDeformView):
         if isinstance(result, Response):
             return result
         else:
-            return Response(body=result['form'])
+            return self._form_response(result['form'])
 
 
 # modal_renderer is for rendering a form as a bootstrap modal dialog
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+
+'''Utilities for the Chameleon renderers used by deform.'''
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+from collections import OrderedDict
+from hashlib import sha1
+import os
+import re
+import tempfile
+from uuid import uuid4
+from chameleon.loader import ModuleLoader
+from deform.widget import SequenceWidget
+
+
+def set_template_cache(renderers, cache_dir=None):
+    '''Make the deform *renderers* (instances of
+    :class:`deform.template.ZPTRendererFactory`) keep compiled templates
+    as Python modules. Call this before they load any template.
+
+    Templates compiled from the same file then share their code, even
+    when loaded by different renderers (e.g. the default deform renderer
+    and the modal renderer). If *cache_dir* is given, the modules are kept
+    there -- and their bytecode too -- so they survive restarts and can be
+    shared by all processes; otherwise a temporary directory is used.
+    Other Chameleon templates (e.g. those of pyramid_chameleon) keep
+    their own loader.
+    '''
+    if cache_dir:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        loader = ModuleLoader(os.path.abspath(cache_dir))
+    else:
+        loader = ModuleLoader(tempfile.mkdtemp(), True)
+    for renderer in renderers:
+        # Passed on to each template, where it overrides BaseTemplate.loader
+        renderer.loader.kwargs['loader'] = loader
+    return loader
+
+
+def template_names(search_path):
+    '''Generate the names of all the .pt templates found in the directories
+    of *search_path*, relative to their directory, without repetition.
+    '''
+    seen = set()
+    for directory in search_path:
+        for root, dirs, files in os.walk(directory):
+            dirs.sort()
+            for filename in sorted(files):
+                if not filename.endswith('.pt'):
+                    continue
+                path = os.path.join(root, filename)
+                name = os.path.relpath(path, directory).replace(os.sep, '/')
+                if name not in seen:
+                    seen.add(name)
+                    yield name
+
+
+def warm_templates(*renderers):
+    '''Load and compile, in each of the deform *renderers* (instances of
+    :class:`deform.template.ZPTRendererFactory`), every template that it
+    can find in its search path. Return the number of templates compiled.
+
+    This way a new process does not have to compile them on first use,
+    which makes for slow first requests after every deploy.
+    '''
+    compiled = 0
+    for renderer in renderers:
+        for name in template_names(renderer.loader.search_path):
+            renderer.load(name).cook_check()
+            compiled += 1
+    return compiled
+
+
+class StreamingForm(object):
+    '''Renders a deform form (or the field of a ValidationFailure) one
+    chunk at a time: first the form tag and header, then each top-level
+    child, then the buttons and the rest. Children that are sequences are
+    themselves split, one chunk per item. Iterate over it to get the chunks,
+    e.g. to build a streaming response::
+
+        Response(app_iter=StreamingForm(form).encoded())
+
+    A form made of hundreds of repeated mappings is thus never held in
+    memory as a single string. When you need the whole HTML (e.g. to embed
+    the form in a page template), use ``str()`` or the ``__html__()`` method.
+
+    *cstruct* defaults to the cstruct of the field; *kw* is passed on to
+    the form widget, as in ``Form.render(**kw)``.
+    '''
+    def __init__(self, field, cstruct=None, **kw):
+        self.field = field
+        self.cstruct = field.cstruct if cstruct is None else cstruct
+        self.kw = kw
+
+    def _render_shell(self, render, fields, capture):
+        '''Call ``render()`` with the renderer of *fields* replaced by
+        one that returns a marker instead of rendering the calls for which
+        ``capture(kw)`` is true. Return the marker regex, the HTML and the
+        replaced calls, as a list of (template, kw) pairs.
+        '''
+        marker = '<!--{}:%d-->'.format(uuid4().hex)
+        calls = []
+        renderer = self.field.renderer
+
+        def shell_renderer(template, **kw):
+            if capture(kw):
+                calls.append((template, kw))
+                return marker % (len(calls) - 1)
+            return renderer(template, **kw)
+
+        saved = [(field, field.renderer) for field in fields]
+        for field, _ in saved:
+            field.renderer = shell_renderer
+        try:
+            html = render()
+        finally:
+            for field, original in saved:
+                field.renderer = original
+        return re.compile(marker.replace('%d', r'(\d+)')), html, calls
+
+    def _chunks(self, render, fields, capture):
+        regex, html, calls = self._render_shell(render, fields, capture)
+        for i, piece in enumerate(regex.split(html)):
+            if i % 2:
+                template, kw = calls[int(piece)]
+                for chunk in self._render_call(template, kw):
+                    yield chunk
+            elif piece:
+                yield piece
+
+    def _render_call(self, template, kw):
+        '''Generate the rendering of a replaced call: a single chunk,
+        or one per item if the field is a sequence.
+        '''
+        field = kw.get('field')
+        renderer = self.field.renderer
+        if not isinstance(getattr(field, 'widget', None), SequenceWidget) \
+                or not field.children:
+            yield renderer(template, **kw)
+            return
+        items = set()
+
+        def capture(kw):
+            if kw.get('field') is field and 'subfields' in kw:
+                # The items are clones of field.children[0], made by the
+                # sequence widget; the prototype is a clone too, but not
+                # one of these.
+                items.update(id(sub) for _, sub in kw['subfields'])
+                return False
+            return kw.get('parent') is field and id(kw.get('field')) in items
+
+        for chunk in self._chunks(lambda: renderer(template, **kw),
+                                  [field, field.children[0]], capture):
+            yield chunk
+
+    def __iter__(self):
+        form = self.field
+        children = set(id(child) for child in form.children)
+        return self._chunks(
+            lambda: form.widget.serialize(form, self.cstruct, **self.kw),
+            [form] + list(form.children),
+            lambda kw: id(kw.get('field')) in children)
+
+    def encoded(self, encoding='utf-8'):
+        '''Generate the chunks as bytes, e.g. for a Response app_iter.'''
+        for chunk in self:
+            yield chunk.encode(encoding)
+
+    def __html__(self):
+        return ''.join(self)
+
+    __str__ = __html__
+
+
+def _fields(form):
+    '''Generate the fields of *form* in pre-order, starting with itself.'''
+    stack = [form]
+    while stack:
+        field = stack.pop()
+        yield field
+        stack.extend(reversed(field.children))
+
+
+def structure_fingerprint(form):
+    '''Return a short hash of the structure of the deform *form*: the names,
+    widgets and oids of its fields, the latter relative to the oid of the
+    form itself. Return None if the form contains sequences, whose items
+    are created in the browser.
+    '''
+    parts = []
+    for field in _fields(form):
+        if isinstance(field.widget, SequenceWidget):
+            return None
+        parts.append('{}:{}:{}'.format(field.order - form.order, field.name,
+                                       type(field.widget).__name__))
+    return sha1('|'.join(parts).encode('utf-8')).hexdigest()[:16]
+
+
+def error_fragments(form, translate=None):
+    '''Return an OrderedDict of the error messages of the fields of the
+    (validated) *form*, keyed by the oid of each field relative to the oid
+    of the form, as a string. Each value is a list of messages, translated
+    by *translate* if given.
+    '''
+    adict = OrderedDict()
+    for field in _fields(form):
+        if field is form or field.error is None or field.error.msg is None:
+            continue
+        messages = field.error.messages()
+        if translate:
+            messages = [translate(msg) for msg in messages]
+        adict[str(field.order - form.order)] = messages
+    return adict
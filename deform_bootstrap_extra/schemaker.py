@@ -6,7 +6,15 @@
 
 from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
-from sqlalchemy import func, types
+from collections import OrderedDict
+from operator import itemgetter
+from time import time
+from weakref import WeakSet
+import threading
+from sqlalchemy import (event, exists, func, inspect, literal, select,
+                        types, union_all)
+from sqlalchemy.orm import Mapper
+from sqlalchemy.sql import ClauseElement
 import colander
 import deform.widget as w
 
@@ -15,7 +23,11 @@ import deform.widget as w
 
 
 class DBUniqueCheck(object):
-    '''Generic colander validator to check that something is unique.'''
+    '''Generic colander validator to check that something is unique.
+
+    While a :class:`UniqueCheckBatch` for the same *db* is active, the check
+    is only registered there, to be resolved later together with the others.
+    '''
     def __init__(self, db, model_class, field, case_sensitive=True):
         self.db = db
         self.model_class = model_class
@@ -23,16 +35,161 @@ class DBUniqueCheck(object):
         self.case_sensitive = case_sensitive
 
     def __call__(self, node, value):
-        query = self.db.query(self.model_class)
-        f = self.field
-        v = value
-        if not self.case_sensitive:
-            f = func.lower(self.field)
-            v = value.lower()
-        if query.filter(f == v).scalar() is not None:
-            s = ('A %s already exists with that %s'
-                 % (self.model_class.__name__.lower(), node.name))
-            raise colander.Invalid(node, s)
+        batch = UniqueCheckBatch.current()
+        if batch is not None and batch.db is self.db and \
+                batch.register(self, node, value):
+            return
+        if self.db.query(exists().where(self.condition(value))).scalar():
+            raise colander.Invalid(node, self.message(node))
+
+    def condition(self, value):
+        '''Return the SQL expression that finds *value* in the table.'''
+        if self.case_sensitive:
+            return self.field == value
+        return func.lower(self.field) == value.lower()
+
+    def message(self, node):
+        return ('A %s already exists with that %s'
+                % (self.model_class.__name__.lower(), node.name))
+
+
+class UniqueCheckBatch(object):
+    '''Resolves all the DBUniqueCheck validations of a deserialization
+    in a single database round trip. Example::
+
+        batch = UniqueCheckBatch(db)
+        appstruct = batch.validate(schema, cstruct)
+
+    While the batch is active (inside ``validate()`` or a ``with`` block,
+    after which you call ``resolve()`` yourself), each DBUniqueCheck that
+    uses the same *db* only registers its value. Then one
+    ``SELECT EXISTS (...) UNION ALL SELECT EXISTS (...)`` query finds the
+    values that already exist, and the errors are raised on the right
+    nodes, together with any other errors from the deserialization.
+
+    Nodes inside sequences cannot be told apart, so checks on them are
+    still performed immediately. Pass the *schema* if you use the batch
+    in a ``with`` block.
+
+    BaseDeformView uses a batch whenever its ``db`` is set.
+    '''
+    _local = threading.local()
+
+    def __init__(self, db, schema=None):
+        self.db = db
+        self.pending = []
+        self.paths = None if schema is None else _mapping_paths(schema)
+
+    @classmethod
+    def current(cls):
+        '''Return the innermost active batch in this thread, or None.'''
+        stack = getattr(cls._local, 'stack', None)
+        return stack[-1] if stack else None
+
+    def __enter__(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        self._local.stack.append(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        self._local.stack.remove(self)
+
+    def register(self, check, node, value):
+        '''Store a check for later. Return False if it cannot be batched.'''
+        if self.paths is not None and id(node) not in self.paths:
+            return False
+        self.pending.append((check, node, value))
+        return True
+
+    def resolve(self):
+        '''Run the pending checks in one query; return the failed ones
+        as a list of (check, node, value) tuples.
+        '''
+        pending, self.pending = self.pending, []
+        conditions = OrderedDict()  # identical checks share a SELECT
+        for check, node, value in pending:
+            key = _check_key(check, value)
+            if key not in conditions:
+                conditions[key] = (len(conditions), check.condition(value))
+        if not conditions:
+            return []
+        selects = [select(literal(index).label('idx'),
+                          exists().where(condition).label('found'))
+                   for index, condition in conditions.values()]
+        query = selects[0] if len(selects) == 1 else union_all(*selects)
+        found = set(row[0] for row in self.db.execute(query) if row[1])
+        return [(check, node, value) for check, node, value in pending
+                if conditions[_check_key(check, value)][0] in found]
+
+    def add_failures(self, error, schema, failed):
+        '''Put the messages of the *failed* checks (as returned by
+        ``resolve()``) in *error*, the Invalid of *schema* -- created if
+        None -- and return it.
+        '''
+        for check, node, value in failed:
+            if error is None:
+                error = colander.Invalid(schema)
+            _add_error(error, self.paths[id(node)], check.message(node))
+        return error
+
+    def validate(self, schema, cstruct, deserialize=None):
+        '''Deserialize *cstruct* with *schema* -- or with *deserialize*,
+        e.g. a compiled deserializer -- batching the unique checks.
+        Return the appstruct or raise :class:`colander.Invalid`.
+        '''
+        self.paths = _mapping_paths(schema)
+        error = None
+        with self:
+            try:
+                appstruct = (deserialize or schema.deserialize)(cstruct)
+            except colander.Invalid as e:
+                error = e
+        error = self.add_failures(error, schema, self.resolve())
+        if error is not None:
+            raise error
+        return appstruct
+
+
+def _check_key(check, value):
+    '''Identical lookups are only queried once.'''
+    return (id(check.field), check.case_sensitive,
+            value if check.case_sensitive else value.lower())
+
+
+def _mapping_paths(schema):
+    '''Map id(node) to its path, a list of (node, position) pairs, for
+    every node reachable from *schema* through mappings only.
+    '''
+    paths = {id(schema): []}
+    stack = [schema]
+    while stack:
+        parent = stack.pop()
+        if not isinstance(parent.typ, colander.Mapping):
+            continue
+        for pos, child in enumerate(parent.children):
+            paths[id(child)] = paths[id(parent)] + [(child, pos)]
+            stack.append(child)
+    return paths
+
+
+def _add_error(error, path, msg):
+    '''Put *msg* on the node at the end of *path* within the *error* tree,
+    creating the intermediate Invalid instances as necessary.
+    '''
+    for node, pos in path:
+        for child in error.children:
+            if child.node is node:
+                error = child
+                break
+        else:
+            child = colander.Invalid(node)
+            error.add(child, pos)
+            error = child
+    if error.msg is None:
+        error.msg = msg
+    else:
+        error.msg = list(error.messages()) + [msg]
 
 
 class DeferredDBCheck(colander.deferred):
@@ -48,23 +205,139 @@ class DeferredDBCheck(colander.deferred):
 class DeferredAll(colander.deferred):
     def __init__(self, *validators):
         self.validators = list(validators)
+        self._all = None  # reused while none of the validators is deferred
 
     def __call__(self, node, kwargs):
+        cached = self._all
+        if cached is not None and list(cached.validators) == self.validators:
+            return cached
+        if not any(isinstance(x, colander.deferred)
+                   for x in self.validators):
+            self._all = colander.All(*self.validators)
+            return self._all
         full = []
         for x in self.validators:
             if isinstance(x, colander.deferred):
-                full.append(x(node, kwargs))
-            else:
+                x = x(node, kwargs)
+            if x is not None:  # a deferred may resolve to no validator
                 full.append(x)
         return colander.All(*full)
 
 
+class ChoiceCache(object):
+    '''Cache of the choice lists of foreign key fields, i.e. the (key,
+    label) rows of lookup tables, kept for *ttl* seconds. Each list is
+    identified by its target table, key column, label column and filter
+    (by its SQL and parameters, so an equal filter built anew shares the
+    list). At most *maxsize* lists are kept; the oldest go first.
+
+    Call ``invalidate(table)`` after changing a lookup table (*table* may
+    also be the mapped class), or ``clear()``.
+    '''
+    def __init__(self, ttl=300, maxsize=1000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = self.misses = 0
+        self._entries = OrderedDict()  # key -> (time loaded, rows, keys)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(column, label, where=None):
+        '''Return the cache key of a choice list.'''
+        return (column.table.fullname, column.key, label.key,
+                _fingerprint(where))
+
+    def get_many(self, db, sources):
+        '''Return a dict mapping the key of each of *sources* -- (key,
+        key column, label column, filter) tuples -- to its (rows, key set),
+        loading in one pass all those that are missing or expired.
+        '''
+        now = time()
+        result = {}
+        with self._lock:
+            for source in sources:
+                entry = self._entries.get(source[0])
+                if entry is not None and entry[0] + self.ttl >= now:
+                    result[source[0]] = entry[1:]
+                    self.hits += 1
+            stale = [source for source in sources if source[0] not in result]
+            self.misses += len(stale)
+        for key, column, label, where in stale:
+            query = select(column, label).order_by(label, column)
+            if where is not None:
+                query = query.where(where)
+            rows = [tuple(row) for row in db.execute(query)]
+            result[key] = (rows, frozenset(row[0] for row in rows))
+            with self._lock:
+                self._entries.pop(key, None)
+                while len(self._entries) >= self.maxsize:
+                    self._entries.popitem(last=False)
+                self._entries[key] = (now,) + result[key]
+        return result
+
+    def invalidate(self, table=None):
+        '''Drop the choice lists of one table, or all of them.'''
+        table = getattr(table, '__table__', table)
+        with self._lock:
+            if table is None:
+                self._entries.clear()
+            else:
+                for key in [k for k in self._entries
+                            if k[0] == table.fullname]:
+                    del self._entries[key]
+
+    clear = invalidate
+
+
+class ForeignKeyChoices(object):
+    '''The choices of a foreign key field: provides a deferred
+    SelectWidget and a deferred OneOf validator, both resolved when
+    the schema is bound with a ``db`` keyword, e.g.
+    ``schema.bind(db=session)``, from a ChoiceCache. Bound without
+    ``db``, they resolve to *fallback_widget* and to no validator.
+
+    ``group`` lists the ForeignKeyChoices of the whole schema, so binding
+    it loads all of their stale choice lists in one pass.
+    '''
+    def __init__(self, cache, column, label, where=None,
+                 null_label='- Select -', fallback_widget=None):
+        self.cache = cache
+        self.key = cache.key(column, label, where)
+        self.source = (self.key, column, label, where)
+        self.null_label = null_label
+        self.fallback_widget = fallback_widget
+        self.group = [self]
+        self.widget = colander.deferred(self._widget)
+        self.validator = colander.deferred(self._validator)
+
+    def load(self, db):
+        '''Return the (rows, key set) of this field.'''
+        sources = [choices.source for choices in self.group]
+        return self.cache.get_many(db, sources)[self.key]
+
+    def _widget(self, node, kw):
+        if 'db' not in kw:
+            return self.fallback_widget
+        rows = self.load(kw['db'])[0]
+        return w.SelectWidget(values=[('', self.null_label)] + [
+            ('{}'.format(key), label) for key, label in rows])
+
+    def _validator(self, node, kw):
+        if 'db' not in kw:
+            return None
+        return colander.OneOf(self.load(kw['db'])[1])
+
+
 def string_widget(prop, col, col_type, kw):
     '''Strategy for generating a widget for String types.'''
     maxlength = kw.pop('maxlength', None) or getattr(col_type, 'length', None)
     size = kw.pop('size', None)
     if size is None:  # If necessary, calculate a default size for the input
-        size = int(maxlength if maxlength <= 35 else 35 + (maxlength - 35) / 4)
+        if maxlength is None:
+            size = 60
+        else:
+            size = int(maxlength if maxlength <= 35
+                       else 35 + (maxlength - 35) / 4)
         if size > 60:
             size = 60
     return w.TextInputWidget(size=size, maxlength=maxlength,
@@ -73,11 +346,116 @@ def string_widget(prop, col, col_type, kw):
     )
 
 
+def text_widget(prop, col, col_type, kw):
+    '''Strategy for generating a widget for Text types.'''
+    return w.TextAreaWidget(rows=kw.pop('rows', 5), cols=kw.pop('cols', 60),
+                            placeholder=kw.pop('placeholder', None))
+
+
 def enum_widget(prop, col, col_type, kw):
     choices = [(x, x.title()) for x in col_type.enums]
     return w.RadioChoiceWidget(values=choices)
 
 
+class DispatchMap(dict):
+    '''A dict from SQLAlchemy type classes to strategies, which also
+    finds the strategy for subclasses of its keys by walking their MRO.
+    The results of ``resolve()`` are cached per concrete class; the cache,
+    and the schema cache of the *owner* Schemaker, are cleared whenever
+    the map changes.
+    '''
+    def __init__(self, owner, *a, **kw):
+        super(DispatchMap, self).__init__(*a, **kw)
+        self.owner = owner
+        self._resolved = {}
+
+    def resolve(self, cls):
+        '''Return the strategy for *cls* or its closest ancestor, or None.'''
+        try:
+            return self._resolved[cls]
+        except KeyError:
+            strategy = None
+            for klass in cls.__mro__:
+                strategy = self.get(klass)
+                if strategy is not None:
+                    break
+            self._resolved[cls] = strategy
+            return strategy
+
+    def changed(self):
+        self._resolved.clear()
+        self.owner.clear_cache()
+
+    def _mutator(method):
+        def mutate(self, *a, **kw):
+            try:
+                return method(self, *a, **kw)
+            finally:
+                self.changed()
+        mutate.__name__ = method.__name__
+        return mutate
+
+    __setitem__ = _mutator(dict.__setitem__)
+    __delitem__ = _mutator(dict.__delitem__)
+    clear = _mutator(dict.clear)
+    pop = _mutator(dict.pop)
+    popitem = _mutator(dict.popitem)
+    setdefault = _mutator(dict.setdefault)
+    update = _mutator(dict.update)
+    del _mutator
+
+
+class _Identity(object):
+    '''Cache key component for unhashable values: compares by identity
+    and keeps the object alive while the cache entry exists.
+    '''
+    __slots__ = ('obj',)
+
+    def __init__(self, obj):
+        self.obj = obj
+
+    def __hash__(self):
+        return id(self.obj)
+
+    def __eq__(self, other):
+        return isinstance(other, _Identity) and other.obj is self.obj
+
+
+def _fingerprint(value):
+    '''Turn a (possibly nested) overrides structure into a hashable key.
+    SQL expressions (e.g. a ``choices_filter``) are equal if their SQL and
+    parameters are, not only if they are the same object.
+    '''
+    if isinstance(value, ClauseElement):
+        compiled = value.compile()
+        return ('{}'.format(compiled), tuple(sorted(
+            (k, _fingerprint(v)) for k, v in compiled.params.items())))
+    if isinstance(value, dict):
+        return tuple(sorted(((k, _fingerprint(v)) for k, v in value.items()),
+                            key=itemgetter(0)))
+    if isinstance(value, (list, tuple)):
+        return (type(value).__name__,) + tuple(
+            _fingerprint(v) for v in value)
+    try:
+        hash(value)
+    except TypeError:
+        return _Identity(value)
+    return value
+
+
+# Every Schemaker is registered here so its schema cache can be dropped
+# when SQLAlchemy (re)configures mappers.
+_schemakers = WeakSet()
+
+
+def _on_mappers_configured():
+    for schemaker in list(_schemakers):
+        schemaker.clear_cache()
+
+
+event.listen(Mapper, 'after_configured', _on_mappers_configured)
+
+
 class Schemaker(object):
     '''Configurable translator that creates a :class:`colander.SchemaNode`
         from a :class:`sqlalchemy.orm.properties.ColumnProperty`.
@@ -90,12 +468,37 @@ class Schemaker(object):
         a 2-tuple containing a colander type and a list of validators.
 
         Also after instantiation you can manipulate the widget_strategies map.
-        It maps from colander types to callbacks that return a widget instance.
+        It maps from SQLAlchemy types to callbacks that return a widget
+        instance.
+
+        Both maps are :class:`DispatchMap` instances: a column type that is
+        not a key is looked up through its MRO, so e.g. ``BigInteger`` is
+        handled as an ``Integer``. The lookups are cached per type class;
+        changing (or replacing) a map clears the caches.
+
+        If ``foreign_key_choices`` is true, foreign key columns get a
+        SelectWidget with the rows of the referenced table, and a OneOf
+        validator, both deferred: bind the schema with ``db=session``
+        (without it, they get the usual widget and no such validator).
+        The labels come from the column named by the ``label_column``
+        keyword (or *info* key), by default the first string column of
+        that table; ``choices_filter`` may restrict the rows with a SQL
+        expression. The choice lists are cached in
+        ``choice_cache`` (see :class:`ChoiceCache`).
 
         Finally, use the configured object, by calling it multiple times to
-        translate each SQLAlchemy model property into a colander SchemaNode.
+        translate each SQLAlchemy model property into a colander SchemaNode,
+        or call ``schema_for()`` to get a whole MappingSchema for a model.
+        Whole schemas are cached (up to ``cache_size`` of them), so call
+        ``clear_cache()`` if you change the maps after using the object.
         '''
+    cache_size = 1024
+    foreign_key_choices = False
+
     def __init__(self):
+        self._schema_cache = OrderedDict()
+        self.choice_cache = ChoiceCache()
+        _schemakers.add(self)
         self.type_map = {
             types.Boolean: lambda x: (colander.Boolean(), []),
             types.Date: lambda x: (colander.Date(), []),
@@ -113,23 +516,59 @@ class Schemaker(object):
         self.widget_strategies = {
             types.String: string_widget,
             types.Unicode: string_widget,
+            types.Text: text_widget,
             types.Enum: enum_widget,
         }
 
+    @property
+    def type_map(self):
+        return self._type_map
+
+    @type_map.setter
+    def type_map(self, adict):
+        self._type_map = DispatchMap(self, adict)
+        self.clear_cache()
+
+    @property
+    def widget_strategies(self):
+        return self._widget_strategies
+
+    @widget_strategies.setter
+    def widget_strategies(self, adict):
+        self._widget_strategies = DispatchMap(self, adict)
+        self.clear_cache()
+
     def get_type(self, column, column_type, kw):
         '''Get typ from kw or look up the type_map; also set validators.'''
         try:
             typ = kw.pop('typ')
         except KeyError:
-            try:
-                typ, validators = self.type_map[column_type.__class__](column)
-            except KeyError:
+            strategy = self.type_map.resolve(column_type.__class__)
+            if strategy is None:
                 raise NotImplementedError(
                     'Unknown type: {}'.format(column_type))
+            typ, validators = strategy(column)
         else:
-            validators = kw.pop('validators', [])
+            validators = list(kw.pop('validators', []))
         return typ, validators
 
+    def get_choices(self, column, kw):
+        '''Return a ForeignKeyChoices if *column* is a foreign key.'''
+        label = kw.pop('label_column', None)
+        where = kw.pop('choices_filter', None)
+        if not self.foreign_key_choices or not column.foreign_keys:
+            return None
+        target = next(iter(column.foreign_keys)).column
+        if label is None:
+            label = next((col for col in target.table.columns
+                          if isinstance(col.type, types.String) and
+                          not col.primary_key), target)
+        elif hasattr(label, 'property'):  # e.g. Country.name
+            label = label.property.columns[0]
+        elif not hasattr(label, 'table'):  # a column name
+            label = target.table.columns[label]
+        return ForeignKeyChoices(self.choice_cache, target, label, where)
+
     def get_label(self, prop):
         return prop.key.replace('_', ' ').capitalize()
 
@@ -192,6 +631,10 @@ class Schemaker(object):
         col_type = getattr(column.type, 'impl', column.type)
         # Obtain the colander type and an initial list of validators
         typ, validators = self.get_type(column, col_type, kw)
+        choices = self.get_choices(column, kw)
+        if choices is not None:
+            validators.append(choices.validator)
+        explicit_widget = kw.get('widget')
 
         # TODO Add unique checks
         # if col.primary_key:
@@ -207,10 +650,60 @@ class Schemaker(object):
                       missing=self.get_missing(column, col_type, kw),
                       validator=self.get_validator(col_type, kw, validators),
                       widget=self.get_widget(prop, column, col_type, kw))
+        if choices is not None:
+            kwargs['fk_choices'] = choices
+            if not explicit_widget:
+                choices.fallback_widget = kwargs['widget']
+                kwargs['widget'] = choices.widget
         # kwargs.update(kw)
         # print(kwargs) # TODO Remove print
         return colander.SchemaNode(typ, **kwargs)
 
+    def schema_for(self, model, includes=None, excludes=None,
+                   overrides=None):
+        '''Return a :class:`colander.MappingSchema` containing one node
+        per column property of the mapped class *model*.
+
+        *includes* is an optional sequence of property names; it restricts
+        the schema to those properties, in that order. *excludes* is an
+        optional sequence of property names to leave out.
+        *overrides* is an optional dict mapping a property name to a dict
+        of keyword arguments for ``__call__()``.
+
+        The schema is built only once per (mapper, columns, overrides)
+        combination; later calls return a clone of the cached schema,
+        so you may mutate what you get.
+        '''
+        mapper = inspect(model)
+        props = OrderedDict((p.key, p) for p in mapper.column_attrs)
+        keys = tuple(includes) if includes is not None else tuple(props)
+        if excludes:
+            keys = tuple(k for k in keys if k not in excludes)
+        overrides = overrides or {}
+        cache_key = (mapper, keys, _fingerprint(overrides))
+        try:
+            schema = self._schema_cache.pop(cache_key)
+        except KeyError:
+            schema = colander.MappingSchema()
+            for key in keys:
+                if key not in props:
+                    raise KeyError('{} has no column property "{}"'.format(
+                        mapper.class_.__name__, key))
+                schema.add(self(getattr(mapper.class_, key),
+                                **overrides.get(key, {})))
+            group = [node.fk_choices for node in schema.children
+                     if getattr(node, 'fk_choices', None) is not None]
+            for choices in group:
+                choices.group = group
+            while len(self._schema_cache) >= self.cache_size:
+                self._schema_cache.popitem(last=False)
+        self._schema_cache[cache_key] = schema  # most recently used
+        return schema.clone()
+
+    def clear_cache(self):
+        '''Forget the schemas built by ``schema_for()``.'''
+        self._schema_cache.clear()
+
     def get_validator(self, col_type, kw, validators):
         maxlength = kw.get('maxlength') or getattr(col_type, 'length', None)
         if maxlength:
@@ -222,6 +715,8 @@ class Schemaker(object):
             return None
         elif len(validators) == 1:
             return validators[0]
+        elif any(isinstance(x, colander.deferred) for x in validators):
+            return DeferredAll(*validators)
         else:
             return colander.All(*validators)
 
@@ -232,7 +727,7 @@ class Schemaker(object):
         '''
         widget = kw.pop('widget', None)
         if not widget:
-            widget_maker = self.widget_strategies.get(col_type.__class__)
+            widget_maker = self.widget_strategies.resolve(col_type.__class__)
             if widget_maker:
                 widget = widget_maker(prop, column, col_type, kw)
         return widget
@@ -63,11 +63,197 @@ var xaja = {  // Make AJAX requests without worrying about errors
         $(dom).load(url, function () {
             $(dom).modal('show');
             xaja.busy(false);
+            xaja.enforceConstraints($(dom).find('form'));
         });
+    },
+    constraintMessages: {
+        required: "Required",
+        minlength: "Shorter than minimum length [0]",
+        maxlength: "Longer than maximum length [0]",
+        min: "[0] is less than minimum value [1]",
+        max: "[0] is greater than maximum value [1]",
+        pattern: "String does not match expected pattern",
+        email: "Invalid email address",
+        choices: "\"[0]\" is not one of [1]"
+    },
+    checkConstraints: function (value, c) {
+        // Return an error message if *value* violates the constraints *c*
+        // (an entry of the manifest made by deform_bootstrap_extra), or null.
+        // The (translated) messages of the manifest take precedence over
+        // the English defaults in xaja.constraintMessages.
+        var m = $.extend({}, xaja.constraintMessages, c.messages),
+            number, comparable;
+        if (value === '') {
+            return c.required ? m.required : null;
+        }
+        if (c.minlength && value.length < c.minlength) {
+            return m.minlength.interpol(c.minlength);
+        }
+        if (c.maxlength && value.length > c.maxlength) {
+            return m.maxlength.interpol(c.maxlength);
+        }
+        if (c.pattern && !new RegExp('^(?:' + c.pattern + ')$').test(value)) {
+            return m.pattern;
+        }
+        if (c.email && !/^[^@\s]+@[^@\s]+\.[^@\s]+$/.test(value)) {
+            return m.email;
+        }
+        if (c.choices && $.inArray(value, $.map(c.choices, String)) === -1) {
+            return m.choices.interpol(value, c.choices.join(', '));
+        }
+        number = parseFloat(value);
+        // Numbers are compared as numbers, dates and times as ISO strings
+        comparable = function (limit) {
+            return typeof limit === 'number' ? number : value;
+        };
+        if (c.min !== undefined && comparable(c.min) < c.min) {
+            return m.min.interpol(value, c.min);
+        }
+        if (c.max !== undefined && comparable(c.max) > c.max) {
+            return m.max.interpol(value, c.max);
+        }
+        return null;
+    },
+    enforceConstraints: function (forms) {
+        // Validate deform forms against their constraint manifest before
+        // they are submitted. Errors are shown as in deform_bootstrap.
+        $(forms).each(function () {
+            var form = this,
+                script = $(form).find('script.deform-constraints'),
+                manifest;
+            if (!script.length || form.xajaConstraints) { return; }
+            manifest = form.xajaConstraints = $.parseJSON(script.text());
+            // Capture, so we run before the handlers of ajaxForm() etc.
+            form.addEventListener('submit', function (e) {
+                var valid = true;
+                $(form).find('.constraint-error').remove();
+                $.each(manifest, function (oid, c) {
+                    var input = $('#' + oid), value, msg, group;
+                    if (!input.length || input.is(':disabled')) { return; }
+                    if (input.is(':checkbox')) {
+                        value = input.is(':checked') ? input.val() : '';
+                    } else {
+                        value = $.trim(input.val() || '');
+                    }
+                    msg = xaja.checkConstraints(value, c);
+                    group = input.closest('.control-group');
+                    if (msg) {
+                        valid = false;
+                        group.addClass('error');
+                        $('<span class="help-inline constraint-error"/>')
+                            .text(msg).insertAfter(input);
+                    } else {
+                        group.removeClass('error');
+                    }
+                });
+                if (!valid) {
+                    e.preventDefault();
+                    e.stopImmediatePropagation();
+                }
+            }, true);
+        });
+    },
+    partialErrorOptions: function (formid, options) {
+        // Change the ajaxForm() *options* of a deform form rendered with
+        // partial_errors, so invalid submissions only get the errors back.
+        var form = $('#' + formid),
+            structure = form.attr('data-deform-structure');
+        if (!structure) { return options; }
+        return $.extend({}, options, {
+            target: null,
+            headers: {'X-Deform-Structure': structure},
+            success: function (data, status, xhr) {
+                if (data && data.structure === structure) {
+                    xaja.patchErrors($('#' + formid), data);
+                } else {  // the whole form, rendered again
+                    $('#' + formid).replaceWith(data);
+                    if (options.success) { options.success(data, status, xhr); }
+                }
+            }
+        });
+    },
+    patchErrors: function (form, data) {
+        // Replace the error messages in the deform *form* with those in
+        // *data*, the response of BaseDeformView._partial_errors().
+        var base = parseInt(form.attr('data-deform-oid')
+                            .replace('deformField', ''), 10),
+            alert;
+        form.find('.control-group.error').removeClass('error');
+        form.find('[id^="error-deformField"]').closest('.help-block').remove();
+        form.find('.alert-error').remove();
+        $.each(data.errors, function (offset, messages) {
+            var oid = 'deformField' + (base + parseInt(offset, 10)),
+                block = $('<span class="help-block"/>');
+            $.each(messages, function (i, msg) {
+                $('<span class="error"/>').text(msg)
+                    .attr('id', 'error-' + oid + (i ? '-' + i : ''))
+                    .appendTo(block);
+            });
+            $('#item-' + oid).addClass('error')
+                .find('.controls').first().append(block);
+        });
+        if (data.alert && data.alert.length) {
+            alert = $('<div class="alert alert-block alert-error"/>');
+            $('<span class="errorMsgLbl"/>').text(data.alert[0])
+                .appendTo(alert);
+            $.each(data.alert.slice(1), function (i, msg) {
+                $('<p class="errorMsg"/>').text(msg).appendTo(alert);
+            });
+            form.find('fieldset, .modal-body').first().prepend(alert);
+        }
+        form.find('.control-group.error :input').first().focus();
+    },
+    validateOnInput: function (inputs, url, delay) {
+        // While the user types into *inputs*, validate each of them
+        // through the BaseDeformView._validate_field() view at *url*, at most
+        // once every *delay* milliseconds. A request that is still running
+        // is aborted when a new one is sent for the same input.
+        $(inputs).each(function () {
+            var input = $(this), timer = null, pending = null, last = null,
+                field = input.data('field') || input.attr('name');
+            input.on('input change', function () {
+                clearTimeout(timer);
+                timer = setTimeout(function () {
+                    var value = $.trim(input.val() || '');
+                    if (value === last) { return; }
+                    last = value;
+                    if (pending) { pending.abort(); }
+                    pending = $.ajax({
+                        url: url,
+                        type: 'GET',
+                        dataType: 'json',
+                        data: {field: field, value: value},
+                        global: false,
+                        beforeSend: $.noop,
+                        complete: function () { pending = null; },
+                        error: $.noop,  // including aborted requests
+                        success: function (data) {
+                            xaja.showFieldError(input, data.error);
+                        }
+                    });
+                }, delay || 300);
+            });
+        });
+    },
+    showFieldError: function (input, msg) {
+        var group = $(input).closest('.control-group');
+        group.find('.live-error').remove();
+        if (msg) {
+            group.addClass('error');
+            $('<span class="help-inline live-error"/>').text(msg)
+                .insertAfter(input);
+        } else if (!group.find('[id^="error-deformField"]').length) {
+            group.removeClass('error');
+        }
     }
 };
 
 
+$(function () {
+    xaja.enforceConstraints($('form').has('script.deform-constraints'));
+});
+
+
 $.ajaxSetup({
     beforeSend: function () { xaja.busy(true); },
     complete:   function () { xaja.busy(false); },
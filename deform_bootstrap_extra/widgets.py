@@ -13,6 +13,9 @@ class TagsWidget(w.TextInputWidget):
         Usage::
 
             widget = TagsWidget(autocomplete_url='/some/url')
+
+        For the server side of the autocompletion, see
+        :mod:`deform_bootstrap_extra.pyramid.autocomplete`.
         '''
     template = 'xoxco_tags'
     height = 'auto'
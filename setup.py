@@ -44,6 +44,6 @@ setup(name='deform_bootstrap_extra',
     include_package_data=True,
     zip_safe=False,
     install_requires=requires,
-    tests_require=requires,
+    tests_require=requires + ['WebTest'],
     test_suite="deform_bootstrap_extra.jests",
 )